@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Воспроизводимый бенчмарк WeatherAPI на записанных ответах провайдеров
+
+Запись ответов (нужна сеть и ключи API):
+    python benchmark_weather.py --record
+Воспроизведение без сети:
+    python benchmark_weather.py --latency 0.2 --error-rate 0.1 --rate-limit-rate 0.05
+"""
+import argparse
+import asyncio
+import glob
+import os
+import sys
+import tempfile
+import time
+
+# Добавляем текущую директорию в путь
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+LOCATIONS = [
+    ("Киев", 50.4501, 30.5234),
+    ("Полтава", 49.5883, 34.5514),
+    ("Лондон", 51.5074, -0.1278),
+    ("New York", 40.7128, -74.006),
+    ("Paris", 48.8566, 2.3522)
+]
+
+SEARCH_QUERIES = ["Полтава", "Киев", "Лондон", "New York", "Paris"]
+
+CONCURRENT_REQUESTS = 20
+
+
+def configure(args):
+    """Настройки читаются при импорте config, поэтому задаём их до импорта модулей бота"""
+    os.environ["PROVIDER_TRANSPORT_MODE"] = "record" if args.record else "replay"
+    os.environ["PROVIDER_CASSETTE_DIR"] = args.cassettes
+    os.environ["REPLAY_LATENCY"] = str(args.latency)
+    os.environ["REPLAY_ERROR_RATE"] = str(args.error_rate)
+    os.environ["REPLAY_RATE_LIMIT_RATE"] = str(args.rate_limit_rate)
+    os.environ["REPLAY_SEED"] = str(args.seed)
+    # Отдельная база и без дискового кэша, чтобы прогоны не влияли друг на друга
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(tempfile.gettempdir(), 'weather_bot_benchmark.db')}"
+    os.environ["PERSISTENT_CACHE_PATH"] = ""
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:benchmark")
+
+
+async def timed(title: str, coro):
+    started = time.perf_counter()
+    result = await coro
+    print(f"⏱  {title}: {(time.perf_counter() - started) * 1000:.1f} ms")
+    return result
+
+
+async def run_benchmark(args):
+    from database import init_db
+    from http_clients import http_clients
+    from provider_transport import ReplayTransport, cassette_path
+    from weather_api import weather_api
+    import httpx
+
+    await init_db()
+
+    async def forecasts():
+        return await asyncio.gather(*(
+            weather_api.get_weather_forecast(lat, lon, "ru") for _, lat, lon in LOCATIONS
+        ))
+
+    print("🌦  Прогнозы")
+    await timed("холодный кэш", forecasts())
+    await timed("тёплый кэш", forecasts())
+
+    _, lat, lon = LOCATIONS[0]
+    await weather_api.flush_cache("weather:")
+    calls_before = weather_api.upstream_calls["open_meteo"]
+    await timed(
+        f"{CONCURRENT_REQUESTS} одновременных запросов к одному городу",
+        asyncio.gather(*(weather_api.get_weather_forecast(lat, lon, "ru") for _ in range(CONCURRENT_REQUESTS)))
+    )
+    print(f"   вызовов Open-Meteo: {weather_api.upstream_calls['open_meteo'] - calls_before}, "
+          f"объединено запросов: {weather_api.coalesced_refreshes}")
+
+    print("\n🔍 Поиск городов")
+    for query in SEARCH_QUERIES:
+        results = await timed(query, weather_api.search_cities(query, limit=3))
+        print(f"   найдено: {len(results)}")
+
+    print("\n🚨 Отказ Open-Meteo")
+    if args.record:
+        # Резервный API вызывается только при сбое Open-Meteo, поэтому записываем его ответ напрямую
+        result = await timed("резервный API", weather_api._get_weather_fallback(lat, lon, "ru"))
+    else:
+        http_clients.clients["open_meteo"] = httpx.AsyncClient(transport=ReplayTransport(
+            cassette_path(args.cassettes, "open_meteo"), error_rate=1.0
+        ))
+        await weather_api.flush_cache("weather:")
+        result = await timed("прогноз через резервный API", weather_api.get_weather_forecast(lat, lon, "ru"))
+    print(f"   {'✅ резервный прогноз получен' if result else '❌ прогноза нет'}")
+
+    stats = await weather_api.get_cache_stats()
+    print("\n📊 Статистика")
+    print(f"   кэш погоды: {stats['weather']}")
+    print(f"   кэш геокодинга: {stats['geocode']}")
+    print(f"   вызовы провайдеров: {stats['upstream_calls']}, ошибки: {stats['upstream_errors']}")
+    print(f"   кассеты: {http_clients.get_cassette_stats()}")
+
+    await http_clients.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк WeatherAPI на записанных ответах")
+    parser.add_argument("--record", action="store_true", help="записать ответы реальных API")
+    parser.add_argument("--cassettes", default="cassettes", help="каталог с записями")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка каждого ответа, с")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ошибок соединения")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--seed", type=int, default=42, help="seed для внедряемых сбоев")
+    args = parser.parse_args()
+
+    # Без записей каждый запрос воспроизведения упал бы с ошибкой, и цифры ничего бы не значили
+    if not args.record and not glob.glob(os.path.join(args.cassettes, "*.json")):
+        sys.exit(f"❌ В {args.cassettes} нет записанных ответов, сначала запустите с --record")
+
+    configure(args)
+    asyncio.run(run_benchmark(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,24 +2,35 @@ import asyncio
 import logging
 from datetime import datetime, time
 from typing import Optional, Dict, Any
-import pytz
 
 from aiogram import Bot, Dispatcher, F
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import (
+    Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, InlineQuery, InlineQueryResultVenue
+)
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
 from aiogram.fsm.storage.memory import MemoryStorage
 
 from config import settings, DEFAULT_NOTIFICATION_TIME
 from database import DatabaseManager, User, init_db
 from weather_api import weather_api
+from forecast_refresher import forecast_refresher
+from nearest_city import NEAR_DISTANCE_KM, SNAP_DISTANCE_KM, nearest_city
+from popular_cities import find_popular_city
+from deadlines import deadline
+from memory_budget import PRIORITY_SESSIONS, PRIORITY_THROTTLE, estimate_size, memory_budget
 from localization import localization, get_user_language, _
-from city_timezone_mapper import format_local_time
+from city_timezone_mapper import format_local_time, get_timezone_by_coordinates
 
 logging.basicConfig(level=getattr(logging, settings.log_level.upper()))
 logger = logging.getLogger(__name__)
 
+# Inline city autocomplete
+INLINE_RESULTS_LIMIT = 10
+INLINE_CACHE_TIME = 300  # seconds Telegram may reuse an answer for the same query
+
 class BotStates(StatesGroup):
     LANGUAGE_SELECT = State()
     MAIN_MENU = State()
@@ -29,8 +40,41 @@ class BotStates(StatesGroup):
     IN_SETTINGS = State()
     VIEWING_WEATHER = State()
 
+
+class TrackedMemoryStorage(MemoryStorage):
+    """MemoryStorage that remembers when each conversation was last read or written,
+    so memory pressure evicts the least recently used ones"""
+    
+    def __init__(self):
+        super().__init__()
+        self.last_access: Dict[StorageKey, float] = {}
+    
+    def _touch(self, key: StorageKey):
+        self.last_access[key] = datetime.now().timestamp()
+    
+    async def set_state(self, key: StorageKey, state=None) -> None:
+        self._touch(key)
+        await super().set_state(key, state)
+    
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        self._touch(key)
+        return await super().get_state(key)
+    
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        self._touch(key)
+        await super().set_data(key, data)
+    
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        self._touch(key)
+        return await super().get_data(key)
+    
+    def forget(self, key: StorageKey):
+        self.storage.pop(key, None)
+        self.last_access.pop(key, None)
+
+
 bot = Bot(token=settings.telegram_bot_token)
-storage = MemoryStorage()
+storage = TrackedMemoryStorage()
 dp = Dispatcher(storage=storage)
 
 
@@ -48,6 +92,39 @@ class WeatherBot:
             'settings': 0.5,        # Settings changes
             'default': 0.5          # Default for other actions
         }
+        
+        memory_budget.register("throttle_state", self._throttle_size, self._evict_throttle_state, PRIORITY_THROTTLE)
+        memory_budget.register("fsm_storage", self._fsm_storage_size, self._evict_fsm_storage, PRIORITY_SESSIONS)
+    
+    def _throttle_size(self) -> int:
+        return estimate_size(self.user_last_action) + estimate_size(self.user_action_types)
+    
+    def _evict_throttle_state(self, bytes_to_free: int) -> int:
+        """Forget users whose throttle window has passed; they would not be throttled anyway"""
+        before = self._throttle_size()
+        cutoff = datetime.now().timestamp() - max(self.throttle_config.values())
+        for user_id in [user_id for user_id, last in self.user_last_action.items() if last < cutoff]:
+            del self.user_last_action[user_id]
+            self.user_action_types.pop(user_id, None)
+        return max(0, before - self._throttle_size())
+    
+    def _fsm_storage_size(self) -> int:
+        return estimate_size(storage.storage) + estimate_size(storage.last_access)
+    
+    def _evict_fsm_storage(self, bytes_to_free: int) -> int:
+        """Drop empty FSM records first, then the least recently used conversations"""
+        records = storage.storage
+        before = self._fsm_storage_size()
+        for key in [key for key, record in records.items() if record.state is None and not record.data]:
+            storage.forget(key)
+        
+        freed = before - self._fsm_storage_size()
+        if freed < bytes_to_free and records:
+            per_record = max(1, self._fsm_storage_size() // len(records))
+            least_recent = sorted(records, key=lambda key: storage.last_access.get(key, 0))
+            for key in least_recent[:(bytes_to_free - freed) // per_record + 1]:
+                storage.forget(key)
+        return max(0, before - self._fsm_storage_size())
     
     async def is_throttled(self, user_id: int, action_type: str = 'default') -> bool:
         now = datetime.now().timestamp()
@@ -61,6 +138,14 @@ class WeatherBot:
         self.user_action_types[user_id] = action_type
         return False
         
+    def warm_forecast(self, lat: float, lon: float):
+        """Start fetching the forecast for a newly saved city in the background"""
+        try:
+            # Match the precision the coordinates come back from the DB with
+            forecast_refresher.warm(round(float(lat), 8), round(float(lon), 8))
+        except Exception as e:
+            logger.debug(f"Forecast warm-up failed to start: {e}")
+    
     async def create_inline_keyboard(self, buttons: list) -> InlineKeyboardMarkup:
         keyboard = []
         for row in buttons:
@@ -97,7 +182,12 @@ class WeatherBot:
         buttons.append([(_("enter_city", language), "enter_custom_city")])
         buttons.append([(_("back_to_menu", language), "main_menu")])
         
-        return await self.create_inline_keyboard(buttons)
+        keyboard = await self.create_inline_keyboard(buttons)
+        # Autocomplete as the user types, answered by handle_inline_query
+        keyboard.inline_keyboard.insert(-1, [
+            InlineKeyboardButton(text=_("search_city_inline", language), switch_inline_query_current_chat="")
+        ])
+        return keyboard
     
     async def get_time_selection_keyboard(self, language: str) -> InlineKeyboardMarkup:
         buttons = localization.get_time_slots(language)
@@ -129,13 +219,8 @@ class WeatherBot:
         
         return await self.create_inline_keyboard(buttons)
     
-    async def format_weather_message(self, weather_data: Dict, city: str, language: str, city_lat: float = None, city_lon: float = None) -> str:
-        if city_lat is not None and city_lon is not None:
-            today_date, current_time = format_local_time(city_lat, city_lon)
-        else:
-            utc_now = datetime.now(pytz.UTC)
-            today_date = utc_now.strftime("%d.%m.%Y")
-            current_time = utc_now.strftime("%H:%M")
+    async def format_weather_message(self, weather_data: Dict, city: str, language: str, timezone_name: str = None) -> str:
+        today_date, current_time = format_local_time(timezone_name)
         
         clothing_advice = weather_api.get_clothing_recommendation(weather_data, language)
         
@@ -200,14 +285,8 @@ class WeatherBot:
         
         language = callback.data.split("_")[1]
         
-        timezone_map = {
-            "ru": "Europe/Kiev",
-            "uk": "Europe/Kiev",
-            "en": "Europe/London"
-        }
-        timezone = timezone_map.get(language, "Europe/London")
-        
-        user = await DatabaseManager.create_or_update_user(user_id, language=language, timezone=timezone)
+        # The timezone follows the city, not the language; it is set when the city is saved
+        user = await DatabaseManager.create_or_update_user(user_id, language=language)
         
         await DatabaseManager.log_action(user_id, "language_selected", {"language": language})
         
@@ -274,7 +353,11 @@ class WeatherBot:
             await state.set_state(BotStates.WAITING_CITY)
         elif callback.data.startswith("city_"):
             city_name = callback.data[5:]  # Remove "city_" prefix
-            await self.set_user_city(callback, city_name, language, state)
+            popular_city = find_popular_city(city_name)
+            if popular_city:
+                await self.set_popular_city(callback, popular_city, language, state)
+            else:
+                await self.set_user_city(callback, city_name, language, state)
     
     async def handle_time_selection(self, callback: CallbackQuery, state: FSMContext):
         """Handle time selection menu"""
@@ -369,14 +452,11 @@ class WeatherBot:
         
         # Toggle notifications
         new_status = not user.notifications_enabled
-        await DatabaseManager.create_or_update_user(user_id, notifications_enabled=new_status)
+        user = await DatabaseManager.create_or_update_user(user_id, notifications_enabled=new_status)
         
         # Log action
         await DatabaseManager.log_action(user_id, "notifications_toggled", {"enabled": new_status})
         
-        # Update user object
-        user.notifications_enabled = new_status
-        
         # Show updated main menu
         keyboard = await self.get_main_menu_keyboard(user, language)
         await callback.message.edit_text(
@@ -423,20 +503,20 @@ class WeatherBot:
         
         try:
             # Get weather data
-            weather_data = await weather_api.get_weather_forecast(
-                float(user.city_lat), 
-                float(user.city_lon), 
-                language
-            )
+            with deadline(settings.weather_request_deadline):
+                weather_data = await weather_api.get_weather_forecast(
+                    float(user.city_lat), 
+                    float(user.city_lon), 
+                    language
+                )
             
             if weather_data:
-                # Use city coordinates for local time
+                # Use the city's stored timezone for local time
                 message = await self.format_weather_message(
                     weather_data, 
                     user.city, 
                     language, 
-                    float(user.city_lat), 
-                    float(user.city_lon)
+                    user.timezone
                 )
                 keyboard = await self.get_weather_keyboard(language)
                 
@@ -455,25 +535,27 @@ class WeatherBot:
         user_id = callback.from_user.id
         
         # Get city coordinates
-        coordinates = await weather_api.get_city_coordinates(city_name)
+        with deadline(settings.city_search_deadline):
+            coordinates = await weather_api.get_city_coordinates(city_name)
         
         if coordinates:
             lat, lon, display_name = coordinates
             city_display = city_name if city_name in display_name else display_name.split(',')[0]
             
             # Update user
-            await DatabaseManager.create_or_update_user(
+            user = await DatabaseManager.create_or_update_user(
                 user_id, 
                 city=city_display,
                 city_lat=lat,
-                city_lon=lon
+                city_lon=lon,
+                timezone=get_timezone_by_coordinates(lat, lon)
             )
+            self.warm_forecast(lat, lon)
             
             # Log action
             await DatabaseManager.log_action(user_id, "city_set", {"city": city_display})
             
-            # Get updated user and show main menu
-            user = await DatabaseManager.get_user(user_id)
+            # Show main menu with the updated user
             keyboard = await self.get_main_menu_keyboard(user, language)
             
             await callback.message.edit_text(
@@ -485,6 +567,31 @@ class WeatherBot:
         else:
             await callback.answer(_("city_not_found", language))
     
+    async def set_popular_city(self, callback: CallbackQuery, city, language: str, state: FSMContext):
+        """Set a city from the popular-city registry: coordinates and timezone are known, no geocoding"""
+        user_id = callback.from_user.id
+        city_display = city.name(language)
+        
+        user = await DatabaseManager.create_or_update_user(
+            user_id, 
+            city=city_display,
+            city_lat=city.latitude,
+            city_lon=city.longitude,
+            timezone=city.timezone
+        )
+        self.warm_forecast(city.latitude, city.longitude)
+        
+        # Log action
+        await DatabaseManager.log_action(user_id, "city_set", {"city": city_display})
+        
+        keyboard = await self.get_main_menu_keyboard(user, language)
+        await callback.message.edit_text(
+            _("main_menu", language),
+            reply_markup=keyboard
+        )
+        await callback.answer(_("city_set", language, city=city_display))
+        await state.set_state(BotStates.MAIN_MENU)
+    
     async def set_user_time(self, callback: CallbackQuery, time_str: str, language: str, state: FSMContext):
         """Set user's notification time"""
         user_id = callback.from_user.id
@@ -495,13 +602,12 @@ class WeatherBot:
             notification_time = time(hour, minute)
             
             # Update user
-            await DatabaseManager.create_or_update_user(user_id, notification_time=notification_time)
+            user = await DatabaseManager.create_or_update_user(user_id, notification_time=notification_time)
             
             # Log action
             await DatabaseManager.log_action(user_id, "time_set", {"time": time_str})
             
-            # Get updated user and show main menu
-            user = await DatabaseManager.get_user(user_id)
+            # Show main menu with the updated user
             keyboard = await self.get_main_menu_keyboard(user, language)
             
             await callback.message.edit_text(
@@ -559,16 +665,18 @@ class WeatherBot:
             return
         
         # Get weather data with hourly forecast
-        weather_data = await weather_api.get_weather_forecast(
-            float(user.city_lat), 
-            float(user.city_lon), 
-            language,
-            days=1
-        )
+        with deadline(settings.weather_request_deadline):
+            weather_data = await weather_api.get_weather_forecast(
+                float(user.city_lat), 
+                float(user.city_lon), 
+                language,
+                days=1,
+                sections=("hourly",)
+            )
         
         if weather_data and weather_data.get("hourly_forecast"):
             # Get current time in city's local timezone (same as main weather display)
-            today_date, current_time = format_local_time(float(user.city_lat), float(user.city_lon))
+            today_date, current_time = format_local_time(user.timezone)
             current_hour = int(current_time.split(':')[0])  # Extract hour from local time
             
             message = _("hourly_title", language, date=today_date) + "\n\n"
@@ -619,12 +727,14 @@ class WeatherBot:
             return
         
         # Get weather data for 7 days
-        weather_data = await weather_api.get_weather_forecast(
-            float(user.city_lat), 
-            float(user.city_lon), 
-            language,
-            days=7
-        )
+        with deadline(settings.weather_request_deadline):
+            weather_data = await weather_api.get_weather_forecast(
+                float(user.city_lat), 
+                float(user.city_lon), 
+                language,
+                days=7,
+                sections=("daily",)
+            )
         
         if weather_data and weather_data.get("daily_forecast"):
             message = _("daily_title", language, days=7) + f" - {user.city}\n\n"
@@ -685,7 +795,8 @@ class WeatherBot:
         
         try:
             # Search for multiple cities
-            cities = await weather_api.search_cities(city_name, limit=5)
+            with deadline(settings.city_search_deadline):
+                cities = await weather_api.search_cities(city_name, limit=5)
             
             # Delete search message
             await search_msg.delete()
@@ -714,23 +825,78 @@ class WeatherBot:
             logger.error(f"Error searching for city {city_name}: {e}")
             await message.answer(_("city_not_found", language))
     
+    async def handle_location_input(self, message: Message, state: FSMContext):
+        """Handle a shared location: resolved offline to the nearest known city, no geocoding call"""
+        user_id = message.from_user.id
+        user = await DatabaseManager.get_user(user_id)
+        
+        # If user doesn't exist, create with default language
+        if not user:
+            language = message.from_user.language_code or "en"
+            user = await DatabaseManager.create_or_update_user(user_id, language=language)
+        
+        language = user.language
+        lat, lon = message.location.latitude, message.location.longitude
+        
+        timezone = None
+        if message.venue:
+            # A city picked from inline autocomplete already carries its name and coordinates
+            name = message.venue.title
+        else:
+            city = nearest_city.nearest(lat, lon)
+            if not city:
+                await message.answer(_("city_not_found", language))
+                return
+            
+            if city.distance_km <= SNAP_DISTANCE_KM:
+                name = city.name
+                lat, lon, timezone = city.latitude, city.longitude, city.timezone
+            else:
+                # A far city's name would be wrong: keep the user's coordinates and say how they relate
+                lat, lon = round(lat, 2), round(lon, 2)
+                if city.distance_km <= NEAR_DISTANCE_KM:
+                    name = _("near_city", language, city=city.name)
+                else:
+                    name = f"{abs(lat):.2f}°{'N' if lat >= 0 else 'S'} {abs(lon):.2f}°{'E' if lon >= 0 else 'W'}"
+            logger.info(f"Location of user {user_id} saved as {name}: {city.distance_km} km from {city.name} ({city.timezone})")
+        
+        await self.set_user_city_from_data(
+            message, user_id, {"readable_name": name, "lat": lat, "lon": lon, "timezone": timezone}, language, state
+        )
+    
+    async def handle_inline_query(self, inline_query: InlineQuery):
+        """City autocomplete: every keystroke is answered from local data, providers are never called"""
+        cities = weather_api.suggest_cities(inline_query.query, limit=INLINE_RESULTS_LIMIT)
+        results = [
+            InlineQueryResultVenue(
+                id=f"{city['lat']:.4f}_{city['lon']:.4f}",
+                latitude=city["lat"],
+                longitude=city["lon"],
+                title=city["display_name"].split(",")[0],
+                address=f"{city['country_emoji']} {city['display_name']}"
+            )
+            for city in cities
+        ]
+        await inline_query.answer(results, cache_time=INLINE_CACHE_TIME, is_personal=False)
+    
     async def set_user_city_from_data(self, message, user_id: int, city_data: dict, language: str, state: FSMContext):
         """Set user city from city data"""
         city_display = city_data["readable_name"].split(',')[0]  # Take just the city name
         
         # Update user
-        await DatabaseManager.create_or_update_user(
+        user = await DatabaseManager.create_or_update_user(
             user_id, 
             city=city_display,
             city_lat=city_data["lat"],
-            city_lon=city_data["lon"]
+            city_lon=city_data["lon"],
+            timezone=city_data.get("timezone") or get_timezone_by_coordinates(city_data["lat"], city_data["lon"])
         )
+        self.warm_forecast(city_data["lat"], city_data["lon"])
         
         # Log action
         await DatabaseManager.log_action(user_id, "city_set", {"city": city_display})
         
-        # Get updated user and show main menu
-        user = await DatabaseManager.get_user(user_id)
+        # Show main menu with the updated user
         keyboard = await self.get_main_menu_keyboard(user, language)
         
         await message.answer(
@@ -794,18 +960,19 @@ class WeatherBot:
             city_display = city["readable_name"].split(',')[0]  # Take just the city name
             
             # Update user
-            await DatabaseManager.create_or_update_user(
+            user = await DatabaseManager.create_or_update_user(
                 user_id, 
                 city=city_display,
                 city_lat=city["lat"],
-                city_lon=city["lon"]
+                city_lon=city["lon"],
+                timezone=get_timezone_by_coordinates(city["lat"], city["lon"])
             )
+            self.warm_forecast(city["lat"], city["lon"])
             
             # Log action
             await DatabaseManager.log_action(user_id, "city_set", {"city": city_display})
             
-            # Get updated user and show main menu
-            user = await DatabaseManager.get_user(user_id)
+            # Show main menu with the updated user
             keyboard = await self.get_main_menu_keyboard(user, language)
             
             await callback.message.edit_text(
@@ -837,13 +1004,12 @@ class WeatherBot:
                 notification_time = time(hour, minute)
                 
                 # Update user
-                await DatabaseManager.create_or_update_user(user_id, notification_time=notification_time)
+                user = await DatabaseManager.create_or_update_user(user_id, notification_time=notification_time)
                 
                 # Log action
                 await DatabaseManager.log_action(user_id, "time_set", {"time": time_str})
                 
-                # Get updated user and show main menu
-                user = await DatabaseManager.get_user(user_id)
+                # Show main menu with the updated user
                 keyboard = await self.get_main_menu_keyboard(user, language)
                 
                 await message.answer(
@@ -903,7 +1069,19 @@ class WeatherBot:
             F.data.startswith("select_city_")
         )
         
+        # Inline city autocomplete; the chosen city comes back as a venue sent via this bot
+        self.dp.inline_query.register(self.handle_inline_query)
+        self.dp.message.register(
+            self.handle_location_input, 
+            F.venue & (F.via_bot.id == self.bot.id)
+        )
+        
         # Text message handlers for states
+        self.dp.message.register(
+            self.handle_location_input, 
+            StateFilter(BotStates.WAITING_CITY),
+            F.location
+        )
         self.dp.message.register(
             self.handle_city_input, 
             StateFilter(BotStates.WAITING_CITY)
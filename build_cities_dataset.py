@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Сборка офлайн-базы городов из выгрузки GeoNames (cities15000)
+
+    python build_cities_dataset.py --download
+    python build_cities_dataset.py --input cities15000.txt --countries countryInfo.txt
+
+Данные GeoNames распространяются по лицензии CC BY 4.0.
+"""
+import argparse
+import io
+import os
+import sys
+import urllib.request
+import zipfile
+
+# Добавляем текущую директорию в путь
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from city_names import match_key, normalize_name
+from data_formats import CITIES_HEADER as HEADER, CITIES_KEY as KEY, CITIES_MAGIC as MAGIC
+from data_formats import CITIES_PLACE as PLACE, STRING_LENGTH
+
+CITIES_URL = "https://download.geonames.org/export/dump/cities15000.zip"
+COUNTRIES_URL = "https://download.geonames.org/export/dump/countryInfo.txt"
+
+# Колонки cities15000.txt
+NAME, ASCII_NAME, ALTERNATE_NAMES, LATITUDE, LONGITUDE, COUNTRY_CODE, POPULATION, TIMEZONE = 1, 2, 3, 4, 5, 8, 14, 17
+
+
+def download():
+    print(f"⬇️  Загрузка {CITIES_URL}")
+    with urllib.request.urlopen(CITIES_URL) as response:
+        archive = zipfile.ZipFile(io.BytesIO(response.read()))
+    cities = archive.read("cities15000.txt").decode("utf-8")
+    print(f"⬇️  Загрузка {COUNTRIES_URL}")
+    with urllib.request.urlopen(COUNTRIES_URL) as response:
+        countries = response.read().decode("utf-8")
+    return cities.splitlines(), countries.splitlines()
+
+
+def parse_countries(lines):
+    """ISO код -> английское название страны"""
+    names = {}
+    for line in lines:
+        if line.startswith("#") or not line.strip():
+            continue
+        columns = line.split("\t")
+        names[columns[0]] = columns[4]
+    return names
+
+
+class StringTable:
+    """Строки без повторов: u16 длина + UTF-8"""
+
+    def __init__(self):
+        self.offsets = {}
+        self.blob = bytearray()
+
+    def add(self, value: str) -> int:
+        if value not in self.offsets:
+            encoded = value.encode("utf-8")[:0xFFFF]
+            self.offsets[value] = len(self.blob)
+            self.blob += STRING_LENGTH.pack(len(encoded)) + encoded
+        return self.offsets[value]
+
+
+def build(city_lines, country_names, output: str):
+    strings = StringTable()
+    places = []
+    keys = []
+
+    for line in city_lines:
+        columns = line.rstrip("\n").split("\t")
+        if len(columns) <= TIMEZONE:
+            continue
+        index = len(places)
+        country = country_names.get(columns[COUNTRY_CODE], columns[COUNTRY_CODE])
+        places.append(PLACE.pack(
+            float(columns[LATITUDE]),
+            float(columns[LONGITUDE]),
+            int(columns[POPULATION] or 0),
+            strings.add(columns[NAME]),
+            strings.add(country),
+            strings.add(columns[TIMEZONE])
+        ))
+
+        names = [columns[NAME], columns[ASCII_NAME]] + columns[ALTERNATE_NAMES].split(",")
+        # Both the plain spelling and the transliterated/aliased key, so "Київ" and "Kiev" find Kyiv
+        for key in {normalize_name(name) for name in names if name} | {match_key(name) for name in names if name}:
+            if key:
+                keys.append((key.encode("utf-8"), index))
+
+    # Ключи сортируются по байтам UTF-8 - так же их сравнивает бинарный поиск при чтении
+    keys.sort()
+    key_records = b"".join(KEY.pack(strings.add(key.decode("utf-8")), index) for key, index in keys)
+    place_records = b"".join(places)
+
+    places_offset = HEADER.size
+    keys_offset = places_offset + len(place_records)
+    strings_offset = keys_offset + len(key_records)
+
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(places), len(keys), places_offset, keys_offset, strings_offset))
+        f.write(place_records)
+        f.write(key_records)
+        f.write(strings.blob)
+
+    size_mb = os.path.getsize(output) / 1024 / 1024
+    print(f"✅ {output}: {len(places)} городов, {len(keys)} названий, {size_mb:.1f} МБ")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сборка офлайн-базы городов из GeoNames")
+    parser.add_argument("--download", action="store_true", help="скачать свежую выгрузку GeoNames")
+    parser.add_argument("--input", help="путь к cities15000.txt")
+    parser.add_argument("--countries", help="путь к countryInfo.txt")
+    parser.add_argument("--output", default="data/cities.bin", help="куда записать базу")
+    args = parser.parse_args()
+
+    if args.download:
+        city_lines, country_lines = download()
+    elif args.input:
+        with open(args.input, encoding="utf-8") as f:
+            city_lines = f.read().splitlines()
+        country_lines = []
+        if args.countries:
+            with open(args.countries, encoding="utf-8") as f:
+                country_lines = f.read().splitlines()
+    else:
+        parser.error("укажите --download или --input")
+
+    build(city_lines, parse_countries(country_lines), args.output)
+
+
+if __name__ == "__main__":
+    main()
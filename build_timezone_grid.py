@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Сборка растровой карты часовых поясов
+
+    python build_timezone_grid.py --boundaries combined.json
+    python build_timezone_grid.py --cities cities15000.txt
+    python build_timezone_grid.py --download
+
+Точные границы берутся из выгрузки timezone-boundary-builder (GeoJSON, нужен shapely).
+Без неё каждой ячейке назначается пояс ближайшего города GeoNames
+(--download скачивает cities15000, так карта собирается при деплое).
+"""
+import argparse
+import io
+import json
+import math
+import os
+import sys
+import urllib.request
+import zipfile
+import zlib
+from array import array
+
+# Добавляем текущую директорию в путь
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from build_cities_dataset import CITIES_URL
+from data_formats import NO_ZONE, TIMEZONE_GRID_HEADER, TIMEZONE_GRID_MAGIC, ZONE_NAME_LENGTH
+from kdtree import EARTH_RADIUS_KM, KDTree, unit_vector
+
+# Колонки cities15000.txt
+LATITUDE, LONGITUDE, TIMEZONE = 4, 5, 17
+
+# Ячейки дальше этого от ближайшего города считаются морем
+MAX_CITY_DISTANCE_KM = 250.0
+
+
+class Zones:
+    """Названия поясов -> индекс в файле (с 1, 0 - нет пояса)"""
+
+    def __init__(self):
+        self.indexes = {}
+
+    def add(self, zone: str) -> int:
+        if zone not in self.indexes:
+            self.indexes[zone] = len(self.indexes) + 1
+        return self.indexes[zone]
+
+
+def grid_size(cell: float):
+    return round(180 / cell), round(360 / cell)
+
+
+def rasterize_boundaries(path: str, cell: float, zones: Zones) -> array:
+    try:
+        from shapely.geometry import Point, shape
+        from shapely.prepared import prep
+    except ImportError:
+        sys.exit("❌ Для --boundaries нужен shapely: pip install shapely")
+
+    with open(path, encoding="utf-8") as f:
+        features = json.load(f)["features"]
+
+    rows, columns = grid_size(cell)
+    cells = array("H", [NO_ZONE]) * (rows * columns)
+    for number, feature in enumerate(features, 1):
+        zone = zones.add(feature["properties"]["tzid"])
+        geometry = shape(feature["geometry"])
+        prepared = prep(geometry)
+        min_lon, min_lat, max_lon, max_lat = geometry.bounds
+        for row in range(max(0, math.floor((min_lat + 90) / cell)), min(rows, math.ceil((max_lat + 90) / cell))):
+            lat = (row + 0.5) * cell - 90
+            for column in range(max(0, math.floor((min_lon + 180) / cell)), min(columns, math.ceil((max_lon + 180) / cell))):
+                if prepared.contains(Point((column + 0.5) * cell - 180, lat)):
+                    cells[row * columns + column] = zone
+        print(f"🗺  {number}/{len(features)} {feature['properties']['tzid']}")
+    return cells
+
+
+def download_cities():
+    print(f"⬇️  Загрузка {CITIES_URL}")
+    with urllib.request.urlopen(CITIES_URL) as response:
+        archive = zipfile.ZipFile(io.BytesIO(response.read()))
+    return archive.read("cities15000.txt").decode("utf-8").splitlines()
+
+
+def rasterize_cities(lines, cell: float, zones: Zones) -> array:
+    points, city_zones = [], []
+    for line in lines:
+        columns = line.rstrip("\n").split("\t")
+        if len(columns) <= TIMEZONE or not columns[TIMEZONE]:
+            continue
+        points.append(unit_vector(float(columns[LATITUDE]), float(columns[LONGITUDE])))
+        city_zones.append(zones.add(columns[TIMEZONE]))
+    print(f"🏙  {len(points)} городов")
+
+    tree = KDTree(points)
+    # Квадрат длины хорды, соответствующей MAX_CITY_DISTANCE_KM по дуге
+    max_chord_squared = (2 * math.sin(MAX_CITY_DISTANCE_KM / EARTH_RADIUS_KM / 2)) ** 2
+
+    rows, columns = grid_size(cell)
+    cells = array("H", [NO_ZONE]) * (rows * columns)
+    for row in range(rows):
+        lat = (row + 0.5) * cell - 90
+        for column in range(columns):
+            index, chord_squared = tree.nearest(unit_vector(lat, (column + 0.5) * cell - 180))
+            if chord_squared <= max_chord_squared:
+                cells[row * columns + column] = city_zones[index]
+        if row % max(1, rows // 10) == 0:
+            print(f"⏳ {row * 100 // rows}%")
+    return cells
+
+
+def write(output: str, cell: float, cells: array, zones: Zones):
+    rows, columns = grid_size(cell)
+    names = sorted(zones.indexes, key=zones.indexes.get)
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "wb") as f:
+        f.write(TIMEZONE_GRID_HEADER.pack(TIMEZONE_GRID_MAGIC, cell, rows, columns, len(names)))
+        for name in names:
+            encoded = name.encode("utf-8")
+            f.write(ZONE_NAME_LENGTH.pack(len(encoded)) + encoded)
+        f.write(zlib.compress(cells.tobytes(), 9))
+
+    size_kb = os.path.getsize(output) / 1024
+    print(f"✅ {output}: {rows}x{columns} ячеек по {cell}°, {len(names)} поясов, {size_kb:.0f} КБ")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сборка растровой карты часовых поясов")
+    parser.add_argument("--boundaries", help="GeoJSON с границами поясов (timezone-boundary-builder)")
+    parser.add_argument("--cities", help="cities15000.txt из GeoNames, если границ нет")
+    parser.add_argument("--download", action="store_true", help="скачать cities15000 из GeoNames вместо --cities")
+    parser.add_argument("--cell", type=float, default=0.25, help="размер ячейки в градусах")
+    parser.add_argument("--output", default="data/timezones.bin", help="куда записать карту")
+    args = parser.parse_args()
+
+    zones = Zones()
+    if args.boundaries:
+        cells = rasterize_boundaries(args.boundaries, args.cell, zones)
+    elif args.cities:
+        with open(args.cities, encoding="utf-8") as f:
+            cells = rasterize_cities(f, args.cell, zones)
+    elif args.download:
+        cells = rasterize_cities(download_cities(), args.cell, zones)
+    else:
+        parser.error("укажите --boundaries, --cities или --download")
+
+    write(args.output, args.cell, cells, zones)
+
+
+if __name__ == "__main__":
+    main()
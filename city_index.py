@@ -0,0 +1,91 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+from city_names import match_key
+
+GRAM_SIZE = 3
+
+
+def trigrams(text: str) -> Set[str]:
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+
+class CityIndex:
+    """In-memory trigram index over CityCache rows, answering substring queries on the
+    spelling-independent match key (case, diacritics, script and aliases ignored) without a table scan"""
+
+    def __init__(self):
+        self.loaded = False
+        self._rows: Dict[int, object] = {}
+        self._names: Dict[int, str] = {}
+        self._postings: Dict[str, Set[int]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def rows(self) -> List:
+        return list(self._rows.values())
+
+    def load(self, rows: Iterable):
+        """Rebuild the index from the full table"""
+        self._rows.clear()
+        self._names.clear()
+        self._postings.clear()
+        for row in rows:
+            self.add(row)
+        self.loaded = True
+
+    def add(self, row):
+        """Index a CityCache row, replacing an earlier version with the same id"""
+        if row.id in self._rows:
+            self.remove(row.id)
+        name = row.query_norm or match_key(row.city_name)
+        self._rows[row.id] = row
+        self._names[row.id] = name
+        for gram in trigrams(name):
+            self._postings[gram].add(row.id)
+
+    def remove(self, row_id: int):
+        name = self._names.pop(row_id, None)
+        self._rows.pop(row_id, None)
+        if name is None:
+            return
+        for gram in trigrams(name):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(row_id)
+                if not posting:
+                    del self._postings[gram]
+
+    @staticmethod
+    def _rank(name: str, query: str) -> int:
+        if name == query:
+            return 0
+        if name.startswith(query):
+            return 1
+        if f" {query}" in name or f"-{query}" in name:
+            return 2
+        return 3
+
+    def _candidates(self, query: str) -> Iterable[int]:
+        if len(query) < GRAM_SIZE:
+            return self._names.keys()
+        # Intersect from the rarest trigram so the working set stays small
+        grams = sorted(trigrams(query), key=lambda gram: len(self._postings.get(gram, ())))
+        candidates = set(self._postings.get(grams[0], ()))
+        for gram in grams[1:]:
+            if not candidates:
+                break
+            candidates &= self._postings.get(gram, set())
+        return candidates
+
+    def search(self, query: str, limit: Optional[int] = None) -> List:
+        """Rows whose name contains the query: exact matches first, then prefixes, then word starts"""
+        query = match_key(query)
+        matches = [row_id for row_id in self._candidates(query) if query in self._names[row_id]]
+        matches.sort(key=lambda row_id: (self._rank(self._names[row_id], query), len(self._names[row_id]), row_id))
+        return [self._rows[row_id] for row_id in matches[:limit]]
+
+
+# Global city index, loaded from the city_cache table at startup
+city_index = CityIndex()
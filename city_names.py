@@ -0,0 +1,113 @@
+import unicodedata
+
+# Letters that only occur in Ukrainian words switch transliteration to the Ukrainian table
+UKRAINIAN_LETTERS = set("іїєґ")
+
+RUSSIAN_TRANSLIT = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e", "ж": "zh",
+    "з": "z", "и": "i", "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o",
+    "п": "p", "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "kh", "ц": "ts",
+    "ч": "ch", "ш": "sh", "щ": "shch", "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "yu",
+    "я": "ya"
+}
+
+# Official Ukrainian romanisation (2010 national standard)
+UKRAINIAN_TRANSLIT = {
+    **RUSSIAN_TRANSLIT,
+    "г": "h", "ґ": "g", "е": "e", "є": "ie", "и": "y", "і": "i", "ї": "i", "й": "i",
+    "ю": "iu", "я": "ia", "щ": "shch", "ь": "", "'": "", "’": "", "ʼ": ""
+}
+# Letters spelled differently at the start of a word: Єнакієве -> Yenakiieve, Яготин -> Yahotyn
+UKRAINIAN_WORD_INITIAL = {"є": "ye", "ї": "yi", "й": "y", "ю": "yu", "я": "ya"}
+
+# Bump whenever match_key output changes, so cached rows are re-keyed once on the next start
+CITY_KEY_VERSION = "2"
+
+# Spellings of the same city, keyed by their transliterated form -> canonical key
+CITY_ALIASES = {
+    "kiev": "kyiv",
+    "kharkov": "kharkiv",
+    "odessa": "odesa",
+    "lvov": "lviv",
+    "lwow": "lviv",
+    "dnepr": "dnipro",
+    "dnepropetrovsk": "dnipro",
+    "nikolaev": "mykolaiv",
+    "zaporozhe": "zaporizhzhia",
+    "zaporozhye": "zaporizhzhia",
+    "chernigov": "chernihiv",
+    "vinnitsa": "vinnytsia",
+    "rovno": "rivne",
+    "moskva": "moscow",
+    "sankt-peterburg": "saint petersburg",
+    "st petersburg": "saint petersburg",
+    "st. petersburg": "saint petersburg",
+    "peterburg": "saint petersburg",
+    "nyu-york": "new york",
+    "nyu york": "new york",
+    "nyu-iork": "new york",
+    "parizh": "paris",
+    "tokio": "tokyo",
+    "pekin": "beijing",
+    "sidney": "sydney",
+    "dubay": "dubai",
+    "stambul": "istanbul",
+    "rim": "rome",
+    "roma": "rome",
+    "vena": "vienna",
+    "wien": "vienna",
+    "praga": "prague",
+    "praha": "prague",
+    "varshava": "warsaw",
+    "warszawa": "warsaw",
+    "myunkhen": "munich",
+    "munchen": "munich"
+}
+
+
+def normalize_name(name: str) -> str:
+    """Comparison key for a place name: case-folded, diacritics removed, whitespace collapsed"""
+    decomposed = unicodedata.normalize("NFKD", name.casefold())
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(stripped.split())
+
+
+def transliterate(name: str) -> str:
+    """Latin spelling of a Russian or Ukrainian name; other characters pass through"""
+    words = []
+    for word in name.split(" "):
+        if UKRAINIAN_LETTERS & set(word):
+            # "зг" is written zgh so it does not read as "zh"
+            letters = [
+                UKRAINIAN_WORD_INITIAL.get(char, UKRAINIAN_TRANSLIT.get(char, char)) if i == 0
+                else "gh" if char == "г" and word[i - 1] == "з"
+                else UKRAINIAN_TRANSLIT.get(char, char)
+                for i, char in enumerate(word)
+            ]
+        else:
+            letters = [RUSSIAN_TRANSLIT.get(char, char) for char in word]
+        words.append("".join(letters))
+    return " ".join(words)
+
+
+def latin_name(name: str) -> str:
+    """normalize_name of the transliterated name; transliteration runs first,
+    since й, ё and ї are letters of their own rather than и, е and і with marks"""
+    return normalize_name(transliterate(unicodedata.normalize("NFC", name.casefold())))
+
+
+def fold_spelling(latin: str) -> str:
+    """Merge the letters romanisations disagree on: y/i (Zhytomyr, Zhitomir; Vinnytsia,
+    Vinnytsya) and g/h (Uzhhorod, Uzhgorod), so a Ukrainian name typed without і, ї, є or ґ
+    still meets its official spelling"""
+    return latin.replace("y", "i").replace("g", "h")
+
+
+# Aliases keyed and valued by folded spellings
+_FOLDED_ALIASES = {fold_spelling(spelling): fold_spelling(key) for spelling, key in CITY_ALIASES.items()}
+
+
+def match_key(name: str) -> str:
+    """Spelling-independent key: "Киев", "Київ", "Kiev" and "Kyiv" all give the same key"""
+    folded = fold_spelling(latin_name(name))
+    return _FOLDED_ALIASES.get(folded, folded)
@@ -1,12 +1,118 @@
-import pytz
+import logging
+import math
+import os
+import struct
+import zlib
+from array import array
+from typing import List, Optional
+
 from datetime import datetime
-from typing import Optional
+
+from config import settings
+from data_formats import NO_ZONE, TIMEZONE_GRID_HEADER, TIMEZONE_GRID_MAGIC, ZONE_NAME_LENGTH
+from timezone_service import timezone_service
+
+logger = logging.getLogger(__name__)
+
+# Without a grid, the nearest known city decides the zone when it is at most this far
+NEAREST_CITY_MAX_KM = 300.0
+
+
+class TimezoneGrid:
+    """Rasterised timezone map, read into memory on first use; a missing file disables it"""
+    
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.cells: Optional[array] = None
+        self.zones: List[str] = []
+        self.cell_degrees = 0.0
+        self.rows = 0
+        self.columns = 0
+        self._tried = False
+    
+    def _load(self) -> bool:
+        if self._tried:
+            return self.cells is not None
+        self._tried = True
+        
+        if not self.path or not os.path.exists(self.path):
+            logger.warning(
+                f"Timezone grid {self.path} not found, using nearest-city timezones; "
+                f"build it with build_timezone_grid.py --download"
+            )
+            return False
+        
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+            magic, cell_degrees, rows, columns, zone_count = TIMEZONE_GRID_HEADER.unpack_from(data, 0)
+            if magic != TIMEZONE_GRID_MAGIC:
+                logger.error(f"{self.path} is not a timezone grid")
+                return False
+            
+            offset = TIMEZONE_GRID_HEADER.size
+            zones = [None]
+            for _ in range(zone_count):
+                (length,) = ZONE_NAME_LENGTH.unpack_from(data, offset)
+                offset += ZONE_NAME_LENGTH.size
+                zones.append(data[offset:offset + length].decode())
+                offset += length
+            
+            cells = array("H")
+            cells.frombytes(zlib.decompress(data[offset:]))
+            if len(cells) != rows * columns:
+                logger.error(f"Timezone grid {self.path} is truncated")
+                return False
+        except (OSError, struct.error, zlib.error, UnicodeDecodeError) as e:
+            logger.error(f"Failed to load timezone grid: {e}")
+            return False
+        
+        self.cells, self.zones = cells, zones
+        self.cell_degrees, self.rows, self.columns = cell_degrees, rows, columns
+        logger.info(f"Timezone grid loaded: {rows}x{columns} cells of {cell_degrees}°, {zone_count} zones")
+        return True
+    
+    @property
+    def available(self) -> bool:
+        return self._load()
+    
+    def cell(self, lat: float, lon: float) -> tuple[int, int]:
+        """(row, column) of the grid cell holding the point; only valid when the grid is available"""
+        row = math.floor((min(max(lat, -90.0), 90.0) + 90) / self.cell_degrees)
+        column = math.floor(((lon + 180) % 360) / self.cell_degrees)
+        return min(row, self.rows - 1), min(column, self.columns - 1)
+    
+    def zone(self, row: int, column: int) -> Optional[str]:
+        if self.cells is None:
+            return None
+        return self.zones[self.cells[row * self.columns + column]]
+
+
+# Global timezone grid
+timezone_grid = TimezoneGrid(settings.timezone_grid_path)
+
 
 def get_timezone_by_coordinates(lat: float, lon: float) -> str:
+    """IANA zone for the coordinates: from the timezone grid, else the nearest known city,
+    else a coarse regional guess. Not memoised here: callers cache the answer per location,
+    and the fallbacks improve as the city index grows"""
+    if timezone_grid.available:
+        zone = timezone_grid.zone(*timezone_grid.cell(lat, lon))
+        if zone:
+            return zone
+    
+    # Imported here: the nearest-city index falls back to approximate_timezone itself
+    from nearest_city import nearest_city
+    city = nearest_city.nearest(lat, lon)
+    if city and city.distance_km <= NEAREST_CITY_MAX_KM:
+        return city.timezone
+    return approximate_timezone(lat, lon)
+
+
+def approximate_timezone(lat: float, lon: float) -> str:
     """
     Get timezone by coordinates using a simple mapping approach.
-    This is a basic implementation - for production, you might want to use
-    a more sophisticated library like timezonefinder.
+    Only a last resort: rectangles around major regions, then longitude bands.
     """
     
     # Major timezone mappings based on approximate coordinate ranges
@@ -71,22 +177,11 @@ def get_timezone_by_coordinates(lat: float, lon: float) -> str:
         return "Asia/Tokyo"
 
 
-def get_local_time_for_coordinates(lat: float, lon: float) -> datetime:
-    """Get current local time for given coordinates"""
-    timezone_str = get_timezone_by_coordinates(lat, lon)
-    try:
-        tz = pytz.timezone(timezone_str)
-        utc_now = datetime.now(pytz.UTC)
-        local_time = utc_now.astimezone(tz)
-        return local_time
-    except:
-        # Fallback to UTC
-        return datetime.now(pytz.UTC)
-
-
-def format_local_time(lat: float, lon: float) -> tuple[str, str]:
-    """Format local time for coordinates as date and time strings"""
-    local_time = get_local_time_for_coordinates(lat, lon)
-    date_str = local_time.strftime("%d.%m.%Y")
-    time_str = local_time.strftime("%H:%M")
-    return date_str, time_str
+def get_local_time(timezone_name: Optional[str]) -> datetime:
+    """Current local time in the user's stored timezone"""
+    return timezone_service.local_time(timezone_name)
+
+
+def format_local_time(timezone_name: Optional[str]) -> tuple[str, str]:
+    """Format local time in the timezone as date and time strings"""
+    return timezone_service.format_local(timezone_name)
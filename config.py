@@ -1,6 +1,6 @@
 import os
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, List, Optional
 
 
 class Settings(BaseSettings):
@@ -24,6 +24,69 @@ class Settings(BaseSettings):
     # LocationIQ API
     locationiq_api_key: Optional[str] = None
     
+    # Outbound HTTP pools (one client per provider)
+    http2_enabled: bool = True
+    open_meteo_max_connections: int = 50
+    weather_api_max_connections: int = 10
+    locationiq_max_connections: int = 5
+    default_max_connections: int = 10
+    http_cache_enabled: bool = True  # conditional HTTP caching for weather providers
+    
+    # Per-provider rate limits (requests per second, 0 = unlimited) and burst sizes
+    locationiq_rate_limit: float = 1.0
+    locationiq_rate_burst: int = 1
+    weather_api_rate_limit: float = 0.0
+    weather_api_rate_burst: int = 1
+    open_meteo_rate_limit: float = 0.0
+    open_meteo_rate_burst: int = 1
+    
+    # Daily provider quotas (0 = no quota) and the share after which cheaper paths are preferred
+    locationiq_daily_quota: int = 5000
+    weather_api_daily_quota: int = 30000
+    open_meteo_daily_quota: int = 10000
+    quota_soft_limit: float = 0.9
+    
+    # Hot-set forecast refresher
+    hot_refresh_top_n: int = 50
+    hot_refresh_budget: int = 30  # upstream calls per run
+    
+    # End-to-end deadlines for user-facing operations (seconds)
+    city_search_deadline: float = 8.0
+    weather_request_deadline: float = 10.0
+    notification_deadline: float = 20.0
+    
+    # City search: "sequential" tries remote providers one after another, "race" queries them at once
+    city_search_mode: str = "sequential"
+    city_search_race_budget: float = 4.0  # seconds the race waits for a good enough answer
+    
+    # Upstream transport: live, record (save responses to cassettes) or replay (serve cassettes offline)
+    provider_transport_mode: str = "live"
+    provider_cassette_dir: str = "cassettes"
+    replay_latency: float = 0.0  # seconds added to every replayed response
+    replay_error_rate: float = 0.0  # share of replayed requests failing with a connection error
+    replay_rate_limit_rate: float = 0.0  # share of replayed requests answered with 429
+    replay_seed: Optional[int] = None
+    
+    # Approximate memory budget shared by the in-process caches
+    memory_budget_mb: int = 64
+    
+    # User profiles kept in process; every write goes through the cache, the TTL bounds staleness
+    # from writes made elsewhere (another instance, manual SQL)
+    user_cache_ttl: int = 300  # seconds
+    user_cache_size: int = 10000
+    
+    # Popular city buttons per language as registry keys, e.g. {"uk": ["kyiv", "lviv", "odesa"]}
+    popular_city_layouts: Dict[str, List[str]] = {}
+    
+    # Offline world cities dataset built by build_cities_dataset.py; skipped when the file is missing
+    offline_cities_path: Optional[str] = "data/cities.bin"
+    
+    # Rasterised timezone map built by build_timezone_grid.py; nearest-city timezones when missing
+    timezone_grid_path: Optional[str] = "data/timezones.bin"
+    
+    # Persistent cache (SQLite file); disabled when not set
+    persistent_cache_path: Optional[str] = None
+    
     # App settings
     port: int = 8000
     host: str = "0.0.0.0"
@@ -41,10 +104,28 @@ settings = Settings()
 OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast"
 LOCATIONIQ_URL = "https://eu1.locationiq.com/v1/search"
 WEATHER_API_URL = "https://api.weatherapi.com/v1"
+BETTER_STACK_URL = "https://in.logs.betterstack.com/"
+
+# Adaptive upstream timeout bounds (seconds)
+PROVIDER_TIMEOUT_MIN = 2.0
+PROVIDER_TIMEOUT_MAX = 15.0
 
 # Cache settings
 CITY_CACHE_TTL = 86400  # 24 hours
-WEATHER_CACHE_TTL = 1800  # 30 minutes
+NEGATIVE_CITY_CACHE_TTL = 900  # 15 minutes for queries that resolved to nothing
+NEGATIVE_CITY_CACHE_SIZE = 5000
+HOT_REFRESH_INTERVAL = 300  # 5 minutes
+HOT_REFRESH_AHEAD = 300  # refresh sections that would expire before the next run
+MEMORY_CHECK_INTERVAL = 60  # seconds between memory budget checks
+QUOTA_FLUSH_INTERVAL = 60  # seconds between provider usage writes
+DISK_CACHE_PURGE_INTERVAL = 3600  # seconds between sweeps of expired disk cache rows
+
+# Weather cache TTLs per forecast section
+WEATHER_SECTION_TTLS = {
+    "current": 600,  # 10 minutes
+    "hourly": 1800,  # 30 minutes
+    "daily": 10800  # 3 hours
+}
 
 # Scheduler settings
 SCHEDULER_TIMEZONE = "UTC"
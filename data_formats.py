@@ -0,0 +1,19 @@
+"""Binary layouts of the bundled data files, shared by the readers and the build scripts.
+Only the standard library is imported here, so the scripts run without the app's settings."""
+import struct
+
+# Offline cities dataset (little-endian), written by build_cities_dataset.py:
+#   header | places | name keys sorted by UTF-8 bytes | strings (u16 length + UTF-8)
+CITIES_MAGIC = b"WBCITY01"
+CITIES_HEADER = struct.Struct("<8sIIIII")  # magic, places, keys, places offset, keys offset, strings offset
+CITIES_PLACE = struct.Struct("<ffIIII")  # lat, lon, population, name, country, timezone (string offsets)
+CITIES_KEY = struct.Struct("<II")  # normalised name (string offset), place index
+STRING_LENGTH = struct.Struct("<H")
+
+# Timezone grid, written by build_timezone_grid.py:
+#   header | zone names (u16 length + UTF-8) | zlib-compressed u16 zone per cell,
+#   row by row from 90°S and 180°W
+TIMEZONE_GRID_MAGIC = b"WBTZGRD1"
+TIMEZONE_GRID_HEADER = struct.Struct("<8sfHHH")  # magic, cell size (degrees), rows, columns, zones
+ZONE_NAME_LENGTH = struct.Struct("<H")
+NO_ZONE = 0  # open sea; zone indexes in the file start at 1
@@ -1,11 +1,22 @@
-from sqlalchemy import BigInteger, String, Boolean, Time, DECIMAL, DateTime, Integer, JSON, Text, select
+from sqlalchemy import BigInteger, String, Boolean, Time, DECIMAL, DateTime, Date, Integer, JSON, Text, Index, inspect, or_, select, text
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from sqlalchemy.sql import func
 from config import settings
+from city_index import city_index
+from city_names import CITY_KEY_VERSION, match_key
+from city_timezone_mapper import get_timezone_by_coordinates
+from memory_budget import PRIORITY_USER_PROFILES, SIZE_SAMPLE, deep_sizeof, memory_budget
 import asyncio
 import os
+import sys
+import time
+from collections import OrderedDict
+from itertools import islice
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from datetime import datetime, time as time_type
+from datetime import date, datetime, time as time_type
 
 # Debug: Print database URL for troubleshooting
 print(f"DEBUG: DATABASE_URL from settings: {settings.database_url}")
@@ -38,6 +49,10 @@ print(f"DEBUG: Final async_database_url: {async_database_url}")
 engine = create_async_engine(async_database_url, echo=False)
 AsyncSessionLocal = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+# Timezones the bot used to store from the chosen language, before it resolved them from the city
+LEGACY_LANGUAGE_TIMEZONES = ("UTC", "Europe/Kiev", "Europe/London")
+
+
 class Base(DeclarativeBase):
     pass
 
@@ -69,9 +84,13 @@ class BotLog(Base):
 
 class CityCache(Base):
     __tablename__ = "city_cache"
+    __table_args__ = (
+        Index("uq_city_cache_query_coords", "query_norm", "latitude", "longitude", unique=True),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     city_name: Mapped[str] = mapped_column(String(100), index=True)
+    query_norm: Mapped[str] = mapped_column(String(100), index=True)
     latitude: Mapped[float] = mapped_column(DECIMAL(10, 8))
     longitude: Mapped[float] = mapped_column(DECIMAL(11, 8))
     country: Mapped[str] = mapped_column(String(100))
@@ -79,6 +98,24 @@ class CityCache(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
 
 
+class ProviderUsage(Base):
+    __tablename__ = "provider_usage"
+    
+    provider: Mapped[str] = mapped_column(String(50), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    calls: Mapped[int] = mapped_column(Integer, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=func.now(), onupdate=func.now())
+
+
+class Migration(Base):
+    """Data migrations already applied, so startup runs each of them once"""
+    __tablename__ = "migrations"
+    
+    name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    version: Mapped[str] = mapped_column(String(50))
+    applied_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
+
+
 # Database dependency
 async def get_db():
     async with AsyncSessionLocal() as session:
@@ -88,18 +125,134 @@ async def get_db():
             await session.close()
 
 
+def _applied_version(conn, name: str):
+    return conn.execute(text("SELECT version FROM migrations WHERE name = :name"), {"name": name}).scalar()
+
+
+def _mark_applied(conn, name: str, version: str):
+    conn.execute(text("DELETE FROM migrations WHERE name = :name"), {"name": name})
+    conn.execute(
+        text("INSERT INTO migrations (name, version, applied_at) VALUES (:name, :version, :now)"),
+        {"name": name, "version": version, "now": datetime.now()}
+    )
+
+
+def _migrate_city_cache(conn):
+    """Add query_norm to a city_cache table created before it existed and re-key rows whose
+    key changed with the normalisation rules, dropping rows that become duplicates; runs once
+    per CITY_KEY_VERSION"""
+    columns = {column["name"] for column in inspect(conn).get_columns("city_cache")}
+    added = "query_norm" not in columns
+    if added:
+        conn.execute(text("ALTER TABLE city_cache ADD COLUMN query_norm VARCHAR(100)"))
+    elif _applied_version(conn, "city_cache_keys") == CITY_KEY_VERSION:
+        return
+    
+    rows = conn.execute(text("SELECT id, city_name, query_norm, latitude, longitude FROM city_cache ORDER BY id")).all()
+    seen = set()
+    duplicates = []
+    changed = {}
+    for row_id, city_name, query_norm, latitude, longitude in rows:
+        key = match_key(city_name or "")[:100]
+        coordinates = (key, round(float(latitude), 8), round(float(longitude), 8))
+        if coordinates in seen:
+            duplicates.append(row_id)
+            continue
+        seen.add(coordinates)
+        if key != query_norm:
+            changed[row_id] = key
+    
+    # Clear changed keys first so the unique index never sees a transient collision
+    for row_id in duplicates:
+        conn.execute(text("DELETE FROM city_cache WHERE id = :id"), {"id": row_id})
+    for row_id in changed:
+        conn.execute(text("UPDATE city_cache SET query_norm = NULL WHERE id = :id"), {"id": row_id})
+    for row_id, key in changed.items():
+        conn.execute(text("UPDATE city_cache SET query_norm = :key WHERE id = :id"), {"key": key, "id": row_id})
+    
+    if added:
+        for index in CityCache.__table__.indexes:
+            if "query_norm" in index.columns:
+                index.create(conn, checkfirst=True)
+    
+    _mark_applied(conn, "city_cache_keys", CITY_KEY_VERSION)
+
+
 # Initialize database
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_migrate_city_cache)
+
+
+class UserCache:
+    """LRU of detached user profiles with a TTL; handlers read them, never modify them"""
+    
+    def __init__(self):
+        self.entries = OrderedDict()  # user_id -> (stored at, User)
+        self.hits = 0
+        self.misses = 0
+        memory_budget.register("user_profiles", self._memory_size, self.evict_oldest, PRIORITY_USER_PROFILES)
+    
+    def get(self, user_id: int):
+        entry = self.entries.get(user_id)
+        if entry is None or time.monotonic() - entry[0] >= settings.user_cache_ttl:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(user_id)
+        self.hits += 1
+        return entry[1]
+    
+    def put(self, user: User):
+        self.entries.pop(user.user_id, None)
+        self.entries[user.user_id] = (time.monotonic(), user)
+        while len(self.entries) > settings.user_cache_size:
+            self.entries.popitem(last=False)
+    
+    def clear(self):
+        self.entries.clear()
+    
+    def _memory_size(self) -> int:
+        """Extrapolated from the column values of a sample, since sizing the ORM objects
+        themselves would follow their state into the shared mapper"""
+        if not self.entries:
+            return sys.getsizeof(self.entries)
+        columns = User.__table__.columns.keys()
+        sample = list(islice(self.entries.values(), SIZE_SAMPLE))
+        sampled = sum(deep_sizeof([getattr(user, column) for column in columns]) for _, user in sample)
+        return sys.getsizeof(self.entries) + sampled * len(self.entries) // len(sample)
+    
+    def evict_oldest(self, bytes_to_free: int) -> int:
+        """Drop least recently used profiles to release about bytes_to_free"""
+        if not self.entries:
+            return 0
+        
+        before = self._memory_size()
+        per_entry = max(1, before // len(self.entries))
+        for _ in range(min(len(self.entries), bytes_to_free // per_entry + 1)):
+            self.entries.popitem(last=False)
+        return max(0, before - self._memory_size())
+    
+    def get_stats(self) -> dict:
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+# Global user profile cache, kept current by DatabaseManager.create_or_update_user
+user_cache = UserCache()
 
 
 # Database operations
 class DatabaseManager:
     @staticmethod
     async def get_user(user_id: int) -> User:
+        user = user_cache.get(user_id)
+        if user is not None:
+            return user
+        
         async with AsyncSessionLocal() as session:
             result = await session.get(User, user_id)
+            if result is not None:
+                user_cache.put(result)
             return result
     
     @staticmethod
@@ -116,6 +269,7 @@ class DatabaseManager:
             
             await session.commit()
             await session.refresh(user)
+            user_cache.put(user)
             return user
     
     @staticmethod
@@ -123,8 +277,7 @@ class DatabaseManager:
         async with AsyncSessionLocal() as session:
             from sqlalchemy import select
             from datetime import time
-            import pytz
-            from city_timezone_mapper import get_timezone_by_coordinates
+            from timezone_service import timezone_service
             
             # Parse UTC time string to time object
             try:
@@ -142,26 +295,20 @@ class DatabaseManager:
             result = await session.execute(query)
             all_users = result.scalars().all()
             
-            # Filter users whose city local time matches the current UTC time
+            # Filter users whose local time matches their notification time; the zone was
+            # resolved when the city was saved, and each distinct zone is converted once
+            local_times = {}
             matching_users = []
             for user in all_users:
                 if user.notification_time is None:
                     continue
                     
                 try:
-                    # Get timezone based on city coordinates
-                    city_tz_name = get_timezone_by_coordinates(float(user.city_lat), float(user.city_lon))
-                    city_tz = pytz.timezone(city_tz_name)
-                    
-                    # Get current UTC time
-                    utc_now = datetime.now(pytz.UTC)
+                    if user.timezone not in local_times:
+                        city_local_time = timezone_service.local_time(user.timezone)
+                        local_times[user.timezone] = (city_local_time.hour, city_local_time.minute)
                     
-                    # Convert to city's timezone
-                    city_local_time = utc_now.astimezone(city_tz)
-                    
-                    # Check if current time in city's timezone matches their notification time
-                    if (city_local_time.hour == user.notification_time.hour and 
-                        city_local_time.minute == user.notification_time.minute):
+                    if local_times[user.timezone] == (user.notification_time.hour, user.notification_time.minute):
                         matching_users.append(user)
                         
                 except Exception as e:
@@ -171,6 +318,73 @@ class DatabaseManager:
             
             return matching_users
     
+    @staticmethod
+    async def backfill_user_timezones() -> int:
+        """Resolve the zone from the city for users saved before it was stored at city-set time,
+        whose timezone is still the per-language default. Runs once: those defaults are also
+        valid zones the bot stores now, so a later run would overwrite real choices"""
+        async with AsyncSessionLocal() as session:
+            if await session.get(Migration, "user_timezones"):
+                return 0
+            
+            query = select(User).where(
+                User.city_lat.isnot(None),
+                User.city_lon.isnot(None),
+                or_(User.timezone.is_(None), User.timezone.in_(LEGACY_LANGUAGE_TIMEZONES))
+            )
+            result = await session.execute(query)
+            updated = 0
+            for user in result.scalars().all():
+                timezone = get_timezone_by_coordinates(float(user.city_lat), float(user.city_lon))
+                if timezone != user.timezone:
+                    user.timezone = timezone
+                    updated += 1
+            session.add(Migration(name="user_timezones", version="1"))
+            try:
+                await session.commit()
+            except IntegrityError:
+                # Another instance ran it at the same time
+                return 0
+            if updated:
+                user_cache.clear()
+            return updated
+    
+    @staticmethod
+    async def get_popular_locations(limit: int = 50) -> list[tuple]:
+        """Most common (lat, lon) among users, with the number of users for each"""
+        async with AsyncSessionLocal() as session:
+            subscribers = func.count(User.user_id)
+            query = (
+                select(User.city_lat, User.city_lon, subscribers)
+                .where(User.city_lat.isnot(None), User.city_lon.isnot(None))
+                .group_by(User.city_lat, User.city_lon)
+                .order_by(subscribers.desc())
+                .limit(limit)
+            )
+            result = await session.execute(query)
+            return [(float(lat), float(lon), count) for lat, lon, count in result.all()]
+    
+    @staticmethod
+    async def get_provider_usage(day: date) -> dict[str, int]:
+        """Calls made to each provider on the given day"""
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(ProviderUsage.provider, ProviderUsage.calls).where(ProviderUsage.day == day)
+            )
+            return {provider: calls for provider, calls in result.all()}
+    
+    @staticmethod
+    async def add_provider_usage(usage: dict[tuple[str, date], int]):
+        """Add call counts keyed by (provider, day) to the ledger"""
+        async with AsyncSessionLocal() as session:
+            for (provider, day), calls in usage.items():
+                row = await session.get(ProviderUsage, (provider, day))
+                if row:
+                    row.calls += calls
+                else:
+                    session.add(ProviderUsage(provider=provider, day=day, calls=calls))
+            await session.commit()
+    
     @staticmethod
     async def log_action(user_id: int, action: str, data: dict = None):
         async with AsyncSessionLocal() as session:
@@ -178,27 +392,77 @@ class DatabaseManager:
             session.add(log_entry)
             await session.commit()
     
+    @staticmethod
+    async def load_city_index():
+        """Build the in-memory city name index from the whole city_cache table"""
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(select(CityCache))
+            city_index.load(result.scalars().all())
+    
     @staticmethod
     async def get_cached_cities(city_name: str) -> list[CityCache]:
+        if city_index.loaded:
+            return city_index.search(city_name)
+        
         async with AsyncSessionLocal() as session:
-            from sqlalchemy import select
-            
-            query = select(CityCache).where(CityCache.city_name.ilike(f"%{city_name}%"))
+            query = select(CityCache).where(CityCache.query_norm.contains(match_key(city_name)))
             result = await session.execute(query)
             return result.scalars().all()
     
     @staticmethod
-    async def cache_city(city_name: str, latitude: float, longitude: float, 
-                        country: str, display_name: str) -> CityCache:
+    async def cache_cities(city_name: str, cities: list[dict]) -> list[CityCache]:
+        """Upsert all results of one search under the query's match key, in a single transaction
+        
+        Each city dict has lat, lon, country and display_name; repeating a search
+        refreshes the existing rows instead of adding duplicates.
+        """
+        query_norm = match_key(city_name)[:100]
+        rows = {}
+        for city in cities:
+            latitude, longitude = round(float(city["lat"]), 8), round(float(city["lon"]), 8)
+            rows[(latitude, longitude)] = {
+                "city_name": city_name[:100],
+                "query_norm": query_norm,
+                "latitude": latitude,
+                "longitude": longitude,
+                "country": (city.get("country") or "")[:100],
+                "display_name": city.get("display_name") or ""
+            }
+        if not rows:
+            return []
+        
+        insert = postgresql_insert if engine.dialect.name == "postgresql" else sqlite_insert
         async with AsyncSessionLocal() as session:
-            city_cache = CityCache(
-                city_name=city_name,
-                latitude=latitude,
-                longitude=longitude,
-                country=country,
-                display_name=display_name
+            statement = insert(CityCache).values(list(rows.values()))
+            statement = statement.on_conflict_do_update(
+                index_elements=["query_norm", "latitude", "longitude"],
+                set_={
+                    "city_name": statement.excluded.city_name,
+                    "country": statement.excluded.country,
+                    "display_name": statement.excluded.display_name
+                }
             )
-            session.add(city_cache)
+            await session.execute(statement)
             await session.commit()
-            await session.refresh(city_cache)
-            return city_cache
+            
+            result = await session.execute(select(CityCache).where(CityCache.query_norm == query_norm))
+            cached = result.scalars().all()
+        
+        for city_cache in cached:
+            city_index.add(city_cache)
+        return cached
+    
+    @staticmethod
+    async def cache_city(city_name: str, latitude: float, longitude: float, 
+                        country: str, display_name: str) -> CityCache:
+        cached = await DatabaseManager.cache_cities(city_name, [{
+            "lat": latitude,
+            "lon": longitude,
+            "country": country,
+            "display_name": display_name
+        }])
+        key = (round(float(latitude), 8), round(float(longitude), 8))
+        return next(
+            (row for row in cached if (round(float(row.latitude), 8), round(float(row.longitude), 8)) == key),
+            None
+        )
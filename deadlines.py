@@ -0,0 +1,124 @@
+import contextvars
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from config import PROVIDER_TIMEOUT_MIN, PROVIDER_TIMEOUT_MAX
+
+
+class DeadlineExceeded(Exception):
+    """Raised when an operation has no time left for another upstream call"""
+
+
+class Deadline:
+    """End-to-end time budget for one user-facing operation"""
+
+    def __init__(self, budget: float):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+_current_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar(
+    "current_deadline", default=None
+)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+@contextmanager
+def deadline(budget: float):
+    """Run the enclosed awaits under a time budget; nested budgets never extend an outer one"""
+    outer = _current_deadline.get()
+    inner = Deadline(budget)
+    if outer is not None and outer.expires_at < inner.expires_at:
+        inner = outer
+    token = _current_deadline.set(inner)
+    try:
+        yield inner
+    finally:
+        _current_deadline.reset(token)
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 4.0) -> float:
+    """Full-jitter exponential backoff"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class LatencyTracker:
+    """Recent latencies for one provider and the timeout derived from them"""
+
+    # Not enough data for a percentile before this many samples
+    MIN_SAMPLES = 20
+
+    def __init__(self, size: int = 200):
+        self.samples = deque(maxlen=size)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * pct))
+        return ordered[index]
+
+    def timeout(self) -> float:
+        """Three times the p95 latency, clamped to the configured bounds"""
+        if len(self.samples) < self.MIN_SAMPLES:
+            return PROVIDER_TIMEOUT_MAX
+        return min(PROVIDER_TIMEOUT_MAX, max(PROVIDER_TIMEOUT_MIN, self.percentile(0.95) * 3))
+
+
+class ProviderTimeouts:
+    """Adaptive timeouts per upstream provider, bounded by the current deadline"""
+
+    def __init__(self):
+        self.trackers: Dict[str, LatencyTracker] = {}
+
+    def _tracker(self, provider: str) -> LatencyTracker:
+        if provider not in self.trackers:
+            self.trackers[provider] = LatencyTracker()
+        return self.trackers[provider]
+
+    def record(self, provider: str, seconds: float):
+        self._tracker(provider).record(seconds)
+
+    def timeout_for(self, provider: str) -> float:
+        """Timeout for the next call; raises DeadlineExceeded if the budget is spent"""
+        timeout = self._tracker(provider).timeout()
+        active = current_deadline()
+        if active is not None:
+            remaining = active.remaining()
+            if remaining < PROVIDER_TIMEOUT_MIN / 2:
+                raise DeadlineExceeded(f"No time left for {provider} call")
+            timeout = min(timeout, remaining)
+        return timeout
+
+    def get_stats(self) -> Dict[str, dict]:
+        stats = {}
+        for provider, tracker in self.trackers.items():
+            p50 = tracker.percentile(0.5)
+            p95 = tracker.percentile(0.95)
+            stats[provider] = {
+                "samples": len(tracker.samples),
+                "p50": round(p50, 3) if p50 is not None else None,
+                "p95": round(p95, 3) if p95 is not None else None,
+                "timeout": round(tracker.timeout(), 2)
+            }
+        return stats
+
+
+# Global provider timeout registry
+provider_timeouts = ProviderTimeouts()
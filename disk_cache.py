@@ -0,0 +1,129 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class DiskCache:
+    """SQLite-backed key/value cache that survives process restarts"""
+
+    def __init__(self, path: str, max_age: int = 86400):
+        self.path = path
+        # Rows older than this are dropped when the file is opened and by purge()
+        self.max_age = max_age
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the cache file lazily and purge expired rows on first use"""
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, stored_at REAL NOT NULL, value TEXT NOT NULL)"
+            )
+            removed = self._purge_expired(conn)
+            self._conn = conn
+            logger.info(f"Disk cache opened at {self.path} ({removed} expired entries purged)")
+        return self._conn
+
+    def _purge_expired(self, conn: sqlite3.Connection) -> int:
+        removed = conn.execute(
+            "DELETE FROM cache WHERE stored_at < ?", (time.time() - self.max_age,)
+        ).rowcount
+        conn.commit()
+        return removed
+
+    def _purge_sync(self) -> int:
+        with self._lock:
+            return self._purge_expired(self._connect())
+
+    def _get_sync(self, key: str, ttl: float) -> Optional[Tuple[float, Any]]:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT stored_at, value FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+        if not row:
+            return None
+        stored_at, value = row
+        if time.time() - stored_at >= ttl:
+            return None
+        return stored_at, json.loads(value)
+
+    def _set_sync(self, key: str, value: Any, stored_at: float):
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, stored_at, value) VALUES (?, ?, ?)",
+                (key, stored_at, payload)
+            )
+            conn.commit()
+
+    def _delete_prefix_sync(self, prefix: str) -> int:
+        escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        with self._lock:
+            conn = self._connect()
+            removed = conn.execute(
+                "DELETE FROM cache WHERE key LIKE ? ESCAPE '\\'", (escaped + "%",)
+            ).rowcount
+            conn.commit()
+        return removed
+
+    def _count_sync(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def _close_sync(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    async def get(self, key: str, ttl: float) -> Optional[Tuple[float, Any]]:
+        """Return (stored_at, value) if the entry exists and is younger than ttl seconds"""
+        try:
+            return await asyncio.to_thread(self._get_sync, key, ttl)
+        except Exception as e:
+            logger.warning(f"Disk cache read failed for {key}: {e}")
+            return None
+
+    async def set(self, key: str, value: Any, stored_at: Optional[float] = None):
+        """Write a JSON-serialisable value through to disk"""
+        try:
+            await asyncio.to_thread(self._set_sync, key, value, stored_at or time.time())
+        except Exception as e:
+            logger.warning(f"Disk cache write failed for {key}: {e}")
+
+    async def delete_prefix(self, prefix: str) -> int:
+        """Delete every entry whose key starts with prefix, returning the count"""
+        try:
+            return await asyncio.to_thread(self._delete_prefix_sync, prefix)
+        except Exception as e:
+            logger.warning(f"Disk cache flush failed for prefix {prefix!r}: {e}")
+            return 0
+
+    async def purge(self) -> int:
+        """Delete rows older than max_age, returning the count"""
+        try:
+            return await asyncio.to_thread(self._purge_sync)
+        except Exception as e:
+            logger.warning(f"Disk cache purge failed: {e}")
+            return 0
+
+    async def count(self) -> int:
+        try:
+            return await asyncio.to_thread(self._count_sync)
+        except Exception as e:
+            logger.warning(f"Disk cache count failed: {e}")
+            return 0
+
+    async def close(self):
+        await asyncio.to_thread(self._close_sync)
@@ -0,0 +1,223 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+HOURS_PER_DAY = 24
+
+DAY_NAMES = {
+    "ru": ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"],
+    "uk": ["Понеділок", "Вівторок", "Середа", "Четвер", "П'ятниця", "Субота", "Неділя"],
+    "en": ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+}
+
+# Upper bounds (exclusive) of the clothing temperature buckets; anything warmer is the last bucket
+CLOTHING_TEMPERATURE_EDGES = np.array([-10, 0, 10, 20, 25])
+RAIN_ADVICE_THRESHOLD = 50
+WIND_ADVICE_THRESHOLD = 10
+
+CLOTHING_ADVICE = {
+    "ru": {
+        "layers": [
+            "Теплая зимняя куртка, шапка, перчатки",
+            "Зимняя куртка, шапка",
+            "Теплая куртка или пальто",
+            "Легкая куртка или свитер",
+            "Легкая одежда, возможно кофта",
+            "Легкая летняя одежда"
+        ],
+        "rain": "зонт или дождевик",
+        "wind": "защита от ветра"
+    },
+    "uk": {
+        "layers": [
+            "Тепла зимова куртка, шапка, рукавички",
+            "Зимова куртка, шапка",
+            "Тепла куртка або пальто",
+            "Легка куртка або светр",
+            "Легкий одяг, можливо кофта",
+            "Легкий літній одяг"
+        ],
+        "rain": "парасолька або дощовик",
+        "wind": "захист від вітру"
+    },
+    "en": {
+        "layers": [
+            "Heavy winter coat, hat, gloves",
+            "Winter coat, hat",
+            "Warm jacket or coat",
+            "Light jacket or sweater",
+            "Light clothing, maybe a cardigan",
+            "Light summer clothing"
+        ],
+        "rain": "umbrella or raincoat",
+        "wind": "wind protection"
+    }
+}
+
+# Weekday of 1970-01-01 (a Thursday) with Monday as 0, to get weekdays from day numbers
+_EPOCH_WEEKDAY = 3
+
+# One forecast to post-process: (raw Open-Meteo payload, language, days)
+ForecastItem = Tuple[Dict, str, int]
+
+
+def _matrix(rows: Sequence[Sequence], width: int) -> np.ndarray:
+    """Stack ragged value lists into an (n, width) float matrix padded with NaN"""
+    matrix = np.full((len(rows), width), np.nan)
+    for i, row in enumerate(rows):
+        values = row[:width]
+        if values:
+            matrix[i, :len(values)] = np.array(values, dtype=float)
+    return matrix
+
+
+def _rounded(values: np.ndarray) -> np.ndarray:
+    # np.rint rounds halves to even, exactly like the built-in round()
+    return np.rint(values)
+
+
+def feels_like(temp, humidity, wind_speed) -> np.ndarray:
+    """Simple feels-like temperature: heat index when warm, wind chill when cold and windy"""
+    temp = np.asarray(temp, dtype=float)
+    humidity = np.asarray(humidity, dtype=float)
+    wind_speed = np.asarray(wind_speed, dtype=float)
+    return np.where(
+        temp >= 27,
+        temp + 0.5 * (humidity - 50) / 10,
+        np.where((temp <= 10) & (wind_speed > 5), temp - wind_speed * 0.5, temp)
+    )
+
+
+def clothing_buckets(temp) -> np.ndarray:
+    """Index into the clothing layers for each temperature"""
+    return np.searchsorted(CLOTHING_TEMPERATURE_EDGES, np.asarray(temp, dtype=float), side="right")
+
+
+def clothing_recommendations(weather_list: Sequence[Dict], languages: Sequence[str]) -> List[str]:
+    """Clothing advice for many processed forecasts at once"""
+    temp = np.array([w.get("current_temperature", 0) for w in weather_list], dtype=float)
+    rainy = np.array([w.get("rain_probability", 0) for w in weather_list], dtype=float) > RAIN_ADVICE_THRESHOLD
+    windy = np.array([w.get("wind_speed", 0) for w in weather_list], dtype=float) > WIND_ADVICE_THRESHOLD
+    buckets = clothing_buckets(temp)
+
+    recommendations = []
+    for i, language in enumerate(languages):
+        advice = CLOTHING_ADVICE.get(language, CLOTHING_ADVICE["en"])
+        parts = [advice["layers"][buckets[i]]]
+        if rainy[i]:
+            parts.append(advice["rain"])
+        if windy[i]:
+            parts.append(advice["wind"])
+        recommendations.append(", ".join(parts).capitalize())
+    return recommendations
+
+
+def process_forecasts(items: Sequence[ForecastItem], weather_codes: Dict[str, Dict[int, str]],
+                      now: Optional[datetime] = None, hours: Optional[Sequence[int]] = None) -> List[Dict]:
+    """Turn many raw Open-Meteo payloads into user-facing forecasts in one vectorised pass
+
+    weather_codes maps each language used in items to its weather code descriptions.
+    hours gives each item's current hour on the location's clock; without it every item
+    uses the hour of now.
+    """
+    if not items:
+        return []
+
+    rows = np.arange(len(items))
+    if hours is None:
+        current_hour_index = np.full(len(items), (now or datetime.now()).hour)
+    else:
+        current_hour_index = np.asarray(hours, dtype=int)
+    currents = [data.get("current_weather", {}) for data, _, _ in items]
+    hourlies = [data.get("hourly", {}) for data, _, _ in items]
+    dailies = [data.get("daily", {}) for data, _, _ in items]
+
+    # Current conditions, with the current hour's humidity and wind when the hourly data has them
+    current_temp = np.array([current.get("temperature", 0) for current in currents], dtype=float)
+    current_wind = np.array([current.get("windspeed", 0) for current in currents], dtype=float)
+    hour_humidity = _matrix([h.get("relative_humidity_2m") or [] for h in hourlies], HOURS_PER_DAY)[rows, current_hour_index]
+    hour_wind = _matrix([h.get("windspeed_10m") or [] for h in hourlies], HOURS_PER_DAY)[rows, current_hour_index]
+    humidity = np.where(np.isnan(hour_humidity), 50, hour_humidity)
+    wind_speed = np.where(np.isnan(hour_wind), current_wind, hour_wind)
+    feels = feels_like(current_temp, humidity, wind_speed)
+
+    # Daily aggregates; column 0 is today
+    day_width = max(1, max(len(d.get("temperature_2m_max") or []) for d in dailies))
+    max_temps = _matrix([d.get("temperature_2m_max") or [] for d in dailies], day_width)
+    min_temps = _matrix([d.get("temperature_2m_min") or [] for d in dailies], day_width)
+    rain_probs = _matrix([d.get("precipitation_probability_max") or [] for d in dailies], day_width)
+    today_max = np.where(np.isnan(max_temps[:, 0]), current_temp, max_temps[:, 0])
+    today_min = np.where(np.isnan(min_temps[:, 0]), current_temp, min_temps[:, 0])
+    today_rain = np.where(np.isnan(rain_probs[:, 0]), 0, rain_probs[:, 0])
+    daily_max = _rounded(max_temps)
+    daily_min = _rounded(np.where(np.isnan(min_temps), max_temps, min_temps))
+    daily_rain = _rounded(np.where(np.isnan(rain_probs), 0, rain_probs))
+
+    hourly_temps = _rounded(_matrix([h.get("temperature_2m") or [] for h in hourlies], HOURS_PER_DAY))
+
+    # Weekdays for every displayed date across all items, from their day numbers
+    day_counts = []
+    shown_dates = []
+    for (_, _, days), daily in zip(items, dailies):
+        if daily.get("time") and daily.get("temperature_2m_max"):
+            count = min(len(daily["time"][:days]), len(daily["temperature_2m_max"]))
+        else:
+            count = 0
+        day_counts.append(count)
+        shown_dates.extend(daily.get("time", [])[:count])
+    weekdays = (np.array(shown_dates, dtype="datetime64[D]").astype(np.int64) + _EPOCH_WEEKDAY) % 7
+
+    results = []
+    date_offset = 0
+    for i, (current, hourly, daily, (_, language, _)) in enumerate(zip(currents, hourlies, dailies, items)):
+        codes = weather_codes[language]
+        day_names = DAY_NAMES.get(language, DAY_NAMES["en"])
+
+        hourly_forecast = []
+        if hourly.get("time") and hourly.get("temperature_2m"):
+            weather_codes_hourly = hourly.get("weathercode", [])
+            hours = min(len(hourly["time"][:HOURS_PER_DAY]), len(hourly["temperature_2m"]))
+            for j in range(hours):
+                weather_code = weather_codes_hourly[j] if j < len(weather_codes_hourly) else 0
+                hourly_forecast.append({
+                    # Open-Meteo times are local ISO strings: YYYY-MM-DDTHH:MM
+                    "time": hourly["time"][j][11:16],
+                    "temperature": int(hourly_temps[i, j]),
+                    "description": codes.get(weather_code, "Unknown"),
+                    "weather_code": weather_code
+                })
+
+        daily_forecast = []
+        weather_codes_daily = daily.get("weathercode", [])
+        for j in range(day_counts[i]):
+            date_str = daily["time"][j]
+            weather_code = weather_codes_daily[j] if j < len(weather_codes_daily) else 0
+            daily_forecast.append({
+                "date": date_str,
+                "date_display": f"{date_str[8:10]}.{date_str[5:7]}",
+                "day_name": day_names[weekdays[date_offset + j]],
+                "max_temperature": int(daily_max[i, j]),
+                "min_temperature": int(daily_min[i, j]),
+                "description": codes.get(weather_code, "Unknown"),
+                "rain_probability": int(daily_rain[i, j]),
+                "weather_code": weather_code
+            })
+        date_offset += day_counts[i]
+
+        current_weather_code = current.get("weathercode", 0)
+        results.append({
+            "current_temperature": int(_rounded(current_temp[i])),
+            "feels_like": int(_rounded(feels[i])),
+            "min_temperature": int(_rounded(today_min[i])),
+            "max_temperature": int(_rounded(today_max[i])),
+            "description": codes.get(current_weather_code, "Unknown"),
+            "humidity": int(_rounded(humidity[i])),
+            "wind_speed": int(_rounded(wind_speed[i])),
+            "rain_probability": int(_rounded(today_rain[i])),
+            "weather_code": current_weather_code,
+            "hourly_forecast": hourly_forecast,
+            "daily_forecast": daily_forecast
+        })
+
+    return results
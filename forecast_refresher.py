@@ -0,0 +1,109 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from config import HOT_REFRESH_AHEAD, SUPPORTED_LANGUAGES, settings
+from database import DatabaseManager
+from popular_cities import popular_city_layout
+from quota_ledger import quota_ledger
+from weather_api import weather_api
+
+logger = logging.getLogger(__name__)
+
+# A user row counts as much as this many recent interactive requests
+SUBSCRIBER_WEIGHT = 5
+
+
+class ForecastRefresher:
+    """Keeps forecasts for the most requested locations fresh ahead of expiry"""
+
+    def __init__(self):
+        self._warm_tasks = set()
+        self.last_run = {}
+
+    @staticmethod
+    def _get_popular_city_cells() -> List[Tuple[float, float]]:
+        """Coordinates behind every language's popular-city buttons, straight from the registry"""
+        cells = {}
+        for language in SUPPORTED_LANGUAGES:
+            for city in popular_city_layout(language):
+                cells[city.key] = (city.latitude, city.longitude)
+        return list(cells.values())
+
+    async def get_hot_set(self) -> List[Tuple[float, float]]:
+        """Top-N (lat, lon) cells by subscribers and recent requests"""
+        scores: Dict[Tuple[float, float], float] = {}
+
+        for lat, lon, subscribers in await DatabaseManager.get_popular_locations(
+            settings.hot_refresh_top_n
+        ):
+            scores[(lat, lon)] = scores.get((lat, lon), 0) + subscribers * SUBSCRIBER_WEIGHT
+
+        for cell, count in weather_api.request_counts.items():
+            scores[cell] = scores.get(cell, 0) + count
+
+        for cell in self._get_popular_city_cells():
+            scores.setdefault(cell, 0)
+
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        return ranked[:settings.hot_refresh_top_n]
+
+    async def refresh_hot_set(self):
+        """Refresh hot sections that are missing or close to expiry, within the call budget"""
+        if quota_ledger.near_limit("open_meteo"):
+            # Leave the rest of the daily quota to user requests
+            self.last_run = {"hot_set": 0, "refreshed": 0, "over_budget": 0, "quota_limited": True}
+            logger.info("Open-Meteo quota nearly spent, skipping hot-set refresh")
+            return
+        
+        hot_set = await self.get_hot_set()
+        budget = settings.hot_refresh_budget
+        refreshed = 0
+        skipped = 0
+
+        for lat, lon in hot_set:
+            stale_sections = weather_api.get_stale_sections(lat, lon, ahead=HOT_REFRESH_AHEAD)
+            if not stale_sections:
+                continue
+
+            if refreshed >= budget:
+                skipped += 1
+                continue
+
+            # One upstream call per cell, covering only the sections about to expire
+            refreshed += 1
+            try:
+                await weather_api.refresh_sections(lat, lon, stale_sections)
+            except Exception as e:
+                logger.warning(f"Hot-set refresh failed for {lat}, {lon}: {e}")
+
+        # Halve the counters so "recent" fades out over a few runs
+        for key in list(weather_api.request_counts):
+            weather_api.request_counts[key] //= 2
+            if not weather_api.request_counts[key]:
+                del weather_api.request_counts[key]
+
+        self.last_run = {"hot_set": len(hot_set), "refreshed": refreshed, "over_budget": skipped}
+        if refreshed or skipped:
+            logger.info(f"Hot-set refresh: {refreshed} refreshed, {skipped} skipped over budget")
+
+    async def _warm_sections(self, latitude: float, longitude: float, sections: List[str]):
+        try:
+            await weather_api.refresh_sections(latitude, longitude, sections)
+        except Exception as e:
+            logger.warning(f"Forecast warm-up failed for {latitude}, {longitude}: {e}")
+
+    def warm(self, latitude: float, longitude: float) -> Optional[asyncio.Task]:
+        """Fetch the forecast for a newly set city in the background"""
+        stale_sections = weather_api.get_stale_sections(latitude, longitude)
+        if not stale_sections or quota_ledger.near_limit("open_meteo"):
+            return None
+
+        task = asyncio.create_task(self._warm_sections(latitude, longitude, stale_sections))
+        self._warm_tasks.add(task)
+        task.add_done_callback(self._warm_tasks.discard)
+        return task
+
+
+# Global refresher instance
+forecast_refresher = ForecastRefresher()
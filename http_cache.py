@@ -0,0 +1,175 @@
+import logging
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Set on responses served by CachingTransport so callers can tell what happened
+CACHE_STATUS_HEADER = "X-Cache"
+
+
+def _parse_cache_control(value: str) -> Dict[str, Optional[str]]:
+    directives = {}
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, arg = part.partition("=")
+        directives[name.strip().lower()] = arg.strip().strip('"') or None
+    return directives
+
+
+def _freshness_lifetime(headers: httpx.Headers, now: float) -> float:
+    """Seconds a response stays fresh according to Cache-Control/Expires"""
+    directives = _parse_cache_control(headers.get("cache-control", ""))
+    if "no-cache" in directives:
+        return 0
+    for name in ("s-maxage", "max-age"):
+        if directives.get(name):
+            try:
+                return max(0, int(directives[name]) - int(headers.get("age", "0") or 0))
+            except ValueError:
+                return 0
+    if headers.get("expires"):
+        try:
+            return max(0, parsedate_to_datetime(headers["expires"]).timestamp() - now)
+        except (TypeError, ValueError):
+            return 0
+    return 0
+
+
+class CachedResponse:
+    def __init__(self, status_code: int, headers: httpx.Headers, content: bytes, now: float):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.update_freshness(headers, now)
+
+    @property
+    def etag(self) -> Optional[str]:
+        return self.headers.get("etag")
+
+    @property
+    def last_modified(self) -> Optional[str]:
+        return self.headers.get("last-modified")
+
+    def update_freshness(self, headers: httpx.Headers, now: float):
+        self.expires_at = now + _freshness_lifetime(headers, now)
+
+    def is_fresh(self, now: float) -> bool:
+        return now < self.expires_at
+
+    def to_response(self, request: httpx.Request, cache_status: str) -> httpx.Response:
+        headers = self.headers.copy()
+        headers[CACHE_STATUS_HEADER] = cache_status
+        return httpx.Response(
+            status_code=self.status_code,
+            headers=headers,
+            content=self.content,
+            request=request
+        )
+
+
+class CachingTransport(httpx.AsyncBaseTransport):
+    """Private HTTP cache for GET responses: honours freshness and revalidates with ETag/Last-Modified"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, max_entries: int = 500):
+        self._transport = transport
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self.max_entries = max_entries
+        self.stats = {
+            "fresh_hits": 0,
+            "revalidated": 0,
+            "stored": 0,
+            "bytes_saved": 0
+        }
+
+    def _store(self, key: str, entry: CachedResponse):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self.stats["stored"] += 1
+
+    @staticmethod
+    def _is_storable(response: httpx.Response) -> bool:
+        if response.status_code != 200:
+            return False
+        directives = _parse_cache_control(response.headers.get("cache-control", ""))
+        if "no-store" in directives:
+            return False
+        return (
+            _freshness_lifetime(response.headers, time.time()) > 0
+            or "etag" in response.headers
+            or "last-modified" in response.headers
+        )
+
+    def serves_fresh(self, request: httpx.Request) -> bool:
+        """Whether the request would be answered from the cache without reaching the provider"""
+        entry = self._entries.get(str(request.url))
+        return request.method == "GET" and entry is not None and entry.is_fresh(time.time())
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.method != "GET":
+            return await self._transport.handle_async_request(request)
+
+        key = str(request.url)
+        entry = self._entries.get(key)
+        now = time.time()
+
+        if entry and entry.is_fresh(now):
+            self._entries.move_to_end(key)
+            self.stats["fresh_hits"] += 1
+            self.stats["bytes_saved"] += len(entry.content)
+            return entry.to_response(request, "HIT")
+
+        if entry:
+            if entry.etag:
+                request.headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                request.headers["If-Modified-Since"] = entry.last_modified
+
+        response = await self._transport.handle_async_request(request)
+
+        if response.status_code == 304 and entry:
+            await response.aclose()
+            for name in ("etag", "last-modified", "cache-control", "expires"):
+                if name in response.headers:
+                    entry.headers[name] = response.headers[name]
+            entry.update_freshness(entry.headers, now)
+            self._entries.move_to_end(key)
+            self.stats["revalidated"] += 1
+            self.stats["bytes_saved"] += len(entry.content)
+            return entry.to_response(request, "REVALIDATED")
+
+        if not self._is_storable(response):
+            return response
+
+        # Keep the encoded bytes so the client decodes them exactly as it would off the wire
+        content = b"".join([chunk async for chunk in response.stream])
+        await response.aclose()
+        entry = CachedResponse(response.status_code, response.headers.copy(), content, now)
+        self._store(key, entry)
+        return entry.to_response(request, "MISS")
+
+    def get_stats(self) -> Dict[str, int]:
+        return {**self.stats, "entries": len(self._entries)}
+    
+    def approx_size(self) -> int:
+        return sum(len(entry.content) for entry in self._entries.values())
+    
+    def evict(self, bytes_to_free: int) -> int:
+        """Drop least recently used entries, returning the body bytes released"""
+        freed = 0
+        while self._entries and freed < bytes_to_free:
+            _, entry = self._entries.popitem(last=False)
+            freed += len(entry.content)
+        return freed
+
+    async def aclose(self):
+        self._entries.clear()
+        await self._transport.aclose()
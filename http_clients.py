@@ -0,0 +1,170 @@
+import asyncio
+import importlib.util
+import logging
+from typing import Dict
+
+import httpx
+
+from config import OPEN_METEO_URL, LOCATIONIQ_URL, WEATHER_API_URL, BETTER_STACK_URL, settings
+from http_cache import CachingTransport
+from memory_budget import PRIORITY_HTTP_CACHE, memory_budget
+from provider_transport import RecordingTransport, ReplayTransport, cassette_path
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 needs the optional h2 package (httpx[http2]); without it we stay on HTTP/1.1
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+def _origin(url: str) -> str:
+    return str(httpx.URL(url).copy_with(path="/", query=None))
+
+
+class HTTPClientPool:
+    """One pooled httpx client per upstream provider"""
+
+    def __init__(self):
+        self.clients: Dict[str, httpx.AsyncClient] = {}
+        self.http_caches: Dict[str, CachingTransport] = {}
+        self.cassettes: Dict[str, httpx.AsyncBaseTransport] = {}
+        # Set by close(); late callers during shutdown must not open fresh pools
+        self._closed = False
+        memory_budget.register("http_cache", self._http_cache_size, self._evict_http_cache, PRIORITY_HTTP_CACHE)
+
+    def _provider_config(self) -> Dict[str, dict]:
+        return {
+            "open_meteo": {
+                "max_connections": settings.open_meteo_max_connections,
+                "warmup_url": _origin(OPEN_METEO_URL),
+                "enabled": True,
+                "http_cache": True
+            },
+            "weather_api": {
+                "max_connections": settings.weather_api_max_connections,
+                "warmup_url": _origin(WEATHER_API_URL),
+                "enabled": bool(settings.weather_api_key),
+                "http_cache": True
+            },
+            "locationiq": {
+                "max_connections": settings.locationiq_max_connections,
+                "warmup_url": _origin(LOCATIONIQ_URL),
+                "enabled": bool(settings.locationiq_api_key)
+            },
+            "betterstack": {
+                "max_connections": settings.default_max_connections,
+                "warmup_url": BETTER_STACK_URL,
+                "enabled": bool(settings.better_stack_token)
+            },
+            # Keep-alive pings and anything else without a dedicated pool
+            "default": {
+                "max_connections": settings.default_max_connections,
+                "warmup_url": None,
+                "enabled": True
+            }
+        }
+
+    def _create_client(self, name: str) -> httpx.AsyncClient:
+        config = self._provider_config().get(name, self._provider_config()["default"])
+        max_connections = config["max_connections"]
+        transport = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(
+                max_keepalive_connections=max_connections,
+                max_connections=max_connections
+            ),
+            http2=settings.http2_enabled and HTTP2_AVAILABLE
+        )
+        
+        path = cassette_path(settings.provider_cassette_dir, name)
+        if settings.provider_transport_mode == "replay":
+            transport = ReplayTransport(
+                path,
+                latency=settings.replay_latency,
+                error_rate=settings.replay_error_rate,
+                rate_limit_rate=settings.replay_rate_limit_rate,
+                seed=settings.replay_seed
+            )
+            self.cassettes[name] = transport
+        elif settings.provider_transport_mode == "record":
+            transport = RecordingTransport(transport, path)
+            self.cassettes[name] = transport
+        
+        if config.get("http_cache") and settings.http_cache_enabled:
+            transport = CachingTransport(transport)
+            self.http_caches[name] = transport
+        
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, connect=10.0),
+            transport=transport
+        )
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        """Get the client for a provider, creating it on first use; fails once the pool is closed"""
+        if self._closed:
+            raise RuntimeError(f"HTTP client pool is closed, not creating a client for {name}")
+        client = self.clients.get(name)
+        if client is None or client.is_closed:
+            client = self._create_client(name)
+            self.clients[name] = client
+        return client
+
+    def serves_fresh(self, name: str, request: httpx.Request) -> bool:
+        """Whether the provider's HTTP cache would answer the request without an upstream call"""
+        cache = self.http_caches.get(name)
+        return cache is not None and cache.serves_fresh(request)
+
+    def get_http_cache_stats(self) -> Dict[str, dict]:
+        return {name: cache.get_stats() for name, cache in self.http_caches.items()}
+
+    def _http_cache_size(self) -> int:
+        return sum(cache.approx_size() for cache in self.http_caches.values())
+    
+    def _evict_http_cache(self, bytes_to_free: int) -> int:
+        freed = 0
+        for cache in self.http_caches.values():
+            if freed >= bytes_to_free:
+                break
+            freed += cache.evict(bytes_to_free - freed)
+        return freed
+    
+    def get_cassette_stats(self) -> Dict[str, dict]:
+        return {name: cassette.get_stats() for name, cassette in self.cassettes.items()}
+
+    async def _warm_up(self, name: str, url: str):
+        try:
+            await self.get(name).head(url, timeout=5.0)
+            logger.debug(f"Warmed up HTTP pool for {name}")
+        except Exception as e:
+            logger.warning(f"Warm-up for {name} failed: {e}")
+
+    async def start(self):
+        """Create the enabled provider clients and open their first connections"""
+        warmups = []
+        for name, config in self._provider_config().items():
+            if not config["enabled"]:
+                continue
+            self.get(name)
+            # Replayed providers have no connections to open, and warm-ups would pollute recordings
+            if config["warmup_url"] and settings.provider_transport_mode == "live":
+                warmups.append(self._warm_up(name, config["warmup_url"]))
+
+        await asyncio.gather(*warmups)
+        logger.info(
+            f"HTTP client pools started: {', '.join(self.clients)} "
+            f"(http2={'on' if settings.http2_enabled and HTTP2_AVAILABLE else 'off'}, "
+            f"transport={settings.provider_transport_mode})"
+        )
+
+    async def close(self):
+        self._closed = True
+        for name, client in list(self.clients.items()):
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.error(f"Error closing HTTP client {name}: {e}")
+        self.clients.clear()
+        self.http_caches.clear()
+        self.cassettes.clear()
+
+
+# Global HTTP client pool
+http_clients = HTTPClientPool()
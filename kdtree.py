@@ -0,0 +1,56 @@
+"""Static k-d tree over points on the unit sphere (standard library only)"""
+import math
+from typing import Sequence, Tuple
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def unit_vector(lat: float, lon: float) -> Tuple[float, float, float]:
+    """Point on the unit sphere; straight-line distance between these orders points like
+    great-circle distance, without the wrap-around at the antimeridian"""
+    phi, lam = math.radians(lat), math.radians(lon)
+    return math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi)
+
+
+class KDTree:
+    """Static 3-d tree laid out implicitly: each index range is split at its median,
+    which is the node itself, so no node objects are allocated"""
+
+    def __init__(self, points: Sequence[Tuple[float, float, float]]):
+        self.points = points
+        self.order = list(range(len(points)))
+        stack = [(0, len(points), 0)]
+        while stack:
+            low, high, axis = stack.pop()
+            if high - low <= 1:
+                continue
+            self.order[low:high] = sorted(self.order[low:high], key=lambda i: points[i][axis])
+            middle = (low + high) // 2
+            stack.append((low, middle, (axis + 1) % 3))
+            stack.append((middle + 1, high, (axis + 1) % 3))
+
+    def nearest(self, target: Tuple[float, float, float]) -> Tuple[int, float]:
+        """Index of the closest point and its squared straight-line distance"""
+        best = [-1, math.inf]
+        self._search(target, 0, len(self.order), 0, best)
+        return best[0], best[1]
+
+    def _search(self, target, low: int, high: int, axis: int, best: list):
+        if low >= high:
+            return
+        middle = (low + high) // 2
+        index = self.order[middle]
+        point = self.points[index]
+        distance = (
+            (target[0] - point[0]) ** 2 + (target[1] - point[1]) ** 2 + (target[2] - point[2]) ** 2
+        )
+        if distance < best[1]:
+            best[0], best[1] = index, distance
+
+        offset = target[axis] - point[axis]
+        near, far = ((low, middle), (middle + 1, high)) if offset < 0 else ((middle + 1, high), (low, middle))
+        next_axis = (axis + 1) % 3
+        self._search(target, near[0], near[1], next_axis, best)
+        # The other side can only hold a closer point if the splitting plane is closer than the best so far
+        if offset * offset < best[1]:
+            self._search(target, far[0], far[1], next_axis, best)
@@ -1,5 +1,6 @@
 from typing import Dict, Any
 from config import SUPPORTED_LANGUAGES, DEFAULT_LANGUAGE
+from popular_cities import popular_city_buttons
 
 
 class Localization:
@@ -24,9 +25,11 @@ class Localization:
                 # City selection
                 "select_city": "🏙 Select your city:",
                 "enter_city": "✏️ Enter another city",
+                "search_city_inline": "🔎 Search as you type",
                 "city_not_found": "❌ City not found. Please try again.",
+                "near_city": "near {city}",
                 "city_set": "✅ City set to: {city}",
-                "enter_city_name": "Please enter your city name:",
+                "enter_city_name": "Please enter your city name or send your location 📍:",
                 
                 # Time selection
                 "select_time": "⏰ Select notification time:\n\n🌍 Time zone: Based on your city ({city})\n✅ You can set notifications for any time (e.g., 07:23, 08:47, 14:15)",
@@ -142,9 +145,11 @@ The bot will send you daily weather forecasts with clothing recommendations!""",
                 # City selection
                 "select_city": "🏙 Выберите ваш город:",
                 "enter_city": "✏️ Ввести другой город",
+                "search_city_inline": "🔎 Поиск по мере ввода",
                 "city_not_found": "❌ Город не найден. Попробуйте еще раз.",
+                "near_city": "{city} (окрестности)",
                 "city_set": "✅ Город установлен: {city}",
-                "enter_city_name": "Пожалуйста, введите название вашего города:",
+                "enter_city_name": "Пожалуйста, введите название вашего города или отправьте геолокацию 📍:",
                 
                 # Time selection
                 "select_time": "⏰ Выберите время уведомлений:\n\n🌍 Часовой пояс: По времени вашего города ({city})\n✅ Можно установить уведомления на любое время (например, 07:23, 08:47, 14:15)",
@@ -260,9 +265,11 @@ The bot will send you daily weather forecasts with clothing recommendations!""",
                 # City selection
                 "select_city": "🏙 Оберіть ваше місто:",
                 "enter_city": "✏️ Ввести інше місто",
+                "search_city_inline": "🔎 Пошук під час введення",
                 "city_not_found": "❌ Місто не знайдено. Спробуйте ще раз.",
+                "near_city": "{city} (околиці)",
                 "city_set": "✅ Місто встановлено: {city}",
-                "enter_city_name": "Будь ласка, введіть назву вашого міста:",
+                "enter_city_name": "Будь ласка, введіть назву вашого міста або надішліть геолокацію 📍:",
                 
                 # Time selection
                 "select_time": "⏰ Оберіть час сповіщень:\n\n🌍 Часовий пояс: За часом вашого міста ({city})\n✅ Можна встановити сповіщення на будь-який час (наприклад, 07:23, 08:47, 14:15)",
@@ -399,19 +406,7 @@ The bot will send you daily weather forecasts with clothing recommendations!""",
     
     def get_popular_cities(self, language: str):
         """Get popular cities for the language"""
-        cities = self.translations.get(language, {}).get("popular_cities", {})
-        if language == "ru":
-            return [
-                [("🇺🇸 Нью-Йорк", "city_New York"), ("🇬🇧 Лондон", "city_London")],
-                [("🇩🇪 Берлин", "city_Berlin"), ("🇫🇷 Париж", "city_Paris")],
-                [("🇯🇵 Токио", "city_Tokyo"), ("🇦🇺 Сидней", "city_Sydney")]
-            ]
-        else:
-            return [
-                [("🇺🇸 New York", "city_New York"), ("🇬🇧 London", "city_London")],
-                [("🇩🇪 Berlin", "city_Berlin"), ("🇫🇷 Paris", "city_Paris")],
-                [("🇯🇵 Tokyo", "city_Tokyo"), ("🇦🇺 Sydney", "city_Sydney")]
-            ]
+        return popular_city_buttons(language)
     
     def get_time_slots(self, language: str):
         """Get time slot buttons"""
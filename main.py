@@ -2,17 +2,23 @@ import asyncio
 import logging
 from contextlib import asynccontextmanager
 from datetime import datetime
+from typing import List
 
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import JSONResponse
+from pydantic import BaseModel
 import uvicorn
 
 from config import settings
-from database import init_db
+from database import DatabaseManager, init_db, user_cache
 from bot import weather_bot, dp
 from scheduler import notification_scheduler
 from monitoring import app_monitor, get_system_status
 from weather_api import weather_api
+from nearest_city import nearest_city
+from http_clients import http_clients
+from memory_budget import memory_budget
+from quota_ledger import quota_ledger
 
 # Configure logging
 logging.basicConfig(
@@ -30,6 +36,22 @@ async def lifespan(app: FastAPI):
         await init_db()
         logger.info("Database initialized")
         
+        await quota_ledger.load()
+        
+        # Before handlers are registered, so no city is cached while the index loads
+        await DatabaseManager.load_city_index()
+        logger.info("City index loaded")
+        
+        # Built in a worker thread now, so no location message waits for it
+        await nearest_city.refresh()
+        
+        backfilled = await DatabaseManager.backfill_user_timezones()
+        if backfilled:
+            logger.info(f"Resolved timezones for {backfilled} users from their cities")
+        
+        await http_clients.start()
+        logger.info("HTTP client pools warmed up")
+        
         weather_bot.register_handlers()
         logger.info("Bot handlers registered")
         
@@ -54,9 +76,15 @@ async def lifespan(app: FastAPI):
         await notification_scheduler.stop()
         logger.info("Scheduler stopped")
         
+        await quota_ledger.flush()
+        logger.info("Provider usage saved")
+        
         await weather_api.close()
         logger.info("Weather API client closed")
         
+        await http_clients.close()
+        logger.info("HTTP client pools closed")
+        
         if settings.webhook_url:
             await weather_bot.bot.delete_webhook()
             logger.info("Webhook deleted")
@@ -186,7 +214,12 @@ async def get_status():
 @app.get("/metrics")
 async def get_metrics():
     try:
-        return app_monitor.performance.get_metrics()
+        return {
+            **app_monitor.performance.get_metrics(),
+            "cache": await weather_api.get_cache_stats(),
+            "memory": memory_budget.get_stats(),
+            "user_cache": user_cache.get_stats()
+        }
     except Exception as e:
         logger.error(f"Metrics endpoint error: {e}")
         raise HTTPException(status_code=500, detail="Failed to get metrics")
@@ -236,6 +269,41 @@ async def get_scheduler_status():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+class CacheWarmRequest(BaseModel):
+    cities: List[str]
+    language: str = "en"
+    days: int = 1
+
+
+@app.get("/admin/cache/entry/{key:path}")
+async def inspect_cache_entry(key: str):
+    try:
+        return await weather_api.inspect_cache(key)
+    except Exception as e:
+        logger.error(f"Cache inspect error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/admin/cache/flush")
+async def flush_cache(prefix: str = ""):
+    try:
+        removed = await weather_api.flush_cache(prefix)
+        return {"status": "success", "prefix": prefix, **removed}
+    except Exception as e:
+        logger.error(f"Cache flush error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/admin/cache/warm")
+async def warm_cache(request: CacheWarmRequest):
+    try:
+        results = await weather_api.warm_cache(request.cities, request.language, request.days)
+        return {"status": "success", "results": results}
+    except Exception as e:
+        logger.error(f"Cache warm error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.post("/admin/setup-webhook")
 async def setup_webhook_endpoint():
     try:
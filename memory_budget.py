@@ -0,0 +1,121 @@
+import logging
+import sys
+from itertools import islice
+from typing import Callable, Dict
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Entries inspected per container when extrapolating its size
+SIZE_SAMPLE = 50
+
+# Eviction order: caches with a lower priority give up memory first
+PRIORITY_DIAGNOSTICS = 0
+PRIORITY_THROTTLE = 10
+PRIORITY_HTTP_CACHE = 20
+PRIORITY_FORECASTS = 30
+PRIORITY_USER_PROFILES = 35
+PRIORITY_SESSIONS = 40
+
+
+def deep_sizeof(obj, _seen=None) -> int:
+    """Approximate size of an object and everything it holds through containers and attributes"""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(key, _seen) + deep_sizeof(value, _seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, _seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), _seen)
+    return size
+
+
+def estimate_size(container, sample: int = SIZE_SAMPLE) -> int:
+    """Container size, extrapolated from its first entries when it is large"""
+    count = len(container)
+    if count <= sample:
+        return deep_sizeof(container)
+    entries = islice(container.items() if isinstance(container, dict) else container, sample)
+    sampled = sum(deep_sizeof(entry) for entry in entries)
+    return sys.getsizeof(container) + sampled * count // sample
+
+
+class RegisteredCache:
+    def __init__(self, name: str, size: Callable[[], int], evict: Callable[[int], int], priority: int):
+        self.name = name
+        self.size = size
+        self.evict = evict
+        self.priority = priority
+        self.evicted_bytes = 0
+
+
+class MemoryBudget:
+    """One byte budget across the in-process caches, enforced by priority-based eviction"""
+
+    def __init__(self):
+        self.caches: Dict[str, RegisteredCache] = {}
+
+    @property
+    def budget_bytes(self) -> int:
+        return settings.memory_budget_mb * 1024 * 1024
+
+    def register(self, name: str, size: Callable[[], int], evict: Callable[[int], int], priority: int):
+        """Track a cache: size() estimates its bytes, evict(n) frees about n bytes and returns what it freed"""
+        self.caches[name] = RegisteredCache(name, size, evict, priority)
+
+    def usage(self) -> Dict[str, int]:
+        usage = {}
+        for name, cache in self.caches.items():
+            try:
+                usage[name] = cache.size()
+            except Exception as e:
+                logger.warning(f"Could not size cache {name}: {e}")
+                usage[name] = 0
+        return usage
+
+    def enforce(self) -> int:
+        """Evict from the lowest-priority caches until the total fits the budget; returns bytes freed"""
+        excess = sum(self.usage().values()) - self.budget_bytes
+        if excess <= 0:
+            return 0
+
+        freed = 0
+        for cache in sorted(self.caches.values(), key=lambda cache: cache.priority):
+            if freed >= excess:
+                break
+            try:
+                released = cache.evict(excess - freed)
+            except Exception as e:
+                logger.error(f"Eviction from {cache.name} failed: {e}")
+                continue
+            cache.evicted_bytes += released
+            freed += released
+
+        logger.warning(f"Memory budget exceeded by {excess} bytes, evicted {freed}")
+        return freed
+
+    def get_stats(self) -> Dict:
+        usage = self.usage()
+        return {
+            "budget_bytes": self.budget_bytes,
+            "used_bytes": sum(usage.values()),
+            "caches": {
+                name: {
+                    "bytes": usage[name],
+                    "priority": cache.priority,
+                    "evicted_bytes": cache.evicted_bytes
+                }
+                for name, cache in self.caches.items()
+            }
+        }
+
+
+# Global memory budget
+memory_budget = MemoryBudget()
@@ -5,8 +5,11 @@ from datetime import datetime
 from typing import Dict, Any, Optional
 import json
 
-from config import settings
+from config import BETTER_STACK_URL, settings
 from database import DatabaseManager
+from http_clients import http_clients
+from memory_budget import PRIORITY_DIAGNOSTICS, estimate_size, memory_budget
+from quota_ledger import quota_ledger
 
 # Configure structured logging
 structlog.configure(
@@ -43,8 +46,6 @@ class BetterStackLogger:
             return
             
         try:
-            import httpx
-            
             log_data = {
                 "dt": datetime.utcnow().isoformat(),
                 "level": level.upper(),
@@ -58,13 +59,12 @@ class BetterStackLogger:
                 "Content-Type": "application/json"
             }
             
-            async with httpx.AsyncClient() as client:
-                await client.post(
-                    "https://in.logs.betterstack.com/",
-                    json=log_data,
-                    headers=headers,
-                    timeout=10
-                )
+            await http_clients.get("betterstack").post(
+                BETTER_STACK_URL,
+                json=log_data,
+                headers=headers,
+                timeout=10
+            )
                 
         except Exception as e:
             # Don't let logging errors break the application
@@ -87,6 +87,12 @@ class PerformanceMonitor:
             "active_users_24h": 0
         }
         self.response_times = []
+        memory_budget.register(
+            "response_times",
+            lambda: estimate_size(self.response_times),
+            self._evict_response_times,
+            PRIORITY_DIAGNOSTICS
+        )
         
     def increment_metric(self, metric_name: str, value: int = 1):
         """Increment a metric counter"""
@@ -100,6 +106,15 @@ class PerformanceMonitor:
         if len(self.response_times) > 1000:
             self.response_times = self.response_times[-1000:]
     
+    def _evict_response_times(self, bytes_to_free: int) -> int:
+        """Drop the oldest response time samples"""
+        if not self.response_times:
+            return 0
+        per_sample = max(1, estimate_size(self.response_times) // len(self.response_times))
+        count = min(len(self.response_times), bytes_to_free // per_sample + 1)
+        del self.response_times[:count]
+        return count * per_sample
+    
     def get_metrics(self) -> Dict[str, Any]:
         """Get current metrics"""
         avg_response_time = sum(self.response_times) / len(self.response_times) if self.response_times else 0
@@ -344,6 +359,7 @@ class ApplicationMonitor:
                 "health_checks": health_status["checks"],
                 "metrics": metrics,
                 "last_health_check": health_status["timestamp"],
+                "provider_quotas": quota_ledger.get_stats(),
                 "environment": settings.environment
             }
             
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import math
+import time
+from typing import List, NamedTuple, Optional, Tuple
+
+from city_index import city_index
+from city_timezone_mapper import approximate_timezone
+from kdtree import EARTH_RADIUS_KM, KDTree, unit_vector
+from offline_cities import offline_cities
+from weather_api import BUILTIN_CITIES
+
+logger = logging.getLogger(__name__)
+
+# Cached cities added since the last build are picked up at most this often
+REBUILD_INTERVAL = 600  # seconds
+
+# Shared locations closer than this to a known city use the city's coordinates,
+# so the forecast is shared with everyone else in that city
+SNAP_DISTANCE_KM = 50.0
+# Farther than that but within this, a location is labelled "near <city>"; beyond it
+# the city says nothing useful and only the coordinates are shown
+NEAR_DISTANCE_KM = 100.0
+
+
+class NearbyCity(NamedTuple):
+    name: str
+    country: str
+    latitude: float
+    longitude: float
+    timezone: str
+    distance_km: float
+
+
+class NearestCityIndex:
+    """Offline coordinates -> nearest known city, over the GeoNames dataset,
+    the builtin cities and the city cache. Built at startup and rebuilt in a worker thread;
+    lookups use the previous tree until the new one replaces it in a single assignment"""
+
+    def __init__(self):
+        self._index: Optional[Tuple[KDTree, List[Tuple[str, str, float, float, Optional[str]]]]] = None
+        self._cached_rows = 0
+        self._built_at = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    async def refresh(self):
+        """(Re)build off the event loop from a snapshot of the city cache"""
+        rows = city_index.rows()
+        await asyncio.to_thread(self._build, rows)
+
+    def _build(self, cached_rows: List):
+        started = time.monotonic()
+        cities = {}
+        for place in offline_cities.iter_places():
+            cities[(place.latitude, place.longitude)] = (
+                place.name, place.country, place.latitude, place.longitude, place.timezone
+            )
+        # Latin spellings win for builtin cities listed in several scripts
+        for city in sorted(BUILTIN_CITIES.values(), key=lambda city: not city["name"].isascii()):
+            cities.setdefault(
+                (city["lat"], city["lon"]), (city["name"], city["country"], city["lat"], city["lon"], None)
+            )
+        for row in cached_rows:
+            latitude, longitude = float(row.latitude), float(row.longitude)
+            name = (row.display_name or row.city_name).split(",")[0]
+            cities.setdefault((latitude, longitude), (name, row.country, latitude, longitude, None))
+
+        city_list = list(cities.values())
+        self._index = (KDTree([unit_vector(city[2], city[3]) for city in city_list]), city_list)
+        self._cached_rows = len(cached_rows)
+        self._built_at = time.monotonic()
+        logger.info(
+            f"Nearest-city index built: {len(city_list)} cities in {self._built_at - started:.2f}s"
+        )
+
+    def _ensure_built(self):
+        if self._index is None:
+            # Only before startup has built it, e.g. in scripts
+            self._build(city_index.rows())
+            return
+        
+        stale = len(city_index) != self._cached_rows and time.monotonic() - self._built_at >= REBUILD_INTERVAL
+        if not stale or (self._refresh_task and not self._refresh_task.done()):
+            return
+        try:
+            self._refresh_task = asyncio.get_running_loop().create_task(self.refresh())
+        except RuntimeError:
+            self._build(city_index.rows())
+
+    def nearest(self, lat: float, lon: float) -> Optional[NearbyCity]:
+        self._ensure_built()
+        tree, cities = self._index
+        if not cities:
+            return None
+        index, chord_squared = tree.nearest(unit_vector(lat, lon))
+        name, country, city_lat, city_lon, timezone = cities[index]
+        distance = 2 * math.asin(min(1.0, math.sqrt(chord_squared) / 2)) * EARTH_RADIUS_KM
+        return NearbyCity(
+            name,
+            country,
+            city_lat,
+            city_lon,
+            timezone or approximate_timezone(city_lat, city_lon),
+            round(distance, 1)
+        )
+
+    def __len__(self) -> int:
+        return len(self._index[1]) if self._index else 0
+
+
+# Global nearest-city index, built on the first lookup
+nearest_city = NearestCityIndex()
@@ -0,0 +1,142 @@
+import logging
+import mmap
+import os
+import struct
+from typing import Iterator, List, NamedTuple, Optional
+
+from city_names import normalize_name
+from config import settings
+from data_formats import CITIES_HEADER as HEADER, CITIES_KEY as KEY, CITIES_MAGIC as MAGIC
+from data_formats import CITIES_PLACE as PLACE, STRING_LENGTH
+
+logger = logging.getLogger(__name__)
+
+# Prefix matches are only tried for queries at least this long, and only this many keys are scanned
+MIN_PREFIX_LENGTH = 3
+PREFIX_SCAN_LIMIT = 500
+
+
+class OfflinePlace(NamedTuple):
+    name: str
+    latitude: float
+    longitude: float
+    country: str
+    timezone: str
+    population: int
+
+
+class OfflineCities:
+    """Memory-mapped world cities dataset with a sorted name index"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._map: Optional[mmap.mmap] = None
+        self._tried = False
+        self.places = 0
+        self.keys = 0
+
+    def _open(self) -> bool:
+        """Map the dataset on first use; a missing file just disables offline lookups"""
+        if self._tried:
+            return self._map is not None
+        self._tried = True
+
+        if not self.path or not os.path.exists(self.path):
+            logger.info("Offline cities dataset not found, offline lookups disabled")
+            return False
+
+        try:
+            with open(self.path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, self.places, self.keys, self._places_offset, self._keys_offset, self._strings_offset = (
+                HEADER.unpack_from(mapped, 0)
+            )
+            if magic != MAGIC:
+                mapped.close()
+                logger.error(f"{self.path} is not an offline cities dataset")
+                return False
+        except (OSError, struct.error) as e:
+            logger.error(f"Failed to open offline cities dataset: {e}")
+            return False
+
+        self._map = mapped
+        logger.info(f"Offline cities dataset mapped: {self.places} places, {self.keys} names")
+        return True
+
+    @property
+    def available(self) -> bool:
+        return self._open()
+
+    def _raw_string(self, offset: int) -> bytes:
+        start = self._strings_offset + offset
+        (length,) = STRING_LENGTH.unpack_from(self._map, start)
+        start += STRING_LENGTH.size
+        return self._map[start:start + length]
+
+    def _key(self, index: int):
+        key_offset, place_index = KEY.unpack_from(self._map, self._keys_offset + index * KEY.size)
+        return self._raw_string(key_offset), place_index
+
+    def _lower_bound(self, target: bytes) -> int:
+        low, high = 0, self.keys
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle)[0] < target:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def place(self, index: int) -> OfflinePlace:
+        lat, lon, population, name, country, timezone = PLACE.unpack_from(
+            self._map, self._places_offset + index * PLACE.size
+        )
+        return OfflinePlace(
+            self._raw_string(name).decode(),
+            round(lat, 4),
+            round(lon, 4),
+            self._raw_string(country).decode(),
+            self._raw_string(timezone).decode(),
+            population
+        )
+
+    def iter_places(self) -> Iterator[OfflinePlace]:
+        """Every place in file order"""
+        if not self._open():
+            return
+        for index in range(self.places):
+            yield self.place(index)
+
+    def search(self, query: str, limit: int = 5, exact_only: bool = False) -> List[OfflinePlace]:
+        """Places named exactly like the query, or starting with it when nothing matches exactly
+        (unless exact_only); larger places first"""
+        if not self._open():
+            return []
+        normalized = normalize_name(query)
+        if not normalized:
+            return []
+        target = normalized.encode()
+
+        exact, prefixed = [], []
+        index = self._lower_bound(target)
+        for index in range(index, min(self.keys, index + PREFIX_SCAN_LIMIT)):
+            key, place_index = self._key(index)
+            if not key.startswith(target):
+                break
+            (exact if key == target else prefixed).append(place_index)
+
+        if not exact and (exact_only or len(normalized) < MIN_PREFIX_LENGTH):
+            return []
+        candidates = [self.place(place_index) for place_index in dict.fromkeys(exact or prefixed)]
+        candidates.sort(key=lambda place: place.population, reverse=True)
+        return candidates[:limit]
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._tried = False
+
+
+# Global offline dataset, mapped on first lookup
+offline_cities = OfflineCities(settings.offline_cities_path)
@@ -0,0 +1,77 @@
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from city_names import match_key
+from config import settings
+
+
+class PopularCity(NamedTuple):
+    key: str
+    latitude: float
+    longitude: float
+    timezone: str
+    flag: str
+    names: Dict[str, str]  # language -> display name
+
+    def name(self, language: str) -> str:
+        return self.names.get(language) or self.names["en"]
+
+
+# Cities offered as buttons; a tap is resolved from here without any geocoding
+POPULAR_CITIES = {
+    city.key: city
+    for city in (
+        PopularCity("new_york", 40.7128, -74.0060, "America/New_York", "🇺🇸",
+                    {"en": "New York", "ru": "Нью-Йорк", "uk": "Нью-Йорк"}),
+        PopularCity("london", 51.5074, -0.1278, "Europe/London", "🇬🇧",
+                    {"en": "London", "ru": "Лондон", "uk": "Лондон"}),
+        PopularCity("berlin", 52.5200, 13.4050, "Europe/Berlin", "🇩🇪",
+                    {"en": "Berlin", "ru": "Берлин", "uk": "Берлін"}),
+        PopularCity("paris", 48.8566, 2.3522, "Europe/Paris", "🇫🇷",
+                    {"en": "Paris", "ru": "Париж", "uk": "Париж"}),
+        PopularCity("tokyo", 35.6762, 139.6503, "Asia/Tokyo", "🇯🇵",
+                    {"en": "Tokyo", "ru": "Токио", "uk": "Токіо"}),
+        PopularCity("sydney", -33.8688, 151.2093, "Australia/Sydney", "🇦🇺",
+                    {"en": "Sydney", "ru": "Сидней", "uk": "Сідней"}),
+        PopularCity("kyiv", 50.4501, 30.5234, "Europe/Kyiv", "🇺🇦",
+                    {"en": "Kyiv", "ru": "Киев", "uk": "Київ"}),
+        PopularCity("lviv", 49.8397, 24.0297, "Europe/Kyiv", "🇺🇦",
+                    {"en": "Lviv", "ru": "Львов", "uk": "Львів"}),
+        PopularCity("odesa", 46.4825, 30.7233, "Europe/Kyiv", "🇺🇦",
+                    {"en": "Odesa", "ru": "Одесса", "uk": "Одеса"}),
+        PopularCity("kharkiv", 49.9935, 36.2304, "Europe/Kyiv", "🇺🇦",
+                    {"en": "Kharkiv", "ru": "Харьков", "uk": "Харків"}),
+        PopularCity("warsaw", 52.2297, 21.0122, "Europe/Warsaw", "🇵🇱",
+                    {"en": "Warsaw", "ru": "Варшава", "uk": "Варшава"}),
+        PopularCity("moscow", 55.7558, 37.6176, "Europe/Moscow", "🇷🇺",
+                    {"en": "Moscow", "ru": "Москва", "uk": "Москва"}),
+    )
+}
+
+# Buttons per language, two per row; POPULAR_CITY_LAYOUTS in the environment overrides these
+DEFAULT_LAYOUT = ["new_york", "london", "berlin", "paris", "tokyo", "sydney"]
+POPULAR_CITY_LAYOUTS = {
+    "en": DEFAULT_LAYOUT,
+    "ru": DEFAULT_LAYOUT,
+    "uk": DEFAULT_LAYOUT
+}
+
+# Earlier buttons carried the English name ("city_New York"), so old messages still resolve
+_BY_NAME = {match_key(name): city for city in POPULAR_CITIES.values() for name in city.names.values()}
+
+
+def find_popular_city(value: str) -> Optional[PopularCity]:
+    """Registry entry for a button key or any of its names"""
+    return POPULAR_CITIES.get(value) or _BY_NAME.get(match_key(value))
+
+
+def popular_city_layout(language: str) -> List[PopularCity]:
+    """Registry entries offered as buttons to the language, in button order"""
+    layout = settings.popular_city_layouts.get(language) or POPULAR_CITY_LAYOUTS.get(language, DEFAULT_LAYOUT)
+    return [POPULAR_CITIES[key] for key in layout if key in POPULAR_CITIES]
+
+
+def popular_city_buttons(language: str) -> List[List[Tuple[str, str]]]:
+    """Keyboard rows of (text, callback data) for the language's popular cities"""
+    cities = popular_city_layout(language)
+    buttons = [(f"{city.flag} {city.name(language)}", f"city_{city.key}") for city in cities]
+    return [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
@@ -0,0 +1,138 @@
+import asyncio
+import json
+import logging
+import os
+import random
+from collections import defaultdict
+from typing import Dict, List, Optional
+from urllib.parse import urlencode
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Query parameters that carry API keys; they are never written to cassettes or used for matching
+REDACTED_PARAMS = {"key", "api_key"}
+
+# Body is stored decoded, so these no longer describe it
+_DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+
+def cassette_path(cassette_dir: str, provider: str) -> str:
+    return os.path.join(cassette_dir, f"{provider}.json")
+
+
+def cassette_key(method: str, url: httpx.URL) -> str:
+    """Match key for a request: method and URL with sorted, key-free query parameters"""
+    params = sorted((name, value) for name, value in url.params.multi_items() if name not in REDACTED_PARAMS)
+    return f"{method} {url.copy_with(query=None)}?{urlencode(params)}"
+
+
+def _load_cassette(path: str) -> List[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return json.load(f).get("interactions", [])
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """Passes requests through to the real transport and saves every response to a cassette file"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, path: str):
+        self._transport = transport
+        self.path = path
+        self.interactions = _load_cassette(path)
+        self.recorded = 0
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"interactions": self.interactions}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        response = await self._transport.handle_async_request(request)
+        content = await response.aread()
+        await response.aclose()
+        headers = [(name, value) for name, value in response.headers.multi_items() if name.lower() not in _DROPPED_HEADERS]
+
+        self.interactions.append({
+            "request": {"method": request.method, "key": cassette_key(request.method, request.url)},
+            "response": {
+                "status_code": response.status_code,
+                "headers": headers,
+                "body": content.decode("utf-8", errors="replace")
+            }
+        })
+        self.recorded += 1
+        self._save()
+
+        return httpx.Response(response.status_code, headers=headers, content=content, request=request)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"recorded": self.recorded, "interactions": len(self.interactions)}
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """Serves recorded responses with optional injected latency, connection errors and 429s"""
+
+    def __init__(self, path: str, latency: float = 0.0, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, seed: Optional[int] = None):
+        self.path = path
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self._random = random.Random(seed)
+
+        self._responses: Dict[str, List[dict]] = defaultdict(list)
+        for interaction in _load_cassette(path):
+            self._responses[interaction["request"]["key"]].append(interaction["response"])
+        # Repeated requests walk through their recordings in order, then cycle
+        self._positions: Dict[str, int] = defaultdict(int)
+
+        self.stats = {"replayed": 0, "missing": 0, "injected_errors": 0, "injected_429": 0}
+        logger.info(f"Replaying {sum(map(len, self._responses.values()))} recorded responses from {path}")
+
+    async def _delay(self, request: httpx.Request):
+        if self.latency <= 0:
+            return
+        # Honour the client's read timeout so slow replays fail the way a slow upstream would
+        read_timeout = request.extensions.get("timeout", {}).get("read")
+        if read_timeout is not None and self.latency > read_timeout:
+            await asyncio.sleep(read_timeout)
+            raise httpx.ReadTimeout("Injected latency exceeded the read timeout", request=request)
+        await asyncio.sleep(self.latency)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await self._delay(request)
+
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.stats["injected_errors"] += 1
+            raise httpx.ConnectError("Injected connection error", request=request)
+
+        if self.rate_limit_rate and self._random.random() < self.rate_limit_rate:
+            self.stats["injected_429"] += 1
+            return httpx.Response(429, headers={"Retry-After": "1"}, request=request)
+
+        key = cassette_key(request.method, request.url)
+        recordings = self._responses.get(key)
+        if not recordings:
+            self.stats["missing"] += 1
+            raise httpx.ConnectError(f"No recorded response for {key}", request=request)
+
+        recorded = recordings[self._positions[key] % len(recordings)]
+        self._positions[key] += 1
+        self.stats["replayed"] += 1
+        return httpx.Response(
+            recorded["status_code"],
+            headers=recorded["headers"],
+            content=recorded["body"].encode("utf-8"),
+            request=request
+        )
+
+    def get_stats(self) -> Dict[str, int]:
+        return dict(self.stats)
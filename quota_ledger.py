@@ -0,0 +1,99 @@
+import logging
+from collections import Counter
+from datetime import date, datetime
+from typing import Dict, Optional
+
+from config import settings
+from database import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+
+class QuotaLedger:
+    """Daily call counts per provider, persisted so quota usage survives restarts
+
+    Calls are counted in memory and flushed to the provider_usage table by the
+    scheduler; days are UTC, matching how the providers reset their quotas.
+    """
+
+    def __init__(self):
+        self.day: date = datetime.utcnow().date()
+        self.used = Counter()
+        self._pending = Counter()  # (provider, day) -> calls not yet written
+
+    def _budgets(self) -> Dict[str, int]:
+        return {
+            "locationiq": settings.locationiq_daily_quota,
+            "weather_api": settings.weather_api_daily_quota,
+            "open_meteo": settings.open_meteo_daily_quota
+        }
+
+    def _roll_day(self):
+        today = datetime.utcnow().date()
+        if today != self.day:
+            self.day = today
+            self.used.clear()
+
+    async def load(self):
+        """Start from today's persisted counts"""
+        self._roll_day()
+        try:
+            persisted = await DatabaseManager.get_provider_usage(self.day)
+        except Exception as e:
+            logger.error(f"Failed to load provider usage: {e}")
+            return
+        for provider, calls in persisted.items():
+            self.used[provider] += calls
+        logger.info(f"Provider usage for {self.day}: {dict(self.used)}")
+
+    async def flush(self):
+        """Write the calls counted since the last flush"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, Counter()
+        try:
+            await DatabaseManager.add_provider_usage(dict(pending))
+        except Exception as e:
+            logger.error(f"Failed to persist provider usage: {e}")
+            self._pending.update(pending)
+
+    def record(self, provider: str):
+        self._roll_day()
+        self.used[provider] += 1
+        self._pending[(provider, self.day)] += 1
+
+    def remaining(self, provider: str) -> Optional[int]:
+        """Calls left today, or None when the provider has no budget"""
+        budget = self._budgets().get(provider, 0)
+        if budget <= 0:
+            return None
+        self._roll_day()
+        return max(0, budget - self.used[provider])
+
+    def near_limit(self, provider: str) -> bool:
+        """Whether usage reached the soft limit, after which cheaper paths are preferred"""
+        budget = self._budgets().get(provider, 0)
+        if budget <= 0:
+            return False
+        self._roll_day()
+        return self.used[provider] >= budget * settings.quota_soft_limit
+
+    def exhausted(self, provider: str) -> bool:
+        return self.remaining(provider) == 0
+
+    def get_stats(self) -> Dict[str, dict]:
+        self._roll_day()
+        return {
+            provider: {
+                "budget": budget,
+                "used": self.used[provider],
+                "remaining": self.remaining(provider),
+                "near_limit": self.near_limit(provider)
+            }
+            for provider, budget in self._budgets().items()
+            if budget > 0
+        }
+
+
+# Global quota ledger
+quota_ledger = QuotaLedger()
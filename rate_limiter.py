@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Tuple
+
+from config import settings
+from deadlines import DeadlineExceeded, current_deadline
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Async token bucket shared by every caller of one provider
+
+    Callers queue on an asyncio.Lock, which hands itself over in FIFO order,
+    so only the head of the queue sleeps for the next token and the rest
+    are served strictly in arrival order. Under a deadline, callers neither
+    join a queue that cannot clear in time nor wait on the lock past it.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        self.waiting = 0
+        self.stats = {"acquired": 0, "delayed": 0, "rejected": 0, "total_wait": 0.0, "max_wait": 0.0}
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> float:
+        """Wait for a token and return how long that took"""
+        started = time.monotonic()
+        active = current_deadline()
+        if active is not None:
+            # Everyone queued ahead takes a token first
+            self._refill()
+            expected = (self.waiting + 1 - self._tokens) / self.rate
+            if expected > active.remaining():
+                self.stats["rejected"] += 1
+                raise DeadlineExceeded("Rate limit queue exceeds the remaining budget")
+
+        self.waiting += 1
+        try:
+            if active is None:
+                await self._lock.acquire()
+            else:
+                try:
+                    await asyncio.wait_for(self._lock.acquire(), active.remaining())
+                except asyncio.TimeoutError:
+                    self.stats["rejected"] += 1
+                    raise DeadlineExceeded("Rate limit queue outlasted the remaining budget")
+            try:
+                self._refill()
+                if self._tokens < 1:
+                    delay = (1 - self._tokens) / self.rate
+                    if active is not None and active.remaining() < delay:
+                        self.stats["rejected"] += 1
+                        raise DeadlineExceeded("Rate limit wait exceeds the remaining budget")
+                    await asyncio.sleep(delay)
+                    self._refill()
+                self._tokens -= 1
+            finally:
+                self._lock.release()
+        finally:
+            self.waiting -= 1
+
+        waited = time.monotonic() - started
+        self.stats["acquired"] += 1
+        if waited > 0.001:
+            self.stats["delayed"] += 1
+        self.stats["total_wait"] += waited
+        self.stats["max_wait"] = max(self.stats["max_wait"], waited)
+        return waited
+
+    def get_stats(self) -> Dict:
+        acquired = self.stats["acquired"]
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "acquired": acquired,
+            "delayed": self.stats["delayed"],
+            "rejected": self.stats["rejected"],
+            "waiting": self.waiting,
+            "avg_wait": round(self.stats["total_wait"] / acquired, 3) if acquired else 0,
+            "max_wait": round(self.stats["max_wait"], 3)
+        }
+
+
+class RateLimiters:
+    """Per-provider token buckets configured from settings; providers without a rate are not limited"""
+
+    def __init__(self):
+        self.buckets: Dict[str, TokenBucket] = {}
+
+    def _limits(self) -> Dict[str, Tuple[float, int]]:
+        return {
+            "locationiq": (settings.locationiq_rate_limit, settings.locationiq_rate_burst),
+            "weather_api": (settings.weather_api_rate_limit, settings.weather_api_rate_burst),
+            "open_meteo": (settings.open_meteo_rate_limit, settings.open_meteo_rate_burst)
+        }
+
+    def get(self, provider: str) -> Optional[TokenBucket]:
+        if provider not in self.buckets:
+            rate, burst = self._limits().get(provider, (0, 1))
+            if rate <= 0:
+                return None
+            self.buckets[provider] = TokenBucket(rate, burst)
+        return self.buckets[provider]
+
+    async def acquire(self, provider: str) -> float:
+        bucket = self.get(provider)
+        if bucket is None:
+            return 0.0
+        waited = await bucket.acquire()
+        if waited > 1.0:
+            logger.debug(f"Waited {waited:.2f}s for {provider} rate limit")
+        return waited
+
+    def get_stats(self) -> Dict[str, dict]:
+        return {provider: bucket.get_stats() for provider, bucket in self.buckets.items()}
+
+
+# Global rate limiter registry
+rate_limiters = RateLimiters()
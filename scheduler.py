@@ -1,16 +1,24 @@
 import asyncio
 import logging
 from datetime import datetime, time, timedelta
-from typing import List
+from typing import Dict, List, Optional
 import pytz
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 
-from config import settings, KEEP_ALIVE_INTERVAL
+from config import (
+    settings, KEEP_ALIVE_INTERVAL, HOT_REFRESH_INTERVAL, MEMORY_CHECK_INTERVAL, QUOTA_FLUSH_INTERVAL,
+    DISK_CACHE_PURGE_INTERVAL
+)
 from database import DatabaseManager, User
 from weather_api import weather_api
+from http_clients import http_clients
+from forecast_refresher import forecast_refresher
+from deadlines import deadline
+from memory_budget import memory_budget
+from quota_ledger import quota_ledger
 from bot import weather_bot
 from localization import _
 from city_timezone_mapper import format_local_time
@@ -41,6 +49,39 @@ class NotificationScheduler:
                 name="Notification Checker"
             )
             
+            self.scheduler.add_job(
+                self.refresh_hot_forecasts,
+                IntervalTrigger(seconds=HOT_REFRESH_INTERVAL),
+                id="hot_forecast_refresh",
+                name="Hot Forecast Refresh",
+                max_instances=1
+            )
+            
+            self.scheduler.add_job(
+                self.enforce_memory_budget,
+                IntervalTrigger(seconds=MEMORY_CHECK_INTERVAL),
+                id="memory_budget",
+                name="Memory Budget Check",
+                max_instances=1
+            )
+            
+            self.scheduler.add_job(
+                self.flush_quota_ledger,
+                IntervalTrigger(seconds=QUOTA_FLUSH_INTERVAL),
+                id="quota_ledger_flush",
+                name="Provider Usage Flush",
+                max_instances=1
+            )
+            
+            if weather_api.disk_cache:
+                self.scheduler.add_job(
+                    self.purge_disk_cache,
+                    IntervalTrigger(seconds=DISK_CACHE_PURGE_INTERVAL),
+                    id="disk_cache_purge",
+                    name="Disk Cache Purge",
+                    max_instances=1
+                )
+            
             self.scheduler.start()
             logger.info("Optimized scheduler started with single checker job")
             
@@ -57,22 +98,45 @@ class NotificationScheduler:
     
     async def keep_alive_ping(self):
         try:
-            import httpx
-            
             if settings.webhook_url:
                 base_url = settings.webhook_url.replace("/webhook", "")
                 health_url = f"{base_url}/health"
                 
-                async with httpx.AsyncClient() as client:
-                    response = await client.get(health_url, timeout=10)
-                    if response.status_code == 200:
-                        logger.debug("Keep-alive ping successful")
-                    else:
-                        logger.warning(f"Keep-alive ping returned status {response.status_code}")
+                response = await http_clients.get("default").get(health_url, timeout=10)
+                if response.status_code == 200:
+                    logger.debug("Keep-alive ping successful")
+                else:
+                    logger.warning(f"Keep-alive ping returned status {response.status_code}")
             
         except Exception as e:
             logger.error(f"Keep-alive ping failed: {e}")
     
+    async def refresh_hot_forecasts(self):
+        try:
+            await forecast_refresher.refresh_hot_set()
+        except Exception as e:
+            logger.error(f"Hot forecast refresh failed: {e}")
+    
+    async def enforce_memory_budget(self):
+        try:
+            memory_budget.enforce()
+        except Exception as e:
+            logger.error(f"Memory budget check failed: {e}")
+    
+    async def flush_quota_ledger(self):
+        try:
+            await quota_ledger.flush()
+        except Exception as e:
+            logger.error(f"Provider usage flush failed: {e}")
+    
+    async def purge_disk_cache(self):
+        try:
+            removed = await weather_api.disk_cache.purge()
+            if removed:
+                logger.info(f"Purged {removed} expired disk cache entries")
+        except Exception as e:
+            logger.error(f"Disk cache purge failed: {e}")
+    
     async def check_notifications(self):
         if self.processing_notifications:
             logger.debug("Skipping notification check - already processing")
@@ -88,13 +152,18 @@ class NotificationScheduler:
             if users:
                 logger.info(f"Processing {len(users)} notifications for {time_str}")
                 
+                forecasts = await self.prefetch_forecasts(users)
+                
                 # Process in batches to avoid overwhelming the system
                 batch_size = 10  # Increased batch size
                 for i in range(0, len(users), batch_size):
                     batch = users[i:i + batch_size]
                     
                     # Process batch concurrently but with limited concurrency
-                    tasks = [self.send_weather_notification(user) for user in batch]
+                    tasks = [
+                        self.send_weather_notification(user, forecasts.get(self._forecast_request(user)))
+                        for user in batch
+                    ]
                     await asyncio.gather(*tasks, return_exceptions=True)
                     
                     # Reduced delay between batches
@@ -106,6 +175,24 @@ class NotificationScheduler:
         finally:
             self.processing_notifications = False
     
+    @staticmethod
+    def _forecast_request(user: User):
+        if not user.city or not user.city_lat or not user.city_lon:
+            return None
+        return (float(user.city_lat), float(user.city_lon), user.language, 1)
+    
+    async def prefetch_forecasts(self, users: List[User]) -> Dict:
+        """Fetch and post-process the forecasts for a whole notification tick in one batch"""
+        requests = [request for request in map(self._forecast_request, users) if request]
+        if not requests:
+            return {}
+        try:
+            with deadline(settings.notification_deadline):
+                return await weather_api.get_weather_forecasts(requests)
+        except Exception as e:
+            logger.warning(f"Forecast prefetch failed, fetching per user: {e}")
+            return {}
+    
     async def send_scheduled_notifications(self, notification_time: str):
         """Send notifications to users at specified time"""
         try:
@@ -134,19 +221,21 @@ class NotificationScheduler:
         except Exception as e:
             logger.error(f"Error in send_scheduled_notifications: {e}")
     
-    async def send_weather_notification(self, user: User):
+    async def send_weather_notification(self, user: User, weather_data: Optional[Dict] = None):
         """Send weather notification to a specific user"""
         try:
             if not user.city or not user.city_lat or not user.city_lon:
                 logger.warning(f"User {user.user_id} has incomplete location data")
                 return
             
-            # Get weather data
-            weather_data = await weather_api.get_weather_forecast(
-                float(user.city_lat),
-                float(user.city_lon),
-                user.language
-            )
+            # Get weather data unless the tick already prefetched it
+            if weather_data is None:
+                with deadline(settings.notification_deadline):
+                    weather_data = await weather_api.get_weather_forecast(
+                        float(user.city_lat),
+                        float(user.city_lon),
+                        user.language
+                    )
             
             if not weather_data:
                 logger.error(f"Failed to get weather data for user {user.user_id}")
@@ -157,8 +246,7 @@ class NotificationScheduler:
                 weather_data, 
                 user.city, 
                 user.language,
-                float(user.city_lat),
-                float(user.city_lon)
+                user.timezone
             )
             
             # Create keyboard
@@ -188,10 +276,10 @@ class NotificationScheduler:
             logger.error(f"Error sending notification to user {user.user_id}: {e}")
             raise
     
-    async def format_notification_message(self, weather_data: dict, city: str, language: str, city_lat: float, city_lon: float) -> str:
+    async def format_notification_message(self, weather_data: dict, city: str, language: str, timezone_name: str) -> str:
         """Format weather notification message"""
-        # Get local date for the city
-        local_date, local_time = format_local_time(city_lat, city_lon)
+        # Get local date in the user's stored timezone
+        local_date, local_time = format_local_time(timezone_name)
         # Convert date format from DD.MM.YYYY to YYYY-MM-DD
         day, month, year = local_date.split('.')
         today = f"{year}-{month}-{day}"
@@ -10,6 +10,7 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from weather_api import weather_api
+from http_clients import http_clients
 from config import settings
 
 async def test_locationiq():
@@ -128,6 +129,7 @@ async def main():
     finally:
         # Закрываем соединения
         await weather_api.close()
+        await http_clients.close()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,98 @@
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+logger = logging.getLogger(__name__)
+
+# How far ahead the next offset change is searched for, and the step of the coarse scan
+TRANSITION_HORIZON = 366 * 86400
+TRANSITION_SCAN_STEP = 7 * 86400
+# Offsets of zones without a change inside the horizon are rechecked after this long
+NO_TRANSITION_RECHECK = 86400
+
+
+class TimezoneService:
+    """Cached zoneinfo objects and UTC offsets, so render paths do no timezone math
+
+    Each zone's offset is kept until its next transition (DST or a rule change), found once
+    by scanning ahead and bisecting to the second; local date and time strings are
+    memoised per zone for the current minute.
+    """
+
+    def __init__(self):
+        self._zones: Dict[str, ZoneInfo] = {}
+        self._offsets: Dict[str, Tuple[float, timezone]] = {}  # zone -> (valid until, fixed offset)
+        self._formatted: Dict[str, Tuple[int, Tuple[str, str]]] = {}  # zone -> (minute, (date, time))
+
+    def zone(self, name: Optional[str]) -> ZoneInfo:
+        """ZoneInfo for the name; unknown or empty names are UTC"""
+        name = name or "UTC"
+        zone = self._zones.get(name)
+        if zone is None:
+            try:
+                zone = ZoneInfo(name)
+            except (ZoneInfoNotFoundError, ValueError):
+                logger.warning(f"Unknown timezone {name!r}, using UTC")
+                zone = ZoneInfo("UTC")
+            self._zones[name] = zone
+        return zone
+
+    def _offset_at(self, zone: ZoneInfo, timestamp: float) -> timedelta:
+        return datetime.fromtimestamp(timestamp, zone).utcoffset()
+
+    def _next_transition(self, zone: ZoneInfo, now: float) -> Optional[float]:
+        """First second after now with a different offset, if any within the horizon"""
+        current = self._offset_at(zone, now)
+        low = now
+        for high in range(int(now) + TRANSITION_SCAN_STEP, int(now) + TRANSITION_HORIZON, TRANSITION_SCAN_STEP):
+            if self._offset_at(zone, high) != current:
+                while high - low > 1:
+                    middle = (low + high) // 2
+                    if self._offset_at(zone, middle) == current:
+                        low = middle
+                    else:
+                        high = middle
+                return high
+            low = high
+        return None
+
+    def utc_offset(self, name: Optional[str], now: Optional[float] = None) -> timezone:
+        """Fixed-offset tzinfo valid at now; recomputed only after the zone's next transition"""
+        now = time.time() if now is None else now
+        key = name or "UTC"
+        cached = self._offsets.get(key)
+        if cached and now < cached[0]:
+            return cached[1]
+
+        zone = self.zone(name)
+        offset = timezone(self._offset_at(zone, now))
+        transition = self._next_transition(zone, now)
+        self._offsets[key] = (transition if transition is not None else now + NO_TRANSITION_RECHECK, offset)
+        return offset
+
+    def local_time(self, name: Optional[str], now: Optional[float] = None) -> datetime:
+        now = time.time() if now is None else now
+        return datetime.fromtimestamp(now, self.utc_offset(name, now))
+
+    def format_local(self, name: Optional[str], now: Optional[float] = None) -> Tuple[str, str]:
+        """("DD.MM.YYYY", "HH:MM") in the zone, formatted once per zone per minute"""
+        now = time.time() if now is None else now
+        minute = int(now // 60)
+        key = name or "UTC"
+        cached = self._formatted.get(key)
+        if cached and cached[0] == minute:
+            return cached[1]
+
+        local_time = self.local_time(name, now)
+        formatted = (local_time.strftime("%d.%m.%Y"), local_time.strftime("%H:%M"))
+        self._formatted[key] = (minute, formatted)
+        return formatted
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"zones": len(self._zones), "offsets": len(self._offsets)}
+
+
+# Global timezone service
+timezone_service = TimezoneService()
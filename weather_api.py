@@ -1,26 +1,215 @@
 import httpx
 import asyncio
-from typing import Dict, Optional, Tuple
+import hashlib
+import json
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 import logging
-from config import OPEN_METEO_URL, LOCATIONIQ_URL, WEATHER_API_URL, settings
+from config import (
+    OPEN_METEO_URL, LOCATIONIQ_URL, WEATHER_API_URL, CITY_CACHE_TTL, NEGATIVE_CITY_CACHE_SIZE,
+    NEGATIVE_CITY_CACHE_TTL, PROVIDER_TIMEOUT_MIN, WEATHER_SECTION_TTLS, settings
+)
+from city_index import city_index
+from city_names import latin_name, match_key, normalize_name
+from city_timezone_mapper import get_timezone_by_coordinates
+from timezone_service import timezone_service
 from database import DatabaseManager
+from disk_cache import DiskCache
+from offline_cities import offline_cities
+from forecast_batch import clothing_recommendations, feels_like, process_forecasts
+from http_clients import http_clients
+from memory_budget import PRIORITY_FORECASTS, estimate_size, memory_budget
+from deadlines import DeadlineExceeded, backoff_delay, current_deadline, provider_timeouts
+from rate_limiter import rate_limiters
+from quota_ledger import quota_ledger
 
 logger = logging.getLogger(__name__)
 
+# Entries past their TTL are kept this long so they can be served when upstream fails
+STALE_CACHE_WINDOW = timedelta(hours=2)
+
+# Forecast sections cached independently, and where each lives in an Open-Meteo response
+WEATHER_SECTIONS = ("current", "hourly", "daily")
+# Sections whose first entry is "today" at the location; they expire at local midnight whatever their TTL
+DATED_SECTIONS = ("hourly", "daily")
+OPEN_METEO_SECTION_FIELDS = {
+    "current": "current_weather",
+    "hourly": "hourly",
+    "daily": "daily"
+}
+HOURLY_VARIABLES = "temperature_2m,relative_humidity_2m,windspeed_10m,weathercode"
+DAILY_VARIABLES = "temperature_2m_max,temperature_2m_min,weathercode,precipitation_probability_max"
+
+# Shortest query (as a match key) that autocomplete answers
+SUGGEST_MIN_LENGTH = 2
+
+# WeatherAPI.com error code for "no matching location"; its other 400s are request errors
+WEATHER_API_NO_MATCH = 1006
+
+
+# Популярные города с координатами (последний резерв, если внешние API недоступны)
+BUILTIN_CITIES = {
+    # Украина
+    "киев": {"lat": 50.4501, "lon": 30.5234, "country": "Ukraine", "name": "Киев"},
+    "kiev": {"lat": 50.4501, "lon": 30.5234, "country": "Ukraine", "name": "Kiev"},
+    "kyiv": {"lat": 50.4501, "lon": 30.5234, "country": "Ukraine", "name": "Kyiv"},
+    "полтава": {"lat": 49.5937, "lon": 34.5407, "country": "Ukraine", "name": "Полтава"},
+    "poltava": {"lat": 49.5937, "lon": 34.5407, "country": "Ukraine", "name": "Poltava"},
+    "харьков": {"lat": 49.9935, "lon": 36.2304, "country": "Ukraine", "name": "Харьков"},
+    "kharkiv": {"lat": 49.9935, "lon": 36.2304, "country": "Ukraine", "name": "Kharkiv"},
+    "одесса": {"lat": 46.4825, "lon": 30.7233, "country": "Ukraine", "name": "Одесса"},
+    "odesa": {"lat": 46.4825, "lon": 30.7233, "country": "Ukraine", "name": "Odesa"},
+    "львов": {"lat": 49.8397, "lon": 24.0297, "country": "Ukraine", "name": "Львов"},
+    "lviv": {"lat": 49.8397, "lon": 24.0297, "country": "Ukraine", "name": "Lviv"},
+    "днепр": {"lat": 48.4647, "lon": 35.0462, "country": "Ukraine", "name": "Днепр"},
+    "dnipro": {"lat": 48.4647, "lon": 35.0462, "country": "Ukraine", "name": "Dnipro"},
+    
+    # Россия
+    "москва": {"lat": 55.7558, "lon": 37.6176, "country": "Russia", "name": "Москва"},
+    "moscow": {"lat": 55.7558, "lon": 37.6176, "country": "Russia", "name": "Moscow"},
+    "санкт-петербург": {"lat": 59.9311, "lon": 30.3609, "country": "Russia", "name": "Санкт-Петербург"},
+    "saint petersburg": {"lat": 59.9311, "lon": 30.3609, "country": "Russia", "name": "Saint Petersburg"},
+    "новосибирск": {"lat": 55.0084, "lon": 82.9357, "country": "Russia", "name": "Новосибирск"},
+    "novosibirsk": {"lat": 55.0084, "lon": 82.9357, "country": "Russia", "name": "Novosibirsk"},
+    
+    # Популярные мировые города
+    "london": {"lat": 51.5074, "lon": -0.1278, "country": "United Kingdom", "name": "London"},
+    "лондон": {"lat": 51.5074, "lon": -0.1278, "country": "United Kingdom", "name": "Лондон"},
+    "paris": {"lat": 48.8566, "lon": 2.3522, "country": "France", "name": "Paris"},
+    "париж": {"lat": 48.8566, "lon": 2.3522, "country": "France", "name": "Париж"},
+    "berlin": {"lat": 52.5200, "lon": 13.4050, "country": "Germany", "name": "Berlin"},
+    "берлин": {"lat": 52.5200, "lon": 13.4050, "country": "Germany", "name": "Берлин"},
+    "new york": {"lat": 40.7128, "lon": -74.0060, "country": "United States", "name": "New York"},
+    "нью-йорк": {"lat": 40.7128, "lon": -74.0060, "country": "United States", "name": "Нью-Йорк"},
+    "tokyo": {"lat": 35.6762, "lon": 139.6503, "country": "Japan", "name": "Tokyo"},
+    "токио": {"lat": 35.6762, "lon": 139.6503, "country": "Japan", "name": "Токио"},
+    "beijing": {"lat": 39.9042, "lon": 116.4074, "country": "China", "name": "Beijing"},
+    "пекин": {"lat": 39.9042, "lon": 116.4074, "country": "China", "name": "Пекин"},
+    "sydney": {"lat": -33.8688, "lon": 151.2093, "country": "Australia", "name": "Sydney"},
+    "сидней": {"lat": -33.8688, "lon": 151.2093, "country": "Australia", "name": "Сидней"},
+    "dubai": {"lat": 25.2048, "lon": 55.2708, "country": "United Arab Emirates", "name": "Dubai"},
+    "дубай": {"lat": 25.2048, "lon": 55.2708, "country": "United Arab Emirates", "name": "Дубай"},
+    "istanbul": {"lat": 41.0082, "lon": 28.9784, "country": "Turkey", "name": "Istanbul"},
+    "стамбул": {"lat": 41.0082, "lon": 28.9784, "country": "Turkey", "name": "Стамбул"},
+    "rome": {"lat": 41.9028, "lon": 12.4964, "country": "Italy", "name": "Rome"},
+    "рим": {"lat": 41.9028, "lon": 12.4964, "country": "Italy", "name": "Рим"},
+    "madrid": {"lat": 40.4168, "lon": -3.7038, "country": "Spain", "name": "Madrid"},
+    "мадрид": {"lat": 40.4168, "lon": -3.7038, "country": "Spain", "name": "Мадрид"},
+    "amsterdam": {"lat": 52.3676, "lon": 4.9041, "country": "Netherlands", "name": "Amsterdam"},
+    "амстердам": {"lat": 52.3676, "lon": 4.9041, "country": "Netherlands", "name": "Амстердам"},
+    "vienna": {"lat": 48.2082, "lon": 16.3738, "country": "Austria", "name": "Vienna"},
+    "вена": {"lat": 48.2082, "lon": 16.3738, "country": "Austria", "name": "Вена"},
+    "prague": {"lat": 50.0755, "lon": 14.4378, "country": "Czech Republic", "name": "Prague"},
+    "прага": {"lat": 50.0755, "lon": 14.4378, "country": "Czech Republic", "name": "Прага"},
+    "warsaw": {"lat": 52.2297, "lon": 21.0122, "country": "Poland", "name": "Warsaw"},
+    "варшава": {"lat": 52.2297, "lon": 21.0122, "country": "Poland", "name": "Варшава"},
+}
+
+
+def _builtin_city_keys() -> Dict[str, List[Dict]]:
+    """Match key -> builtin entries spelled that way in any script"""
+    keys = {}
+    for key, city in BUILTIN_CITIES.items():
+        keys.setdefault(match_key(key), []).append(city)
+    return keys
+
+
+BUILTIN_CITY_KEYS = _builtin_city_keys()
+
+# Each builtin spelling with its Latin form, for autocomplete prefixes such as "Ки" -> Киев
+BUILTIN_CITY_SPELLINGS = [(normalize_name(key), latin_name(key), city) for key, city in BUILTIN_CITIES.items()]
+
+
+class CacheStats:
+    """Hit/miss counters for one cache"""
+    
+    def __init__(self):
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stale_serves = 0
+        self.evictions = 0
+        self.negative_hits = 0
+    
+    def as_dict(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "stale_serves": self.stale_serves,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0
+        }
+
 
 class WeatherAPI:
     def __init__(self):
-        # Увеличиваем таймаут и добавляем retry логику
-        self.client = httpx.AsyncClient(
-            timeout=httpx.Timeout(30.0, connect=10.0),
-            limits=httpx.Limits(max_keepalive_connections=5, max_connections=10)
-        )
+        # Per-provider pooled clients, created in the app lifespan
+        self.clients = http_clients
+        # "<lat>_<lon>:<section>" -> (fetched_at, raw Open-Meteo section)
         self.cache = {}
-        self._last_locationiq_request = 0
+        
+        self.stats = {"weather": CacheStats(), "geocode": CacheStats()}
+        self.upstream_calls = {"open_meteo": 0, "weather_api": 0, "locationiq": 0}
+        self.upstream_errors = {"open_meteo": 0, "weather_api": 0, "locationiq": 0}
+        
+        # Interactive forecast requests per (lat, lon), decayed by the refresher
+        self.request_counts = Counter()
+        
+        # Section digests let an unchanged upstream body reuse the processed forecast
+        self._section_digests = {}
+        self._processed = {}  # cell -> {(language, days): (validator, weather_data)}
+        self._cell_zones = {}  # cell -> IANA zone, resolved once per cached location
+        self.section_fetches = Counter()
+        self.unchanged_sections = 0
+        self.race_cancellations = 0
+        
+        # (lat, lon, sections) -> refresh in flight; concurrent callers wait for it instead of
+        # sending the same upstream request
+        self._inflight_refreshes: Dict[Tuple[float, float, Tuple[str, ...]], asyncio.Task] = {}
+        self.coalesced_refreshes = 0
+        
+        # Normalised city queries that resolved to nothing -> [stored_at, hits], oldest first
+        self.negative_geocode = OrderedDict()
+        
+        # Optional on-disk copy of the caches so restarts start warm
+        self.disk_cache = None
+        if settings.persistent_cache_path:
+            self.disk_cache = DiskCache(settings.persistent_cache_path, max_age=CITY_CACHE_TTL)
+        
+        memory_budget.register("weather_cache", self._memory_size, self.evict_oldest, PRIORITY_FORECASTS)
         
     async def close(self):
-        await self.client.aclose()
+        if self.disk_cache:
+            await self.disk_cache.close()
+    
+    async def _request(self, provider: str, url: str, **kwargs) -> httpx.Response:
+        """GET from an upstream provider within its rate limit, with an adaptive timeout that fits the current deadline
+        
+        Responses the HTTP cache serves fresh never reach the provider, so they take no rate token,
+        are not counted against the quota and do not feed the adaptive timeout.
+        """
+        client = self.clients.get(provider)
+        timeout = provider_timeouts.timeout_for(provider)
+        request = client.build_request("GET", url, timeout=timeout, **kwargs)
+        if self.clients.serves_fresh(provider, request):
+            return await client.send(request)
+        
+        await rate_limiters.acquire(provider)
+        self.upstream_calls[provider] += 1
+        quota_ledger.record(provider)
+        started = time.monotonic()
+        try:
+            response = await client.send(request)
+        except httpx.TimeoutException:
+            provider_timeouts.record(provider, timeout)
+            raise
+        provider_timeouts.record(provider, time.monotonic() - started)
+        return response
     
     def _clean_cache(self):
         """Clean old cache entries to prevent memory leaks"""
@@ -32,15 +221,126 @@ class WeatherAPI:
         
         for key, (cached_time, _) in self.cache.items():
             # Remove entries older than 2 hours
-            if current_time - cached_time > timedelta(hours=2):
+            if current_time - cached_time > STALE_CACHE_WINDOW:
                 keys_to_remove.append(key)
         
-        for key in keys_to_remove:
-            del self.cache[key]
+        self._drop_cache_keys(keys_to_remove)
         
+        self.stats["weather"].evictions += len(keys_to_remove)
         if keys_to_remove:
             logger.debug(f"Cleaned {len(keys_to_remove)} old cache entries")
     
+    def _drop_cache_keys(self, keys: List[str]):
+        """Remove section entries and any processed forecasts built from them"""
+        for key in keys:
+            self.cache.pop(key, None)
+            self._section_digests.pop(key, None)
+            cell = key.rsplit(":", 1)[0]
+            self._processed.pop(cell, None)
+            self._cell_zones.pop(cell, None)
+    
+    def _memory_size(self) -> int:
+        return estimate_size(self.cache) + estimate_size(self._processed) + estimate_size(self._section_digests)
+    
+    def evict_oldest(self, bytes_to_free: int) -> int:
+        """Drop the oldest sections, and forecasts built from them, to release about bytes_to_free"""
+        if not self.cache:
+            return 0
+        
+        before = self._memory_size()
+        per_entry = max(1, before // len(self.cache))
+        oldest = sorted(self.cache, key=lambda key: self.cache[key][0])[:bytes_to_free // per_entry + 1]
+        self._drop_cache_keys(oldest)
+        self.stats["weather"].evictions += len(oldest)
+        return max(0, before - self._memory_size())
+    
+    async def get_cache_stats(self) -> Dict:
+        """Cache counters, sizes and upstream call counts for /metrics"""
+        cache_bytes = sum(
+            len(json.dumps(data, ensure_ascii=False).encode()) for _, data in self.cache.values()
+        )
+        return {
+            "weather": {
+                **self.stats["weather"].as_dict(),
+                "entries": len(self.cache),
+                "processed_entries": sum(len(variants) for variants in self._processed.values()),
+                "approx_bytes": cache_bytes,
+                "section_fetches": dict(self.section_fetches),
+                "coalesced_refreshes": self.coalesced_refreshes,
+                "unchanged_sections": self.unchanged_sections
+            },
+            "geocode": {
+                **self.stats["geocode"].as_dict(),
+                "negative_entries": len(self.negative_geocode),
+                "top_negative": self._top_negative_queries()
+            },
+            "disk_entries": await self.disk_cache.count() if self.disk_cache else None,
+            "upstream_calls": dict(self.upstream_calls),
+            "upstream_errors": dict(self.upstream_errors),
+            "city_search_race_cancellations": self.race_cancellations,
+            "upstream_latency": provider_timeouts.get_stats(),
+            "rate_limits": rate_limiters.get_stats(),
+            "city_index_entries": len(city_index),
+            "offline_cities": offline_cities.places if offline_cities.available else None,
+            "http_cache": self.clients.get_http_cache_stats(),
+            "cassettes": self.clients.get_cassette_stats()
+        }
+    
+    async def inspect_cache(self, key: str) -> Dict:
+        """Describe a cache entry by its namespaced key (weather:<lat>_<lon>:<section> or geo:<query>:<limit>)"""
+        result = {"key": key, "memory": None, "disk": None}
+        
+        if key.startswith("weather:") and key[len("weather:"):] in self.cache:
+            cached_time, cached_data = self.cache[key[len("weather:"):]]
+            age = (datetime.now() - cached_time).total_seconds()
+            section = key.rsplit(":", 1)[1]
+            result["memory"] = {
+                "cached_at": cached_time.isoformat(),
+                "age_seconds": round(age),
+                "ttl_remaining": round(WEATHER_SECTION_TTLS[section] - age),
+                "approx_bytes": len(json.dumps(cached_data, ensure_ascii=False).encode()),
+                "data": cached_data
+            }
+        
+        if self.disk_cache:
+            stored = await self.disk_cache.get(key, float("inf"))
+            if stored:
+                stored_at, value = stored
+                result["disk"] = {
+                    "cached_at": datetime.fromtimestamp(stored_at).isoformat(),
+                    "data": value
+                }
+        
+        return result
+    
+    async def flush_cache(self, prefix: str = "") -> Dict[str, int]:
+        """Drop memory and disk entries whose namespaced key starts with prefix"""
+        keys_to_remove = [key for key in self.cache if f"weather:{key}".startswith(prefix)]
+        self._drop_cache_keys(keys_to_remove)
+        
+        disk_removed = await self.disk_cache.delete_prefix(prefix) if self.disk_cache else 0
+        logger.info(f"Flushed cache prefix {prefix!r}: {len(keys_to_remove)} memory, {disk_removed} disk")
+        return {"memory_removed": len(keys_to_remove), "disk_removed": disk_removed}
+    
+    async def warm_cache(self, cities: List[str], language: str = "en", days: int = 1) -> List[Dict]:
+        """Resolve each city and pre-fetch its forecast"""
+        results = []
+        for city_name in cities:
+            coordinates = await self.get_city_coordinates(city_name)
+            if not coordinates:
+                results.append({"city": city_name, "status": "not_found"})
+                continue
+            
+            lat, lon, display_name = coordinates
+            weather_data = await self.get_weather_forecast(lat, lon, language, days)
+            results.append({
+                "city": city_name,
+                "display_name": display_name,
+                "key": f"weather:{lat}_{lon}",
+                "status": "ok" if weather_data else "error"
+            })
+        return results
+    
     async def get_city_coordinates(self, city_name: str) -> Optional[Tuple[float, float, str]]:
         """Get city coordinates using LocationIQ API with caching (single result)"""
         results = await self.search_cities(city_name, limit=1)
@@ -49,8 +349,58 @@ class WeatherAPI:
             return city["lat"], city["lon"], city["display_name"]
         return None
     
+    def _negative_hit(self, query: str) -> bool:
+        """Whether the query recently resolved to nothing; counts the hit"""
+        entry = self.negative_geocode.get(query)
+        if entry is None:
+            return False
+        if time.monotonic() - entry[0] >= NEGATIVE_CITY_CACHE_TTL:
+            del self.negative_geocode[query]
+            return False
+        entry[1] += 1
+        self.stats["geocode"].negative_hits += 1
+        return True
+    
+    def _remember_negative(self, query: str):
+        self.negative_geocode.pop(query, None)
+        self.negative_geocode[query] = [time.monotonic(), 0]
+        while len(self.negative_geocode) > NEGATIVE_CITY_CACHE_SIZE:
+            self.negative_geocode.popitem(last=False)
+    
+    def _top_negative_queries(self, limit: int = 10) -> Dict[str, int]:
+        """Most repeated unresolvable queries, to spot typos and bots"""
+        ranked = sorted(self.negative_geocode.items(), key=lambda item: item[1][1], reverse=True)
+        return {query: hits for query, (_, hits) in ranked[:limit] if hits}
+    
     async def search_cities(self, city_name: str, limit: int = 5) -> list:
-        """Search for multiple cities with the same name"""
+        """Search for multiple cities with the same name, remembering queries that match nothing"""
+        query = match_key(city_name)
+        if not query:
+            return []
+        if self._negative_hit(query):
+            logger.debug(f"Skipping city search for '{city_name}': no results recently")
+            return []
+        
+        results, authoritative = await self._search_cities_chain(city_name, limit)
+        # Only a miss every provider confirmed is cached; after a timeout, quota cut-off or
+        # failure the next attempt may succeed
+        if not results and authoritative:
+            self._remember_negative(query)
+        return results
+    
+    async def _search_cities_chain(self, city_name: str, limit: int) -> Tuple[list, bool]:
+        """Disk cache, DB cache, offline dataset, then the remote providers and builtin cities;
+        the flag is True only for a miss that every consulted provider answered as empty"""
+        # Same key as the negative cache, so spelling variants of one name share an entry
+        disk_key = f"geo:{match_key(city_name)}:{limit}"
+        if self.disk_cache:
+            stored = await self.disk_cache.get(disk_key, CITY_CACHE_TTL)
+            if stored:
+                logger.debug(f"Using disk-cached geocode results for '{city_name}'")
+                self.stats["geocode"].hits += 1
+                self.stats["geocode"].disk_hits += 1
+                return stored[1], False
+        
         try:
             # Check cache first for matches
             cached_cities = await DatabaseManager.get_cached_cities(city_name)
@@ -67,122 +417,222 @@ class WeatherAPI:
                 
                 # If we have enough cached results, return them
                 if len(cached_results) >= limit:
-                    return cached_results[:limit]
+                    self.stats["geocode"].hits += 1
+                    return cached_results[:limit], False
                 
                 # If we only need one result and have cached data, return it
                 if limit == 1 and cached_results:
-                    return cached_results[:1]
+                    self.stats["geocode"].hits += 1
+                    return cached_results[:1], False
             
-            # Try fallback city search first (faster and more reliable)
-            fallback_result = await self._search_cities_fallback(city_name)
-            if fallback_result:
-                return [fallback_result]
+            # The offline dataset answers most names without an upstream call
+            # Only an exact name ends the chain: a prefix match would swap a small town for a bigger city
+            offline_results = self._search_cities_offline(city_name, limit, exact_only=True)
+            if offline_results:
+                self.stats["geocode"].hits += 1
+                return offline_results, False
             
-            # Rate limiting для LocationIQ
-            current_time = asyncio.get_event_loop().time()
-            time_since_last = current_time - self._last_locationiq_request
-            if time_since_last < 1.0:
-                await asyncio.sleep(1.0 - time_since_last)
+            self.stats["geocode"].misses += 1
             
-            self._last_locationiq_request = asyncio.get_event_loop().time()
-            
-            # LocationIQ требует API ключ
-            if not settings.locationiq_api_key:
-                logger.warning("LocationIQ API key not set, using fallback")
-                return await self._search_cities_builtin(city_name, limit)
-            
-            params = {
-                "key": settings.locationiq_api_key,
-                "q": city_name,
-                "format": "json",
-                "limit": limit,
-                "addressdetails": 1,
-                "accept-language": "en,ru,uk"
-            }
-            
-            headers = {
-                "User-Agent": "WeatherBot/1.0 (https://github.com/PLTMisha/weather-bot)"
-            }
-            
-            # Добавляем retry логику
-            max_retries = 2
-            for attempt in range(max_retries):
-                try:
-                    response = await self.client.get(
-                        LOCATIONIQ_URL, 
-                        params=params, 
-                        headers=headers
-                    )
-                    response.raise_for_status()
-                    break
-                except (httpx.TimeoutException, httpx.ConnectError, httpx.HTTPStatusError) as e:
-                    if attempt == max_retries - 1:
-                        logger.error(f"LocationIQ API unavailable, using fallback: {e}")
-                        # Используем встроенную базу городов
-                        return await self._search_cities_builtin(city_name, limit)
-                    
-                    wait_time = 2
-                    logger.warning(f"Attempt {attempt + 1} failed, retrying in {wait_time}s: {e}")
-                    await asyncio.sleep(wait_time)
-            
-            data = response.json()
-            if not data:
-                logger.warning(f"No results found for city: {city_name}, trying fallback")
-                return await self._search_cities_builtin(city_name, limit)
-            
-            cities = []
-            for result in data:
-                try:
-                    lat = float(result["lat"])
-                    lon = float(result["lon"])
-                    display_name = result["display_name"]
-                    address = result.get("address", {})
-                    country = address.get("country", "")
-                    state = address.get("state", "")
-                    
-                    # Create a more readable display name
-                    city_display = result.get("name", city_name)
-                    location_parts = []
-                    
-                    if state and state != country:
-                        location_parts.append(state)
-                    if country:
-                        location_parts.append(country)
-                    
-                    readable_name = f"{city_display}"
-                    if location_parts:
-                        readable_name += f", {', '.join(location_parts)}"
-                    
-                    city_info = {
-                        "lat": lat,
-                        "lon": lon,
-                        "display_name": display_name,
-                        "readable_name": readable_name,
-                        "country": country,
-                        "state": state,
-                        "country_emoji": self._get_country_emoji(country)
-                    }
-                    
-                    cities.append(city_info)
-                    
-                    # Cache each city result
-                    try:
-                        await DatabaseManager.cache_city(city_name, lat, lon, country, display_name)
-                    except Exception as cache_error:
-                        # Log but don't fail if caching fails (might be duplicate)
-                        logger.debug(f"Cache error for {city_display}: {cache_error}")
-                        
-                except (ValueError, KeyError) as e:
-                    logger.warning(f"Error processing city result: {e}")
-                    continue
+            if settings.city_search_mode == "race":
+                cities, authoritative = await self._race_remote_city_search(city_name, limit)
+            else:
+                cities, authoritative = await self._search_remote_sequential(city_name, limit)
             
-            logger.info(f"Found {len(cities)} cities for '{city_name}'")
-            return cities
+            if not cities:
+                return await self._search_cities_builtin(city_name, limit), authoritative
+            if self.disk_cache:
+                await self.disk_cache.set(disk_key, cities)
+            return cities, False
             
         except Exception as e:
             logger.error(f"Error searching cities: {e}")
             # Fallback to built-in city database
-            return await self._search_cities_builtin(city_name, limit)
+            return await self._search_cities_builtin(city_name, limit), False
+    
+    @staticmethod
+    def _answered_empty(answers: Dict) -> bool:
+        """Whether every configured provider answered and found nothing; None means no answer"""
+        configured = [
+            provider for provider, key in (
+                ("weather_api", settings.weather_api_key),
+                ("locationiq", settings.locationiq_api_key)
+            ) if key
+        ]
+        return bool(configured) and all(
+            answers.get(provider) is not None and not answers[provider] for provider in configured
+        )
+    
+    async def _search_remote_sequential(self, city_name: str, limit: int) -> Tuple[list, bool]:
+        """WeatherAPI.com first (faster and more reliable), then LocationIQ"""
+        fallback_result = await self._search_cities_fallback(city_name)
+        if fallback_result:
+            return [fallback_result], False
+        cities = await self._search_cities_locationiq(city_name, limit)
+        if cities:
+            return cities, False
+        return [], self._answered_empty({"weather_api": fallback_result, "locationiq": cities})
+    
+    async def _race_remote_city_search(self, city_name: str, limit: int) -> Tuple[list, bool]:
+        """Query WeatherAPI.com and LocationIQ at once and return as soon as the merged results are
+        good enough or the race budget runs out; whatever is still in flight is cancelled.
+        A miss is authoritative only if both providers finished and answered empty"""
+        budget = settings.city_search_race_budget
+        active_deadline = current_deadline()
+        if active_deadline is not None:
+            budget = min(budget, active_deadline.remaining())
+        loop = asyncio.get_running_loop()
+        ends_at = loop.time() + budget
+        
+        tasks = {
+            asyncio.create_task(self._search_cities_fallback(city_name)): "weather_api",
+            # A single attempt: the race itself replaces the retry
+            asyncio.create_task(self._search_cities_locationiq(city_name, limit, max_retries=1)): "locationiq"
+        }
+        answers = {}
+        pending = set(tasks)
+        try:
+            while pending:
+                remaining = ends_at - loop.time()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if not task.cancelled() and task.exception() is None:
+                        answers[tasks[task]] = task.result()
+                merged = self._merge_city_results(answers, limit)
+                # LocationIQ is the richest source, so its answer ends the race
+                if len(merged) >= limit or (merged and "locationiq" in answers):
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                self.race_cancellations += len(pending)
+                logger.debug(f"City search race for '{city_name}' cancelled {[tasks[task] for task in pending]}")
+        
+        merged = self._merge_city_results(answers, limit)
+        # A provider cut off by the budget, cancelled or failed never answered, so the miss is not final
+        cut_off = bool(pending) or any(task.cancelled() or task.exception() is not None for task in tasks if task.done())
+        return merged, not merged and not cut_off and self._answered_empty(answers)
+    
+    @staticmethod
+    def _merge_city_results(answers: Dict, limit: int) -> list:
+        """LocationIQ results in their ranking order, then the WeatherAPI.com match unless it is the same place"""
+        merged = list(answers.get("locationiq") or [])
+        fallback_result = answers.get("weather_api")
+        if fallback_result and not any(
+            abs(city["lat"] - fallback_result["lat"]) < 0.1 and abs(city["lon"] - fallback_result["lon"]) < 0.1
+            for city in merged
+        ):
+            merged.append(fallback_result)
+        return merged[:limit]
+    
+    async def _search_cities_locationiq(self, city_name: str, limit: int, max_retries: int = 2) -> Optional[list]:
+        """Cities from LocationIQ, or None when it is not configured, over quota or unavailable"""
+        # LocationIQ требует API ключ
+        if not settings.locationiq_api_key:
+            logger.warning("LocationIQ API key not set, using fallback")
+            return None
+        
+        if quota_ledger.near_limit("locationiq"):
+            logger.warning("LocationIQ daily quota nearly spent, using builtin cities")
+            return None
+        
+        params = {
+            "key": settings.locationiq_api_key,
+            "q": city_name,
+            "format": "json",
+            "limit": limit,
+            "addressdetails": 1,
+            "accept-language": "en,ru,uk"
+        }
+        
+        headers = {
+            "User-Agent": "WeatherBot/1.0 (https://github.com/PLTMisha/weather-bot)"
+        }
+        
+        # Добавляем retry логику
+        for attempt in range(max_retries):
+            try:
+                response = await self._request(
+                    "locationiq",
+                    LOCATIONIQ_URL, 
+                    params=params, 
+                    headers=headers
+                )
+                response.raise_for_status()
+                break
+            except (httpx.TimeoutException, httpx.ConnectError, httpx.HTTPStatusError, DeadlineExceeded) as e:
+                wait_time = backoff_delay(attempt)
+                active_deadline = current_deadline()
+                # Only retry if the backoff plus a minimal call still fits the budget
+                out_of_budget = isinstance(e, DeadlineExceeded) or (
+                    active_deadline is not None
+                    and active_deadline.remaining() < wait_time + PROVIDER_TIMEOUT_MIN
+                )
+                if not isinstance(e, DeadlineExceeded):
+                    self.upstream_errors["locationiq"] += 1
+                
+                if attempt == max_retries - 1 or out_of_budget:
+                    logger.error(f"LocationIQ API unavailable, using fallback: {e}")
+                    return None
+                
+                logger.warning(f"Attempt {attempt + 1} failed, retrying in {wait_time:.2f}s: {e}")
+                await asyncio.sleep(wait_time)
+        
+        data = response.json()
+        if not data:
+            logger.warning(f"No results found for city: {city_name}, trying fallback")
+            return []
+        
+        cities = []
+        for result in data:
+            try:
+                lat = float(result["lat"])
+                lon = float(result["lon"])
+                display_name = result["display_name"]
+                address = result.get("address", {})
+                country = address.get("country", "")
+                state = address.get("state", "")
+                
+                # Create a more readable display name
+                city_display = result.get("name", city_name)
+                location_parts = []
+                
+                if state and state != country:
+                    location_parts.append(state)
+                if country:
+                    location_parts.append(country)
+                
+                readable_name = f"{city_display}"
+                if location_parts:
+                    readable_name += f", {', '.join(location_parts)}"
+                
+                city_info = {
+                    "lat": lat,
+                    "lon": lon,
+                    "display_name": display_name,
+                    "readable_name": readable_name,
+                    "country": country,
+                    "state": state,
+                    "country_emoji": self._get_country_emoji(country)
+                }
+                
+                cities.append(city_info)
+                    
+            except (ValueError, KeyError) as e:
+                logger.warning(f"Error processing city result: {e}")
+                continue
+        
+        # Cache all results of the search in one upsert
+        try:
+            await DatabaseManager.cache_cities(city_name, cities)
+        except Exception as cache_error:
+            logger.debug(f"Cache error for '{city_name}': {cache_error}")
+        
+        logger.info(f"Found {len(cities)} cities for '{city_name}'")
+        return cities
     
     def _get_weather_emoji(self, weather_code: int) -> str:
         """Get weather emoji based on weather code"""
@@ -455,172 +905,294 @@ class WeatherAPI:
         
         return country_emojis.get(country, "🌍")  # Default globe emoji
     
-    async def get_weather_forecast(self, latitude: float, longitude: float, 
-                                 language: str = "en", days: int = 1) -> Optional[Dict]:
-        """Get weather forecast using Open-Meteo API"""
-        try:
-            cache_key = f"{latitude}_{longitude}_{language}_{days}"
-            
-            # Check cache (30 minutes TTL)
-            if cache_key in self.cache:
-                cached_time, cached_data = self.cache[cache_key]
-                if datetime.now() - cached_time < timedelta(minutes=30):
-                    logger.debug(f"Using cached weather data for {cache_key}")
-                    return cached_data
-            
-            # Clean old cache entries to prevent memory leaks
-            self._clean_cache()
-            
-            params = {
-                "latitude": latitude,
-                "longitude": longitude,
-                "daily": "temperature_2m_max,temperature_2m_min,weathercode,precipitation_probability_max",
-                "hourly": "temperature_2m,relative_humidity_2m,windspeed_10m,weathercode",
-                "current_weather": True,
-                "timezone": "auto",
-                "forecast_days": min(days, 7)  # Max 7 days
-            }
-            
-            logger.debug(f"Fetching weather data for {latitude}, {longitude}")
-            response = await self.client.get(OPEN_METEO_URL, params=params)
-            response.raise_for_status()
-            
-            data = response.json()
-            logger.debug("Weather data received successfully")
-            
-            # Process and format the data
-            weather_data = self._process_weather_data(data, language, days)
-            
-            # Cache the result
-            self.cache[cache_key] = (datetime.now(), weather_data)
-            logger.debug(f"Weather data cached with key {cache_key}")
+    @staticmethod
+    def _digest(raw: Dict) -> str:
+        return hashlib.sha1(json.dumps(raw, sort_keys=True).encode()).hexdigest()
+    
+    def get_stale_sections(self, latitude: float, longitude: float, ahead: float = 0) -> List[str]:
+        """Sections of a cell that are missing, expire within `ahead` seconds or start on a past day"""
+        now = datetime.now()
+        cell = f"{latitude}_{longitude}"
+        stale = []
+        for section in WEATHER_SECTIONS:
+            entry = self.cache.get(f"{cell}:{section}")
+            if (
+                not entry
+                or (now - entry[0]).total_seconds() >= WEATHER_SECTION_TTLS[section] - ahead
+                or self._past_day(cell, section, entry[1])
+            ):
+                stale.append(section)
+        return stale
+    
+    def _cell_zone(self, cell: str) -> str:
+        """Timezone of a cached location, looked up once while its sections stay cached"""
+        zone = self._cell_zones.get(cell)
+        if zone is None:
+            latitude, longitude = map(float, cell.split("_"))
+            zone = self._cell_zones[cell] = get_timezone_by_coordinates(latitude, longitude)
+        return zone
+    
+    def _past_day(self, cell: str, section: str, raw: Dict) -> bool:
+        """Whether a dated section starts before the location's current local date, i.e. its
+        "today" is already yesterday"""
+        if section not in DATED_SECTIONS or not raw.get("time"):
+            return False
+        local_now = timezone_service.local_time(self._cell_zone(cell))
+        return raw["time"][0][:10] < local_now.strftime("%Y-%m-%d")
+    
+    async def _load_section(self, cell: str, section: str) -> Optional[Tuple[datetime, Dict]]:
+        """Section entry from memory, falling back to the on-disk copy after a restart"""
+        key = f"{cell}:{section}"
+        entry = self.cache.get(key)
+        if entry is None and self.disk_cache:
+            stored = await self.disk_cache.get(f"weather:{key}", STALE_CACHE_WINDOW.total_seconds())
+            if stored:
+                stored_at, raw = stored
+                entry = (datetime.fromtimestamp(stored_at), raw)
+                self.cache[key] = entry
+                self._section_digests[key] = self._digest(raw)
+                self.stats["weather"].disk_hits += 1
+        return entry
+    
+    async def refresh_sections(self, latitude: float, longitude: float, sections: List[str]) -> Dict[str, Dict]:
+        """Fetch only the given sections from Open-Meteo in one request and cache each separately;
+        concurrent refreshes of the same sections of a cell share one upstream call"""
+        key = (latitude, longitude, tuple(sections))
+        task = self._inflight_refreshes.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch_sections(latitude, longitude, sections))
+            self._inflight_refreshes[key] = task
+            task.add_done_callback(lambda done: self._finish_refresh(key, done))
+        else:
+            self.coalesced_refreshes += 1
+        # A waiter that gives up must not cancel the fetch for the others
+        return await asyncio.shield(task)
+    
+    def _finish_refresh(self, key: Tuple[float, float, Tuple[str, ...]], task: asyncio.Task):
+        self._inflight_refreshes.pop(key, None)
+        if not task.cancelled():
+            # Retrieved here so a failure nobody is left waiting for is not reported as unhandled
+            task.exception()
+    
+    async def _fetch_sections(self, latitude: float, longitude: float, sections: List[str]) -> Dict[str, Dict]:
+        params = {
+            "latitude": latitude,
+            "longitude": longitude,
+            "timezone": "auto",
+            # Daily data is always cached for the whole week so 1-day and 7-day views share it
+            "forecast_days": 7 if "daily" in sections else 1
+        }
+        if "current" in sections:
+            params["current_weather"] = True
+        if "hourly" in sections:
+            params["hourly"] = HOURLY_VARIABLES
+        if "daily" in sections:
+            params["daily"] = DAILY_VARIABLES
+        
+        logger.debug(f"Fetching {', '.join(sections)} weather data for {latitude}, {longitude}")
+        response = await self._request("open_meteo", OPEN_METEO_URL, params=params)
+        response.raise_for_status()
+        logger.debug(f"Weather data received ({response.headers.get('X-Cache', 'no http cache')})")
+        data = response.json()
+        
+        cell = f"{latitude}_{longitude}"
+        fetched_at = datetime.now()
+        fetched = {}
+        for section in sections:
+            raw = data.get(OPEN_METEO_SECTION_FIELDS[section], {})
+            if section == "hourly":
+                # Only today's 24 hours are ever shown
+                raw = {name: values[:24] for name, values in raw.items()}
             
-            return weather_data
+            key = f"{cell}:{section}"
+            digest = self._digest(raw)
+            if self._section_digests.get(key) == digest:
+                self.unchanged_sections += 1
+            self.cache[key] = (fetched_at, raw)
+            self._section_digests[key] = digest
+            self.section_fetches[section] += 1
+            fetched[section] = raw
             
-        except Exception as e:
-            logger.error(f"Error getting weather forecast: {e}", exc_info=True)
-            # Try fallback API if available
-            return await self._get_weather_fallback(latitude, longitude, language)
-    
-    def _process_weather_data(self, data: Dict, language: str, days: int = 1) -> Dict:
-        """Process raw weather data into user-friendly format"""
-        current = data.get("current_weather", {})
-        daily = data.get("daily", {})
-        hourly = data.get("hourly", {})
+            if self.disk_cache:
+                await self.disk_cache.set(f"weather:{key}", raw)
         
-        # Get current hour index
-        current_time = datetime.now()
-        current_hour_index = current_time.hour
+        return fetched
+    
+    def _get_processed(self, cell: str, raw: Dict[str, Dict], language: str, days: int) -> Dict:
+        """Processed forecast for the cached sections, reused while none of them changed within
+        the location's current local hour"""
+        return self._get_processed_many([(cell, raw, language, days)])[0]
+    
+    def _get_processed_many(self, entries: List[Tuple[str, Dict[str, Dict], str, int]]) -> List[Dict]:
+        """Memoised processed forecasts for many cells; the outdated ones are processed as one batch"""
+        now = time.time()
+        results = [None] * len(entries)
+        pending = []
+        for index, (cell, raw, language, days) in enumerate(entries):
+            # Current conditions are read from the hourly data at the location's own hour
+            local_now = timezone_service.local_time(self._cell_zone(cell), now)
+            validator = (
+                tuple(self._section_digests.get(f"{cell}:{section}") for section in WEATHER_SECTIONS),
+                local_now.strftime("%Y-%m-%d %H")
+            )
+            memo = self._processed.get(cell, {}).get((language, days))
+            if memo and memo[0] == validator:
+                results[index] = memo[1]
+            else:
+                pending.append((index, validator, local_now.hour))
         
-        # Weather code mapping
-        weather_codes = self._get_weather_codes(language)
+        if pending:
+            batch = []
+            for index, _, _ in pending:
+                _, raw, language, days = entries[index]
+                data = {
+                    OPEN_METEO_SECTION_FIELDS[section]: raw.get(section, {})
+                    for section in WEATHER_SECTIONS
+                }
+                batch.append((data, language, days))
+            
+            hours = [hour for _, _, hour in pending]
+            for (index, validator, _), weather_data in zip(pending, self._process_batch(batch, hours)):
+                cell, _, language, days = entries[index]
+                self._processed.setdefault(cell, {})[(language, days)] = (validator, weather_data)
+                results[index] = weather_data
         
-        current_weather_code = current.get("weathercode", 0)
-        current_description = weather_codes.get(current_weather_code, "Unknown")
+        return results
+    
+    async def _collect_sections(self, cell: str, sections: Tuple[str, ...],
+                                force_refresh: bool = False) -> Tuple[Dict[str, Dict], List[str]]:
+        """Usable cached sections of a cell and the ones that still have to be fetched"""
+        now = datetime.now()
+        raw = {}
+        to_fetch = []
+        for section in WEATHER_SECTIONS:
+            required = section in sections
+            entry = await self._load_section(cell, section)
+            if entry and not (required and force_refresh):
+                age = (now - entry[0]).total_seconds()
+                max_age = WEATHER_SECTION_TTLS[section] if required else STALE_CACHE_WINDOW.total_seconds()
+                if age < max_age and not self._past_day(cell, section, entry[1]):
+                    raw[section] = entry[1]
+                    continue
+            to_fetch.append(section)
+        return raw, to_fetch
+    
+    async def get_weather_forecasts(self, requests: List[Tuple[float, float, str, int]]) -> Dict[Tuple[float, float, str, int], Optional[Dict]]:
+        """Forecasts for many (lat, lon, language, days) requests, post-processed as one batch
         
-        # Get today's data
-        today_max = daily.get("temperature_2m_max", [0])[0] if daily.get("temperature_2m_max") else current.get("temperature", 0)
-        today_min = daily.get("temperature_2m_min", [0])[0] if daily.get("temperature_2m_min") else current.get("temperature", 0)
-        rain_probability = daily.get("precipitation_probability_max", [0])[0] if daily.get("precipitation_probability_max") else 0
+        Cells that cannot be refreshed go through get_weather_forecast for its stale/fallback handling.
+        """
+        requests = list(dict.fromkeys(requests))
+        cells = list(dict.fromkeys((lat, lon) for lat, lon, _, _ in requests))
         
-        # Get current hour data if available
-        humidity = 50  # default
-        wind_speed = current.get("windspeed", 0)
+        async def load(latitude: float, longitude: float) -> Optional[Dict[str, Dict]]:
+            try:
+                raw, to_fetch = await self._collect_sections(f"{latitude}_{longitude}", WEATHER_SECTIONS)
+                if to_fetch and quota_ledger.near_limit("open_meteo"):
+                    # get_weather_forecast picks the cheaper path for these
+                    return None
+                if to_fetch:
+                    self.stats["weather"].misses += 1
+                    raw.update(await self.refresh_sections(latitude, longitude, to_fetch))
+                else:
+                    self.stats["weather"].hits += 1
+                return raw
+            except Exception as e:
+                logger.warning(f"Batch forecast load failed for {latitude}, {longitude}: {e}")
+                return None
         
-        if hourly.get("relative_humidity_2m") and len(hourly["relative_humidity_2m"]) > current_hour_index:
-            humidity = hourly["relative_humidity_2m"][current_hour_index]
+        self._clean_cache()
+        loaded = dict(zip(cells, await asyncio.gather(*(load(lat, lon) for lat, lon in cells))))
         
-        if hourly.get("windspeed_10m") and len(hourly["windspeed_10m"]) > current_hour_index:
-            wind_speed = hourly["windspeed_10m"][current_hour_index]
+        ready = [request for request in requests if loaded[request[:2]] is not None]
+        processed = self._get_processed_many([
+            (f"{lat}_{lon}", loaded[(lat, lon)], language, days)
+            for lat, lon, language, days in ready
+        ])
+        results = dict(zip(ready, processed))
         
-        # Calculate feels like temperature (simple approximation)
-        current_temp = current.get("temperature", 0)
-        feels_like = self._calculate_feels_like(current_temp, humidity, wind_speed)
+        for request in requests:
+            if request not in results:
+                results[request] = await self.get_weather_forecast(*request)
+        return results
+    
+    async def get_weather_forecast(self, latitude: float, longitude: float, 
+                                 language: str = "en", days: int = 1,
+                                 force_refresh: bool = False,
+                                 sections: Tuple[str, ...] = WEATHER_SECTIONS) -> Optional[Dict]:
+        """Get weather forecast using Open-Meteo API
         
-        # Process hourly data for today
-        hourly_forecast = []
-        if hourly.get("time") and hourly.get("temperature_2m"):
-            times = hourly["time"]
-            temperatures = hourly["temperature_2m"]
-            weather_codes_hourly = hourly.get("weathercode", [])
+        Only the sections listed in `sections` have to be within their own TTL;
+        the others are reused from cache while it still holds them.
+        """
+        cell = f"{latitude}_{longitude}"
+        now = datetime.now()
+        try:
+            if not force_refresh:
+                self.request_counts[(latitude, longitude)] += 1
             
-            for i, time_str in enumerate(times[:24]):  # Today's 24 hours
-                if i < len(temperatures):
-                    hour_time = datetime.fromisoformat(time_str.replace('Z', '+00:00'))
-                    weather_code = weather_codes_hourly[i] if i < len(weather_codes_hourly) else 0
-                    description = weather_codes.get(weather_code, "Unknown")
-                    
-                    hourly_forecast.append({
-                        "time": hour_time.strftime("%H:%M"),
-                        "temperature": round(temperatures[i]),
-                        "description": description,
-                        "weather_code": weather_code
-                    })
-        
-        # Process daily data for multiple days
-        daily_forecast = []
-        if daily.get("time") and daily.get("temperature_2m_max"):
-            times = daily["time"]
-            max_temps = daily["temperature_2m_max"]
-            min_temps = daily.get("temperature_2m_min", [])
-            weather_codes_daily = daily.get("weathercode", [])
-            rain_probs = daily.get("precipitation_probability_max", [])
+            raw, to_fetch = await self._collect_sections(cell, sections, force_refresh)
             
-            for i, date_str in enumerate(times[:days]):
-                if i < len(max_temps):
-                    date_obj = datetime.fromisoformat(date_str)
-                    weather_code = weather_codes_daily[i] if i < len(weather_codes_daily) else 0
-                    description = weather_codes.get(weather_code, "Unknown")
-                    
-                    daily_forecast.append({
-                        "date": date_obj.strftime("%Y-%m-%d"),
-                        "date_display": date_obj.strftime("%d.%m"),
-                        "day_name": self._get_day_name(date_obj, language),
-                        "max_temperature": round(max_temps[i]),
-                        "min_temperature": round(min_temps[i]) if i < len(min_temps) else round(max_temps[i]),
-                        "description": description,
-                        "rain_probability": round(rain_probs[i]) if i < len(rain_probs) else 0,
-                        "weather_code": weather_code
-                    })
-        
-        return {
-            "current_temperature": round(current_temp),
-            "feels_like": round(feels_like),
-            "min_temperature": round(today_min),
-            "max_temperature": round(today_max),
-            "description": current_description,
-            "humidity": round(humidity),
-            "wind_speed": round(wind_speed),
-            "rain_probability": round(rain_probability),
-            "weather_code": current_weather_code,
-            "hourly_forecast": hourly_forecast,
-            "daily_forecast": daily_forecast
-        }
+            if to_fetch:
+                self.stats["weather"].misses += 1
+                
+                # Near the Open-Meteo daily quota: expired cache, then the alternate provider
+                if quota_ledger.near_limit("open_meteo"):
+                    degraded = self._stale_forecast(cell, language, days, now)
+                    if degraded is None and not quota_ledger.near_limit("weather_api"):
+                        degraded = await self._get_weather_fallback(latitude, longitude, language)
+                    if degraded is not None:
+                        logger.info(f"Open-Meteo quota nearly spent, served {cell} without it")
+                        return degraded
+                
+                # Clean old cache entries to prevent memory leaks
+                self._clean_cache()
+                raw.update(await self.refresh_sections(latitude, longitude, to_fetch))
+            else:
+                logger.debug(f"Using cached weather data for {cell}")
+                self.stats["weather"].hits += 1
+            
+            return self._get_processed(cell, raw, language, days)
+            
+        except Exception as e:
+            logger.error(f"Error getting weather forecast: {e}", exc_info=True)
+            self.upstream_errors["open_meteo"] += 1
+            
+            # An expired full forecast beats the reduced fallback payload
+            stale = self._stale_forecast(cell, language, days, now)
+            if stale is not None:
+                return stale
+            
+            # Try fallback API if available
+            return await self._get_weather_fallback(latitude, longitude, language)
     
-    def _get_day_name(self, date_obj: datetime, language: str) -> str:
-        """Get day name in specified language"""
-        if language == "ru":
-            days = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
-        elif language == "uk":
-            days = ["Понеділок", "Вівторок", "Середа", "Четвер", "П'ятниця", "Субота", "Неділя"]
-        else:
-            days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+    def _stale_forecast(self, cell: str, language: str, days: int, now: datetime) -> Optional[Dict]:
+        """Forecast from expired sections, if every section is still within the stale window"""
+        stale = {}
+        for section in WEATHER_SECTIONS:
+            entry = self.cache.get(f"{cell}:{section}")
+            if entry and now - entry[0] < STALE_CACHE_WINDOW and not self._past_day(cell, section, entry[1]):
+                stale[section] = entry[1]
+        if len(stale) < len(WEATHER_SECTIONS):
+            return None
         
-        return days[date_obj.weekday()]
+        logger.warning(f"Serving stale weather data for {cell}")
+        self.stats["weather"].stale_serves += 1
+        return self._get_processed(cell, stale, language, days)
+    
+    def _process_weather_data(self, data: Dict, language: str, days: int = 1) -> Dict:
+        """Process raw weather data into user-friendly format"""
+        return self._process_batch([(data, language, days)])[0]
+    
+    def _process_batch(self, items: List[Tuple[Dict, str, int]], hours: Optional[List[int]] = None) -> List[Dict]:
+        """Process many raw forecasts in one vectorised pass; hours are each item's local hour"""
+        languages = {language for _, language, _ in items}
+        weather_codes = {language: self._get_weather_codes(language) for language in languages}
+        return process_forecasts(items, weather_codes, hours=hours)
     
     def _calculate_feels_like(self, temp: float, humidity: float, wind_speed: float) -> float:
         """Simple feels-like temperature calculation"""
-        # Heat index for warm weather
-        if temp >= 27:
-            heat_index = temp + 0.5 * (humidity - 50) / 10
-            return heat_index
-        
-        # Wind chill for cold weather
-        if temp <= 10 and wind_speed > 5:
-            wind_chill = temp - (wind_speed * 0.5)
-            return wind_chill
-        
-        return temp
+        return float(feels_like(temp, humidity, wind_speed))
     
     def _get_weather_codes(self, language: str) -> Dict[int, str]:
         """Get weather code descriptions in specified language"""
@@ -721,7 +1293,7 @@ class WeatherAPI:
     async def _get_weather_fallback(self, latitude: float, longitude: float, 
                                   language: str) -> Optional[Dict]:
         """Fallback weather API (WeatherAPI.com)"""
-        if not settings.weather_api_key:
+        if not settings.weather_api_key or quota_ledger.exhausted("weather_api"):
             return None
             
         try:
@@ -733,7 +1305,7 @@ class WeatherAPI:
                 "alerts": "no"
             }
             
-            response = await self.client.get(f"{WEATHER_API_URL}/forecast.json", params=params)
+            response = await self._request("weather_api", f"{WEATHER_API_URL}/forecast.json", params=params)
             response.raise_for_status()
             
             data = response.json()
@@ -757,11 +1329,68 @@ class WeatherAPI:
             
         except Exception as e:
             logger.error(f"Fallback weather API error: {e}")
+            self.upstream_errors["weather_api"] += 1
             return None
     
+    def suggest_cities(self, query: str, limit: int = 10) -> list:
+        """Autocomplete from local data only (builtin cities, offline dataset, city cache index);
+        never calls a provider, so it is cheap enough to run on every keystroke"""
+        normalized, latin = normalize_name(query), latin_name(query)
+        if len(latin) < SUGGEST_MIN_LENGTH:
+            return []
+        
+        results = []
+        
+        def add(city):
+            # The same city from different sources differs slightly in coordinates
+            if not any(abs(city["lat"] - result["lat"]) < 0.1 and abs(city["lon"] - result["lon"]) < 0.1 for result in results):
+                results.append(city)
+        
+        # Spellings in the query's own script first, then transliterated ones
+        for spelling, _, city in BUILTIN_CITY_SPELLINGS:
+            if spelling.startswith(normalized):
+                add(self._builtin_city_result(city))
+        for _, spelling, city in BUILTIN_CITY_SPELLINGS:
+            if spelling.startswith(latin):
+                add(self._builtin_city_result(city))
+        for city in self._search_cities_offline(query, limit):
+            add(city)
+        for row in city_index.search(query, limit):
+            add({
+                "lat": float(row.latitude),
+                "lon": float(row.longitude),
+                "display_name": row.display_name,
+                "readable_name": row.display_name,
+                "country": row.country,
+                "state": "",
+                "country_emoji": self._get_country_emoji(row.country)
+            })
+        return results[:limit]
+    
+    def _search_cities_offline(self, city_name: str, limit: int, exact_only: bool = False) -> list:
+        """Cities from the memory-mapped GeoNames extract; prefix matches too unless exact_only"""
+        places = offline_cities.search(city_name, limit, exact_only)
+        if not places and match_key(city_name) != normalize_name(city_name):
+            # Spellings the dataset lacks, such as "Киев" or "Kharkov", via their canonical key
+            places = offline_cities.search(match_key(city_name), limit, exact_only)
+        results = []
+        for place in places:
+            display_name = f"{place.name}, {place.country}"
+            results.append({
+                "lat": place.latitude,
+                "lon": place.longitude,
+                "display_name": display_name,
+                "readable_name": display_name,
+                "country": place.country,
+                "state": "",
+                "country_emoji": self._get_country_emoji(place.country)
+            })
+        return results
+    
     async def _search_cities_fallback(self, city_name: str) -> Optional[Dict]:
-        """Fallback city search using WeatherAPI.com"""
-        if not settings.weather_api_key:
+        """Fallback city search using WeatherAPI.com; None when it did not answer,
+        an empty dict when it answered with no match"""
+        if not settings.weather_api_key or quota_ledger.near_limit("weather_api"):
             return None
             
         try:
@@ -771,7 +1400,11 @@ class WeatherAPI:
                 "aqi": "no"
             }
             
-            response = await self.client.get(f"{WEATHER_API_URL}/current.json", params=params)
+            response = await self._request("weather_api", f"{WEATHER_API_URL}/current.json", params=params)
+            # Only error code 1006 means no location matched; a bad key, quota or
+            # malformed request is a provider failure and must not be cached as a miss
+            if response.status_code == 400 and self._weather_api_error_code(response) == WEATHER_API_NO_MATCH:
+                return {}
             response.raise_for_status()
             
             data = response.json()
@@ -787,99 +1420,58 @@ class WeatherAPI:
                     "state": location.get("region", ""),
                     "country_emoji": self._get_country_emoji(location.get("country", ""))
                 }
+            return {}
         except Exception as e:
             logger.debug(f"WeatherAPI fallback failed: {e}")
+            self.upstream_errors["weather_api"] += 1
             return None
     
-    async def _search_cities_builtin(self, city_name: str, limit: int = 5) -> list:
-        """Built-in city database as last resort"""
-        # Популярные города с координатами
-        builtin_cities = {
-            # Украина
-            "киев": {"lat": 50.4501, "lon": 30.5234, "country": "Ukraine", "name": "Киев"},
-            "kiev": {"lat": 50.4501, "lon": 30.5234, "country": "Ukraine", "name": "Kiev"},
-            "kyiv": {"lat": 50.4501, "lon": 30.5234, "country": "Ukraine", "name": "Kyiv"},
-            "полтава": {"lat": 49.5937, "lon": 34.5407, "country": "Ukraine", "name": "Полтава"},
-            "poltava": {"lat": 49.5937, "lon": 34.5407, "country": "Ukraine", "name": "Poltava"},
-            "харьков": {"lat": 49.9935, "lon": 36.2304, "country": "Ukraine", "name": "Харьков"},
-            "kharkiv": {"lat": 49.9935, "lon": 36.2304, "country": "Ukraine", "name": "Kharkiv"},
-            "одесса": {"lat": 46.4825, "lon": 30.7233, "country": "Ukraine", "name": "Одесса"},
-            "odesa": {"lat": 46.4825, "lon": 30.7233, "country": "Ukraine", "name": "Odesa"},
-            "львов": {"lat": 49.8397, "lon": 24.0297, "country": "Ukraine", "name": "Львов"},
-            "lviv": {"lat": 49.8397, "lon": 24.0297, "country": "Ukraine", "name": "Lviv"},
-            "днепр": {"lat": 48.4647, "lon": 35.0462, "country": "Ukraine", "name": "Днепр"},
-            "dnipro": {"lat": 48.4647, "lon": 35.0462, "country": "Ukraine", "name": "Dnipro"},
-            
-            # Россия
-            "москва": {"lat": 55.7558, "lon": 37.6176, "country": "Russia", "name": "Москва"},
-            "moscow": {"lat": 55.7558, "lon": 37.6176, "country": "Russia", "name": "Moscow"},
-            "санкт-петербург": {"lat": 59.9311, "lon": 30.3609, "country": "Russia", "name": "Санкт-Петербург"},
-            "saint petersburg": {"lat": 59.9311, "lon": 30.3609, "country": "Russia", "name": "Saint Petersburg"},
-            "новосибирск": {"lat": 55.0084, "lon": 82.9357, "country": "Russia", "name": "Новосибирск"},
-            "novosibirsk": {"lat": 55.0084, "lon": 82.9357, "country": "Russia", "name": "Novosibirsk"},
-            
-            # Популярные мировые города
-            "london": {"lat": 51.5074, "lon": -0.1278, "country": "United Kingdom", "name": "London"},
-            "лондон": {"lat": 51.5074, "lon": -0.1278, "country": "United Kingdom", "name": "Лондон"},
-            "paris": {"lat": 48.8566, "lon": 2.3522, "country": "France", "name": "Paris"},
-            "париж": {"lat": 48.8566, "lon": 2.3522, "country": "France", "name": "Париж"},
-            "berlin": {"lat": 52.5200, "lon": 13.4050, "country": "Germany", "name": "Berlin"},
-            "берлин": {"lat": 52.5200, "lon": 13.4050, "country": "Germany", "name": "Берлин"},
-            "new york": {"lat": 40.7128, "lon": -74.0060, "country": "United States", "name": "New York"},
-            "нью-йорк": {"lat": 40.7128, "lon": -74.0060, "country": "United States", "name": "Нью-Йорк"},
-            "tokyo": {"lat": 35.6762, "lon": 139.6503, "country": "Japan", "name": "Tokyo"},
-            "токио": {"lat": 35.6762, "lon": 139.6503, "country": "Japan", "name": "Токио"},
-            "beijing": {"lat": 39.9042, "lon": 116.4074, "country": "China", "name": "Beijing"},
-            "пекин": {"lat": 39.9042, "lon": 116.4074, "country": "China", "name": "Пекин"},
-            "sydney": {"lat": -33.8688, "lon": 151.2093, "country": "Australia", "name": "Sydney"},
-            "сидней": {"lat": -33.8688, "lon": 151.2093, "country": "Australia", "name": "Сидней"},
-            "dubai": {"lat": 25.2048, "lon": 55.2708, "country": "United Arab Emirates", "name": "Dubai"},
-            "дубай": {"lat": 25.2048, "lon": 55.2708, "country": "United Arab Emirates", "name": "Дубай"},
-            "istanbul": {"lat": 41.0082, "lon": 28.9784, "country": "Turkey", "name": "Istanbul"},
-            "стамбул": {"lat": 41.0082, "lon": 28.9784, "country": "Turkey", "name": "Стамбул"},
-            "rome": {"lat": 41.9028, "lon": 12.4964, "country": "Italy", "name": "Rome"},
-            "рим": {"lat": 41.9028, "lon": 12.4964, "country": "Italy", "name": "Рим"},
-            "madrid": {"lat": 40.4168, "lon": -3.7038, "country": "Spain", "name": "Madrid"},
-            "мадрид": {"lat": 40.4168, "lon": -3.7038, "country": "Spain", "name": "Мадрид"},
-            "amsterdam": {"lat": 52.3676, "lon": 4.9041, "country": "Netherlands", "name": "Amsterdam"},
-            "амстердам": {"lat": 52.3676, "lon": 4.9041, "country": "Netherlands", "name": "Амстердам"},
-            "vienna": {"lat": 48.2082, "lon": 16.3738, "country": "Austria", "name": "Vienna"},
-            "вена": {"lat": 48.2082, "lon": 16.3738, "country": "Austria", "name": "Вена"},
-            "prague": {"lat": 50.0755, "lon": 14.4378, "country": "Czech Republic", "name": "Prague"},
-            "прага": {"lat": 50.0755, "lon": 14.4378, "country": "Czech Republic", "name": "Прага"},
-            "warsaw": {"lat": 52.2297, "lon": 21.0122, "country": "Poland", "name": "Warsaw"},
-            "варшава": {"lat": 52.2297, "lon": 21.0122, "country": "Poland", "name": "Варшава"},
+    @staticmethod
+    def _weather_api_error_code(response: httpx.Response) -> Optional[int]:
+        """Error code from a WeatherAPI.com error body ({"error": {"code": ..., "message": ...}})"""
+        try:
+            return response.json().get("error", {}).get("code")
+        except (ValueError, AttributeError):
+            return None
+    
+    def _builtin_city_result(self, city_data: Dict) -> Dict:
+        return {
+            "lat": city_data["lat"],
+            "lon": city_data["lon"],
+            "display_name": f"{city_data['name']}, {city_data['country']}",
+            "readable_name": f"{city_data['name']}, {city_data['country']}",
+            "country": city_data["country"],
+            "state": "",
+            "country_emoji": self._get_country_emoji(city_data["country"])
         }
-        
+    
+    @staticmethod
+    def _same_script(cities: List[Dict], query: str) -> Dict:
+        """The spelling in the query's script: "Kharkov" shows Kharkiv, "Харків" shows Харьков"""
+        return next((city for city in cities if city["name"].isascii() == query.isascii()), cities[0])
+    
+    async def _search_cities_builtin(self, city_name: str, limit: int = 5) -> list:
+        """Built-in city database as last resort, matched on the spelling-independent key"""
         city_lower = city_name.lower().strip()
+        city_key = match_key(city_name)
         results = []
         
-        # Точное совпадение
-        if city_lower in builtin_cities:
-            city_data = builtin_cities[city_lower]
-            results.append({
-                "lat": city_data["lat"],
-                "lon": city_data["lon"],
-                "display_name": f"{city_data['name']}, {city_data['country']}",
-                "readable_name": f"{city_data['name']}, {city_data['country']}",
-                "country": city_data["country"],
-                "state": "",
-                "country_emoji": self._get_country_emoji(city_data["country"])
-            })
+        def add(city_data):
+            if any(result["lat"] == city_data["lat"] and result["lon"] == city_data["lon"] for result in results):
+                return
+            results.append(self._builtin_city_result(city_data))
+        
+        # Точное совпадение: сначала в написании пользователя, затем в любом другом
+        if city_lower in BUILTIN_CITIES:
+            add(BUILTIN_CITIES[city_lower])
+        elif city_key in BUILTIN_CITY_KEYS:
+            add(self._same_script(BUILTIN_CITY_KEYS[city_key], city_lower))
         
         # Частичное совпадение
-        if not results:
-            for key, city_data in builtin_cities.items():
-                if city_lower in key or key in city_lower:
-                    results.append({
-                        "lat": city_data["lat"],
-                        "lon": city_data["lon"],
-                        "display_name": f"{city_data['name']}, {city_data['country']}",
-                        "readable_name": f"{city_data['name']}, {city_data['country']}",
-                        "country": city_data["country"],
-                        "state": "",
-                        "country_emoji": self._get_country_emoji(city_data["country"])
-                    })
+        if not results and city_key:
+            for key, cities in BUILTIN_CITY_KEYS.items():
+                if city_key in key or key in city_key:
+                    add(self._same_script(cities, city_lower))
                     if len(results) >= limit:
                         break
         
@@ -887,14 +1479,7 @@ class WeatherAPI:
             logger.info(f"Found {len(results)} cities in built-in database for '{city_name}'")
             # Кэшируем результат
             try:
-                city_data = results[0]
-                await DatabaseManager.cache_city(
-                    city_name, 
-                    city_data["lat"], 
-                    city_data["lon"], 
-                    city_data["country"], 
-                    city_data["display_name"]
-                )
+                await DatabaseManager.cache_cities(city_name, results[:1])
             except Exception as e:
                 logger.debug(f"Cache error: {e}")
         
@@ -902,81 +1487,7 @@ class WeatherAPI:
     
     def get_clothing_recommendation(self, weather_data: Dict, language: str) -> str:
         """Get clothing recommendation based on weather"""
-        temp = weather_data.get("current_temperature", 0)
-        rain_prob = weather_data.get("rain_probability", 0)
-        wind_speed = weather_data.get("wind_speed", 0)
-        
-        if language == "ru":
-            recommendations = []
-            
-            if temp < -10:
-                recommendations.append("Теплая зимняя куртка, шапка, перчатки")
-            elif temp < 0:
-                recommendations.append("Зимняя куртка, шапка")
-            elif temp < 10:
-                recommendations.append("Теплая куртка или пальто")
-            elif temp < 20:
-                recommendations.append("Легкая куртка или свитер")
-            elif temp < 25:
-                recommendations.append("Легкая одежда, возможно кофта")
-            else:
-                recommendations.append("Легкая летняя одежда")
-            
-            if rain_prob > 50:
-                recommendations.append("зонт или дождевик")
-            
-            if wind_speed > 10:
-                recommendations.append("защита от ветра")
-            
-            return ", ".join(recommendations).capitalize()
-        
-        elif language == "uk":
-            recommendations = []
-            
-            if temp < -10:
-                recommendations.append("Тепла зимова куртка, шапка, рукавички")
-            elif temp < 0:
-                recommendations.append("Зимова куртка, шапка")
-            elif temp < 10:
-                recommendations.append("Тепла куртка або пальто")
-            elif temp < 20:
-                recommendations.append("Легка куртка або светр")
-            elif temp < 25:
-                recommendations.append("Легкий одяг, можливо кофта")
-            else:
-                recommendations.append("Легкий літній одяг")
-            
-            if rain_prob > 50:
-                recommendations.append("парасолька або дощовик")
-            
-            if wind_speed > 10:
-                recommendations.append("захист від вітру")
-            
-            return ", ".join(recommendations).capitalize()
-        
-        else:  # English
-            recommendations = []
-            
-            if temp < -10:
-                recommendations.append("Heavy winter coat, hat, gloves")
-            elif temp < 0:
-                recommendations.append("Winter coat, hat")
-            elif temp < 10:
-                recommendations.append("Warm jacket or coat")
-            elif temp < 20:
-                recommendations.append("Light jacket or sweater")
-            elif temp < 25:
-                recommendations.append("Light clothing, maybe a cardigan")
-            else:
-                recommendations.append("Light summer clothing")
-            
-            if rain_prob > 50:
-                recommendations.append("umbrella or raincoat")
-            
-            if wind_speed > 10:
-                recommendations.append("wind protection")
-            
-            return ", ".join(recommendations).capitalize()
+        return clothing_recommendations([weather_data], [language])[0]
 
 
 # Global weather API instance